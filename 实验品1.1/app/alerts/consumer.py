@@ -1,69 +1,217 @@
-import json
+import argparse
+import asyncio
 import logging
-from ..queue.rabbitmq import RabbitMQ
+import multiprocessing
+import os
+import signal
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Optional
+from prometheus_client import start_http_server
+from ..queue.async_rabbitmq import AsyncRabbitMQ
+from .digest import ALERT_RECIPIENTS, AlertDigest
 from .handlers import AlertHandler
+from .webhooks import WEBHOOK_DEAD_LETTER_QUEUE, WebhookDelivery
 
 logger = logging.getLogger(__name__)
 
+# 每个队列同时处理的最大消息数（QoS 预取数）
+ALERT_PREFETCH = int(os.getenv("ALERT_PREFETCH", "16"))
+# 执行邮件、Webhook 等阻塞调用的线程数
+ALERT_WORKERS = int(os.getenv("ALERT_WORKERS", "16"))
+# 消费进程数，多个进程以竞争消费者方式分摊同一批队列
+ALERT_CONSUMER_PROCESSES = int(os.getenv("ALERT_CONSUMER_PROCESSES", "1"))
+# 停止时等待处理中消息完成的秒数
+ALERT_SHUTDOWN_TIMEOUT = float(os.getenv("ALERT_SHUTDOWN_TIMEOUT", "30"))
+# 投递指标的暴露端口，0 表示不暴露；多进程时第 i 个进程使用 端口 + i
+ALERT_METRICS_PORT = int(os.getenv("ALERT_METRICS_PORT", "0"))
+
 class AlertConsumer:
-    def __init__(self):
-        self.rabbitmq = RabbitMQ()
+    """
+    告警消费者：同时消费多个队列
+
+    每个队列一个消费者通道，按 prefetch 限制未确认消息数；
+    同步处理函数在线程池中执行，协程直接在事件循环中执行；成功后才确认，
+    抛出异常时拒绝（首次重新入队）。
+    库存告警进入摘要窗口去重合并，按窗口通过持久 SMTP 连接发送；
+    系统告警通过 WebhookDelivery 异步投递，最终失败的写入死信队列。
+    """
+
+    def __init__(
+        self,
+        client: Optional[AsyncRabbitMQ] = None,
+        digest: Optional[AlertDigest] = None,
+        webhooks: Optional[WebhookDelivery] = None,
+        prefetch: int = ALERT_PREFETCH,
+        workers: int = ALERT_WORKERS,
+        shutdown_timeout: float = ALERT_SHUTDOWN_TIMEOUT
+    ):
+        self.client = client or AsyncRabbitMQ()
         self.alert_handler = AlertHandler()
+        self.digest = digest or AlertDigest(self.alert_handler.smtp_pool)
+        self.webhooks = webhooks or WebhookDelivery(dead_letter=self.store_dead_letter)
+        self.prefetch = prefetch
+        self.shutdown_timeout = shutdown_timeout
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="alert-handler")
+        self.routes: Dict[str, Callable] = {
+            "stock_alerts": self.process_stock_alert,
+            "system_events": self.process_system_alert,
+        }
+        self._loop = None
+        self._stop = None
     
-    def process_stock_alert(self, ch, method, properties, body):
+    def process_stock_alert(self, alert_data: dict):
         """处理库存相关告警"""
-        try:
-            alert_data = json.loads(body)
-            alert_type = alert_data.get("type")
-            
-            if alert_type == "low_stock":
-                self.alert_handler.send_email_alert(
-                    subject="Low Stock Alert",
-                    message=f"Product {alert_data['product_id']} is running low: {alert_data['quantity']} units remaining",
-                    recipients=["warehouse@example.com"]
-                )
-            
-            elif alert_type == "expiry_warning":
-                self.alert_handler.send_email_alert(
-                    subject="Product Expiry Warning",
-                    message=f"Product {alert_data['product_id']} will expire in {alert_data['days_remaining']} days",
-                    recipients=["warehouse@example.com"]
-                )
-            
-        except Exception as e:
-            logger.error(f"Failed to process stock alert: {e}")
+        alert_type = alert_data.get("type")
+        
+        if alert_type == "low_stock":
+            message = f"Product {alert_data['product_id']} is running low: {alert_data['quantity']} units remaining"
+        elif alert_type == "expiry_warning":
+            message = f"Product {alert_data['product_id']} will expire in {alert_data['days_remaining']} days"
+        else:
+            return
+        
+        self.digest.add(
+            ALERT_RECIPIENTS,
+            alert_type,
+            message,
+            product_id=alert_data.get("product_id"),
+            warehouse_id=alert_data.get("warehouse_id")
+        )
     
-    def process_system_alert(self, ch, method, properties, body):
+    async def process_system_alert(self, alert_data: dict):
         """处理系统相关告警"""
-        try:
-            alert_data = json.loads(body)
-            alert_type = alert_data.get("type")
-            
-            if alert_type == "high_error_rate":
-                self.alert_handler.send_webhook_alert({
-                    "title": "High Error Rate Detected",
-                    "description": f"Error rate: {alert_data['value']:.2%}",
-                    "severity": "high"
-                })
-            
-            elif alert_type == "slow_response":
-                self.alert_handler.send_webhook_alert({
-                    "title": "Slow Response Time Detected",
-                    "description": f"Response time: {alert_data['value']:.2f}s",
-                    "severity": "medium"
-                })
-            
-        except Exception as e:
-            logger.error(f"Failed to process system alert: {e}")
-    
+        alert_type = alert_data.get("type")
+        
+        if alert_type == "high_error_rate":
+            payload = {
+                "title": "High Error Rate Detected",
+                "description": f"Error rate: {alert_data['value']:.2%}",
+                "severity": "high"
+            }
+        elif alert_type == "slow_response":
+            payload = {
+                "title": "Slow Response Time Detected",
+                "description": f"Response time: {alert_data['value']:.2f}s",
+                "severity": "medium"
+            }
+        else:
+            return
+        
+        # 重试耗尽后告警已进入死信，消息照常确认
+        await self.webhooks.deliver(payload)
+
+    async def store_dead_letter(self, record: dict) -> bool:
+        return await self.client.publish(WEBHOOK_DEAD_LETTER_QUEUE, record)
+
+    def _handler(self, process: Callable):
+        if asyncio.iscoroutinefunction(process):
+            async def handle(alert_data, properties):
+                await process(alert_data)
+        else:
+            async def handle(alert_data, properties):
+                await self._loop.run_in_executor(self.executor, process, alert_data)
+        return handle
+
+    async def run(self):
+        """消费所有队列直到 stop() 被调用"""
+        self._loop = asyncio.get_running_loop()
+        self._stop = asyncio.Event()
+        self.digest.start()
+        await self.webhooks.start()
+        await self.client.start()
+        for queue, process in self.routes.items():
+            await self.client.consume(queue, self._handler(process), prefetch=self.prefetch)
+        logger.info(f"Alert consumer started on {sorted(self.routes)} (pid {os.getpid()})")
+        await self._stop.wait()
+
+        # 停止接收新消息，等待处理中的消息确认后断开
+        await self.client.close(self.shutdown_timeout)
+        self.executor.shutdown(wait=True)
+        await self.webhooks.close()
+        # 发出窗口内剩余的告警
+        await self._loop.run_in_executor(None, self.digest.close)
+        logger.info("Alert consumer stopped")
+
+    def stop(self):
+        """可从任意线程调用"""
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._stop.set)
+
     def start(self):
-        """启动告警消费者"""
+        """启动告警消费者，收到 SIGTERM / SIGINT 后优雅退出"""
+        async def main():
+            loop = asyncio.get_running_loop()
+            for sig in (signal.SIGTERM, signal.SIGINT):
+                loop.add_signal_handler(sig, self.stop)
+            await self.run()
+
         try:
-            # 启动库存告警消费者
-            self.rabbitmq.consume("stock_alerts", self.process_stock_alert)
-            
-            # 启动系统告警消费者
-            self.rabbitmq.consume("system_events", self.process_system_alert)
-            
+            asyncio.run(main())
         except Exception as e:
-            logger.error(f"Failed to start alert consumer: {e}") 
\ No newline at end of file
+            logger.error(f"Failed to start alert consumer: {e}")
+            raise
+
+def _configure_logging():
+    logging.basicConfig(level=logging.INFO)
+    logging.getLogger("pika").setLevel(logging.WARNING)
+
+def _serve_metrics(index: int = 0):
+    if ALERT_METRICS_PORT:
+        start_http_server(ALERT_METRICS_PORT + index)
+
+def _consumer_process(index: int, prefetch: int, workers: int):
+    _configure_logging()
+    _serve_metrics(index)
+    AlertConsumer(prefetch=prefetch, workers=workers).start()
+
+def run_processes(processes: int, prefetch: int, workers: int):
+    """启动多个消费进程，转发停止信号，异常退出的进程自动重启"""
+    def spawn(index: int):
+        process = multiprocessing.Process(
+            target=_consumer_process,
+            args=(index, prefetch, workers),
+            daemon=False
+        )
+        process.index = index
+        process.start()
+        return process
+
+    children = [spawn(index) for index in range(processes)]
+    stopping = False
+
+    def forward(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for child in children:
+            if child.is_alive():
+                os.kill(child.pid, signal.SIGTERM)
+
+    signal.signal(signal.SIGTERM, forward)
+    signal.signal(signal.SIGINT, forward)
+
+    while children:
+        for child in list(children):
+            child.join(timeout=1.0 / len(children))
+            if child.is_alive():
+                continue
+            children.remove(child)
+            if not stopping:
+                logger.warning(f"Alert consumer process {child.pid} exited with {child.exitcode}, restarting")
+                children.append(spawn(child.index))
+
+def main():
+    parser = argparse.ArgumentParser(description="Alert queue consumer")
+    parser.add_argument("--processes", type=int, default=ALERT_CONSUMER_PROCESSES)
+    parser.add_argument("--prefetch", type=int, default=ALERT_PREFETCH)
+    parser.add_argument("--workers", type=int, default=ALERT_WORKERS)
+    args = parser.parse_args()
+
+    _configure_logging()
+    if args.processes <= 1:
+        _serve_metrics()
+        AlertConsumer(prefetch=args.prefetch, workers=args.workers).start()
+    else:
+        run_processes(args.processes, args.prefetch, args.workers)
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
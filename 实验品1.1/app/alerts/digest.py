@@ -0,0 +1,257 @@
+import logging
+import os
+import smtplib
+import threading
+import time
+from collections import Counter, OrderedDict
+from email.mime.text import MIMEText
+from queue import Empty, LifoQueue
+from typing import Dict, Iterable, Optional
+from ..rate_limit import RateLimiter
+
+logger = logging.getLogger(__name__)
+
+SMTP_HOST = os.getenv("SMTP_HOST", "smtp.warehouse.com")
+SMTP_PORT = int(os.getenv("SMTP_PORT", "25"))
+SMTP_POOL_SIZE = int(os.getenv("SMTP_POOL_SIZE", "2"))
+ALERT_EMAIL_FROM = os.getenv("ALERT_EMAIL_FROM", "alerts@warehouse.com")
+ALERT_RECIPIENTS = os.getenv("ALERT_RECIPIENTS", "warehouse@example.com").split(",")
+# 聚合窗口（秒），每个窗口向每个收件人最多发送一封摘要
+ALERT_DIGEST_WINDOW = float(os.getenv("ALERT_DIGEST_WINDOW", "60"))
+# 每个收件人每小时最多收到的邮件数及突发上限
+ALERT_EMAILS_PER_HOUR = float(os.getenv("ALERT_EMAILS_PER_HOUR", "12"))
+ALERT_EMAIL_BURST = int(os.getenv("ALERT_EMAIL_BURST", "3"))
+
+class SMTPPool:
+    """
+    持久 SMTP 连接池
+
+    连接用完放回池中复用，最多同时持有 size 条；空闲超过 idle_check 秒的连接
+    使用前先 NOOP 探活，发送时服务端已断开则丢弃该连接并用新连接重试一次。
+    """
+
+    def __init__(
+        self,
+        host: str = SMTP_HOST,
+        port: int = SMTP_PORT,
+        size: int = SMTP_POOL_SIZE,
+        timeout: float = 10.0,
+        idle_check: float = 30.0
+    ):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.idle_check = idle_check
+        self._idle = LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+
+    def _connect(self) -> smtplib.SMTP:
+        return smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+
+    def _checkout(self) -> smtplib.SMTP:
+        self._slots.acquire()
+        try:
+            while True:
+                try:
+                    smtp, last_used = self._idle.get_nowait()
+                except Empty:
+                    return self._connect()
+                if time.monotonic() - last_used < self.idle_check:
+                    return smtp
+                try:
+                    if smtp.noop()[0] == 250:
+                        return smtp
+                except (smtplib.SMTPException, OSError):
+                    pass
+                self._discard(smtp)
+        except Exception:
+            self._slots.release()
+            raise
+
+    def _checkin(self, smtp: smtplib.SMTP):
+        self._idle.put((smtp, time.monotonic()))
+        self._slots.release()
+
+    def _discard(self, smtp: smtplib.SMTP):
+        try:
+            smtp.close()
+        except OSError:
+            pass
+
+    def send(self, msg: MIMEText):
+        for attempt in range(2):
+            smtp = self._checkout()
+            try:
+                smtp.send_message(msg)
+            except smtplib.SMTPServerDisconnected:
+                self._discard(smtp)
+                self._slots.release()
+                if attempt:
+                    raise
+                continue
+            except smtplib.SMTPException:
+                # 服务端拒绝本封邮件，连接仍可用
+                smtp.rset()
+                self._checkin(smtp)
+                raise
+            except OSError:
+                self._discard(smtp)
+                self._slots.release()
+                if attempt:
+                    raise
+                continue
+            self._checkin(smtp)
+            return
+
+    def close(self):
+        while True:
+            try:
+                smtp, _ = self._idle.get_nowait()
+            except Empty:
+                return
+            try:
+                smtp.quit()
+            except (smtplib.SMTPException, OSError):
+                self._discard(smtp)
+
+class _Entry:
+    __slots__ = ("alert_type", "message", "count", "first_seen", "last_seen")
+
+    def __init__(self, alert_type: str, message: str, now: float):
+        self.alert_type = alert_type
+        self.message = message
+        self.count = 1
+        self.first_seen = now
+        self.last_seen = now
+
+class AlertDigest:
+    """
+    告警摘要：窗口内按 (类型, 商品, 仓库) 去重，定期向每个收件人发送一封汇总邮件
+
+    - 同一键的重复告警只保留最新内容并计数；
+    - 收件人超过发信频率限制或发送失败时，其告警留到下一个窗口继续合并；
+    - 告警只保存在内存中：正常停止时 close() 会发出剩余告警，进程崩溃最多丢失一个窗口。
+    """
+
+    def __init__(
+        self,
+        pool: Optional[SMTPPool] = None,
+        window: float = ALERT_DIGEST_WINDOW,
+        emails_per_hour: float = ALERT_EMAILS_PER_HOUR,
+        burst: int = ALERT_EMAIL_BURST,
+        sender: str = ALERT_EMAIL_FROM,
+        clock=time.monotonic
+    ):
+        self.pool = pool or SMTPPool()
+        self.window = window
+        self.sender = sender
+        self.clock = clock
+        # 复用令牌桶限流器的单机模式，按收件人计数
+        self.limiter = RateLimiter(emails_per_hour / 60.0, burst, clock=clock)
+        self._pending: Dict[str, OrderedDict] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def add(
+        self,
+        recipients: Iterable[str],
+        alert_type: str,
+        message: str,
+        product_id: Optional[int] = None,
+        warehouse_id: Optional[int] = None
+    ):
+        key = (alert_type, product_id, warehouse_id)
+        now = self.clock()
+        with self._lock:
+            for recipient in recipients:
+                entries = self._pending.setdefault(recipient, OrderedDict())
+                entry = entries.get(key)
+                if entry is None:
+                    entries[key] = _Entry(alert_type, message, now)
+                else:
+                    entry.message = message
+                    entry.count += 1
+                    entry.last_seen = now
+
+    @property
+    def pending(self) -> int:
+        with self._lock:
+            return sum(len(entries) for entries in self._pending.values())
+
+    def flush(self) -> int:
+        """向未超限的收件人发送摘要，返回发出的邮件数"""
+        with self._lock:
+            batches = {}
+            for recipient in list(self._pending):
+                if self.limiter.allow(recipient)[0]:
+                    batches[recipient] = self._pending.pop(recipient)
+
+        sent = 0
+        for recipient, entries in batches.items():
+            try:
+                self.pool.send(self._compose(recipient, entries))
+                sent += 1
+            except Exception as e:
+                logger.error(f"Failed to send alert digest to {recipient}: {e}")
+                self._restore(recipient, entries)
+        if sent:
+            logger.info(f"Sent {sent} alert digests")
+        return sent
+
+    def _restore(self, recipient: str, entries: OrderedDict):
+        """发送失败的告警放回待发送，与期间新到的告警合并"""
+        with self._lock:
+            current = self._pending.setdefault(recipient, OrderedDict())
+            for key, entry in entries.items():
+                newer = current.get(key)
+                if newer is None:
+                    current[key] = entry
+                else:
+                    newer.count += entry.count
+                    newer.first_seen = entry.first_seen
+
+    def _compose(self, recipient: str, entries: OrderedDict) -> MIMEText:
+        counts = Counter()
+        lines = []
+        for (alert_type, product_id, warehouse_id), entry in entries.items():
+            counts[alert_type] += entry.count
+            line = f"- [{alert_type}] {entry.message}"
+            if warehouse_id is not None:
+                line += f" (warehouse {warehouse_id})"
+            if entry.count > 1:
+                line += f" x{entry.count}"
+            lines.append(line)
+
+        summary = ", ".join(f"{count} {alert_type}" for alert_type, count in counts.most_common())
+        msg = MIMEText("\n".join(lines))
+        msg['Subject'] = f"Warehouse alerts: {summary}"
+        msg['From'] = self.sender
+        msg['To'] = recipient
+        return msg
+
+    def start(self):
+        """启动后台线程，每个窗口发送一次"""
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="alert-digest", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.window):
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Alert digest flush failed: {e}")
+
+    def close(self):
+        """停止后台线程并发送剩余告警"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+        if self.pending:
+            logger.warning(f"Dropping {self.pending} alerts held back by recipient rate limits")
+        self.pool.close()
@@ -1,16 +1,27 @@
-from typing import List, Dict
-import smtplib
+from typing import List, Optional
 from email.mime.text import MIMEText
 from datetime import datetime
-import requests
 import logging
-from ..queue.rabbitmq import RabbitMQ
+from ..queue.rabbitmq import get_publisher
+from .digest import ALERT_EMAIL_FROM, SMTPPool
 
 logger = logging.getLogger(__name__)
 
+def low_stock_alert(product_id: int, quantity: int, warehouse_id: Optional[int], min_stock: int) -> dict:
+    """低库存告警消息体；库存写入路径经发件箱发布同样的消息"""
+    return {
+        "type": "low_stock",
+        "product_id": product_id,
+        "warehouse_id": warehouse_id,
+        "quantity": quantity,
+        "min_stock": min_stock,
+        "timestamp": datetime.now().isoformat()
+    }
+
 class AlertHandler:
-    def __init__(self):
-        self.rabbitmq = RabbitMQ()
+    def __init__(self, smtp_pool: SMTPPool = None):
+        # 复用持久 SMTP 连接，不再每封邮件新建连接
+        self.smtp_pool = smtp_pool or SMTPPool()
         self.alert_thresholds = {
             "low_stock": 10,
             "expiry_days": 30,
@@ -18,43 +29,37 @@ class AlertHandler:
             "response_time": 1.0
         }
     
+    @property
+    def rabbitmq(self):
+        """共享发布者，首次发布时才连接"""
+        return get_publisher()
+
     def send_email_alert(self, subject: str, message: str, recipients: List[str]):
-        """发送邮件告警"""
+        """发送邮件告警；失败时抛出异常，由消费者拒绝消息后重试"""
         try:
             msg = MIMEText(message)
             msg['Subject'] = subject
-            msg['From'] = "alerts@warehouse.com"
+            msg['From'] = ALERT_EMAIL_FROM
             msg['To'] = ", ".join(recipients)
             
-            with smtplib.SMTP('smtp.warehouse.com') as server:
-                server.send_message(msg)
+            self.smtp_pool.send(msg)
                 
             logger.info(f"Alert email sent to {recipients}")
         except Exception as e:
             logger.error(f"Failed to send email alert: {e}")
+            raise
     
-    def send_webhook_alert(self, alert_data: Dict):
-        """发送Webhook告警"""
-        try:
-            response = requests.post(
-                "https://webhook.warehouse.com/alerts",
-                json=alert_data
-            )
-            response.raise_for_status()
-            logger.info("Webhook alert sent successfully")
-        except Exception as e:
-            logger.error(f"Failed to send webhook alert: {e}")
-    
-    def handle_stock_alert(self, product_id: int, quantity: int):
-        """处理库存告警"""
-        if quantity <= self.alert_thresholds["low_stock"]:
-            alert_data = {
-                "type": "low_stock",
-                "product_id": product_id,
-                "quantity": quantity,
-                "timestamp": datetime.now().isoformat()
-            }
-            self.rabbitmq.publish("stock_alerts", alert_data)
+    def handle_stock_alert(
+        self,
+        product_id: int,
+        quantity: int,
+        warehouse_id: Optional[int] = None,
+        min_stock: Optional[int] = None
+    ):
+        """处理库存告警；给出 min_stock 时以商品自身的预警线为阈值"""
+        threshold = self.alert_thresholds["low_stock"] if min_stock is None else min_stock
+        if quantity <= threshold:
+            self.rabbitmq.publish("stock_alerts", low_stock_alert(product_id, quantity, warehouse_id, threshold))
     
     def handle_expiry_alert(self, product_id: int, expiry_date: datetime):
         """处理过期告警"""
@@ -0,0 +1,268 @@
+import asyncio
+import json
+import logging
+import os
+import random
+import time
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+from urllib.parse import urlsplit
+
+import aiohttp
+from prometheus_client import Counter, Gauge, Histogram
+
+from ..monitoring.tracing import current_traceparent, span
+
+logger = logging.getLogger(__name__)
+
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "https://webhook.warehouse.com/alerts")
+# 同时进行中的 Webhook 请求数上限，同时也是连接池大小
+WEBHOOK_CONCURRENCY = int(os.getenv("WEBHOOK_CONCURRENCY", "32"))
+# 单次请求超时（秒），包括建立连接和读取响应
+WEBHOOK_TIMEOUT = float(os.getenv("WEBHOOK_TIMEOUT", "5"))
+# 最多尝试次数；两次尝试之间按指数退避并加随机抖动
+WEBHOOK_MAX_ATTEMPTS = int(os.getenv("WEBHOOK_MAX_ATTEMPTS", "5"))
+WEBHOOK_BACKOFF_BASE = float(os.getenv("WEBHOOK_BACKOFF_BASE", "0.5"))
+WEBHOOK_BACKOFF_MAX = float(os.getenv("WEBHOOK_BACKOFF_MAX", "30"))
+# 同一端点连续失败达到阈值后熔断，冷却期内的投递直接进入死信
+WEBHOOK_BREAKER_THRESHOLD = int(os.getenv("WEBHOOK_BREAKER_THRESHOLD", "5"))
+WEBHOOK_BREAKER_COOLDOWN = float(os.getenv("WEBHOOK_BREAKER_COOLDOWN", "30"))
+# 最终投递失败的告警写入该队列，排查后可重新投递
+WEBHOOK_DEAD_LETTER_QUEUE = "webhook_dead_letters"
+
+# endpoint 标签为 scheme://host:port，取值随配置的端点数有界
+WEBHOOK_REQUEST_LATENCY = Histogram(
+    "webhook_request_duration_seconds",
+    "Latency of a single webhook HTTP request",
+    ["endpoint"],
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+)
+
+WEBHOOK_DELIVERY_LATENCY = Histogram(
+    "webhook_delivery_duration_seconds",
+    "Time from first attempt to successful delivery, including retries",
+    ["endpoint"],
+    buckets=(0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 300.0)
+)
+
+WEBHOOK_FAILURES = Counter(
+    "webhook_request_failures_total",
+    "Failed webhook delivery attempts",
+    ["endpoint", "reason"]
+)
+
+WEBHOOK_DELIVERIES = Counter(
+    "webhook_deliveries_total",
+    "Webhook deliveries by final outcome",
+    ["endpoint", "outcome"]
+)
+
+WEBHOOK_CIRCUIT_OPEN = Gauge(
+    "webhook_circuit_open",
+    "Whether the endpoint's circuit breaker is open",
+    ["endpoint"],
+    multiprocess_mode="liveall"
+)
+
+DeadLetterStore = Callable[[Dict[str, Any]], Awaitable[bool]]
+
+class WebhookDeliveryError(Exception):
+    """告警既未投递成功也未能写入死信，调用方应保留原消息稍后重试"""
+
+class CircuitBreaker:
+    """
+    单个端点的熔断器
+
+    连续失败 threshold 次后打开，冷却 cooldown 秒后放行一个探测请求（半开）：
+    探测成功则关闭，失败则重新打开并再次冷却。
+    """
+
+    def __init__(self, threshold: int, cooldown: float, clock=time.monotonic):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.clock = clock
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._probing = False
+
+    @property
+    def is_open(self) -> bool:
+        return self.opened_at is not None
+
+    def allow(self) -> bool:
+        if self.opened_at is None:
+            return True
+        if self._probing or self.clock() - self.opened_at < self.cooldown:
+            return False
+        self._probing = True
+        return True
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+
+    def record_failure(self):
+        self.failures += 1
+        self._probing = False
+        if self.opened_at is not None or self.failures >= self.threshold:
+            self.opened_at = self.clock()
+
+def endpoint_label(url: str) -> str:
+    parts = urlsplit(url)
+    return f"{parts.scheme}://{parts.netloc}"
+
+def _retry_after(headers) -> Optional[float]:
+    try:
+        return float(headers.get("Retry-After"))
+    except (TypeError, ValueError):
+        return None
+
+class WebhookDelivery:
+    """
+    异步 Webhook 投递
+
+    - 共享一个 aiohttp 会话，连接池内的连接在请求之间保持复用；
+    - 同时进行中的请求不超过 concurrency，慢接收端只占用自己的并发额度；
+    - 超时、连接错误、408/429 与 5xx 按带抖动的指数退避重试，其余 4xx 不重试；
+    - 每个端点独立熔断，熔断期间不再请求该端点；
+    - 最终失败的告警交给 dead_letter 保存，未配置时只记录日志。
+    """
+
+    def __init__(
+        self,
+        url: str = WEBHOOK_URL,
+        dead_letter: Optional[DeadLetterStore] = None,
+        concurrency: int = WEBHOOK_CONCURRENCY,
+        timeout: float = WEBHOOK_TIMEOUT,
+        max_attempts: int = WEBHOOK_MAX_ATTEMPTS,
+        backoff_base: float = WEBHOOK_BACKOFF_BASE,
+        backoff_max: float = WEBHOOK_BACKOFF_MAX,
+        breaker_threshold: int = WEBHOOK_BREAKER_THRESHOLD,
+        breaker_cooldown: float = WEBHOOK_BREAKER_COOLDOWN
+    ):
+        self.url = url
+        self.dead_letter = dead_letter
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.breaker_threshold = breaker_threshold
+        self.breaker_cooldown = breaker_cooldown
+        self.breakers: Dict[str, CircuitBreaker] = {}
+        # 会话与信号量在 start() 中创建，绑定到当前事件循环
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+
+    async def start(self):
+        if self._session is not None:
+            return
+        self._slots = asyncio.Semaphore(self.concurrency)
+        self._session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=self.concurrency),
+            timeout=aiohttp.ClientTimeout(total=self.timeout),
+            headers={"Content-Type": "application/json"}
+        )
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    def breaker(self, endpoint: str) -> CircuitBreaker:
+        breaker = self.breakers.get(endpoint)
+        if breaker is None:
+            breaker = self.breakers[endpoint] = CircuitBreaker(self.breaker_threshold, self.breaker_cooldown)
+        return breaker
+
+    def backoff(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        """第 attempt 次失败后的等待时间：在指数上限内均匀抖动，接收端给出 Retry-After 时不早于它"""
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** (attempt - 1)))
+        if retry_after is not None:
+            delay = max(delay, min(retry_after, self.backoff_max))
+        return delay
+
+    async def _post(self, url: str, body: bytes, endpoint: str) -> Tuple[int, Optional[float]]:
+        async with self._slots:
+            with span(f"POST {endpoint}", "http", url=url) as current:
+                traceparent = current_traceparent()
+                headers = {"traceparent": traceparent} if traceparent else None
+                start = time.perf_counter()
+                async with self._session.post(url, data=body, headers=headers) as response:
+                    # 读完响应体，连接才能回到连接池
+                    await response.read()
+                WEBHOOK_REQUEST_LATENCY.labels(endpoint).observe(time.perf_counter() - start)
+                if current is not None:
+                    current.attributes["status"] = response.status
+            return response.status, _retry_after(response.headers)
+
+    async def deliver(self, payload: Dict[str, Any], url: Optional[str] = None) -> bool:
+        """
+        投递一条告警，重试结束后返回：成功为 True，已写入死信为 False；
+        死信也写入失败时抛出 WebhookDeliveryError
+        """
+        await self.start()
+        url = url or self.url
+        endpoint = endpoint_label(url)
+        breaker = self.breaker(endpoint)
+        body = json.dumps(payload).encode()
+        started = time.perf_counter()
+        error, attempt = None, 0
+
+        while attempt < self.max_attempts:
+            if not breaker.allow():
+                WEBHOOK_FAILURES.labels(endpoint, "circuit_open").inc()
+                error = "circuit open"
+                break
+            attempt += 1
+            retry_after = None
+            try:
+                status, retry_after = await self._post(url, body, endpoint)
+            except asyncio.TimeoutError:
+                reason, error = "timeout", f"timed out after {self.timeout}s"
+            except aiohttp.ClientError as e:
+                reason, error = "connection", str(e) or type(e).__name__
+            else:
+                if status < 300:
+                    breaker.record_success()
+                    WEBHOOK_CIRCUIT_OPEN.labels(endpoint).set(0)
+                    WEBHOOK_DELIVERIES.labels(endpoint, "delivered").inc()
+                    WEBHOOK_DELIVERY_LATENCY.labels(endpoint).observe(time.perf_counter() - started)
+                    return True
+                reason, error = f"{status // 100}xx", f"HTTP {status}"
+                if status < 500 and status not in (408, 429):
+                    # 接收端正常响应但拒绝了本条告警，重试无意义，也不计入熔断
+                    breaker.record_success()
+                    WEBHOOK_CIRCUIT_OPEN.labels(endpoint).set(0)
+                    WEBHOOK_FAILURES.labels(endpoint, reason).inc()
+                    break
+
+            breaker.record_failure()
+            WEBHOOK_CIRCUIT_OPEN.labels(endpoint).set(int(breaker.is_open))
+            WEBHOOK_FAILURES.labels(endpoint, reason).inc()
+            logger.warning(f"Webhook delivery to {endpoint} failed (attempt {attempt}/{self.max_attempts}): {error}")
+            if attempt < self.max_attempts:
+                await asyncio.sleep(self.backoff(attempt, retry_after))
+
+        await self._dead_letter(url, endpoint, payload, error, attempt)
+        return False
+
+    async def _dead_letter(self, url: str, endpoint: str, payload: Dict[str, Any], error: str, attempts: int):
+        WEBHOOK_DELIVERIES.labels(endpoint, "dead_lettered").inc()
+        record = {
+            "url": url,
+            "payload": payload,
+            "error": error,
+            "attempts": attempts,
+            "failed_at": datetime.utcnow().isoformat()
+        }
+        logger.error(f"Webhook delivery to {endpoint} gave up after {attempts} attempts: {error}")
+        if self.dead_letter is None:
+            return
+        try:
+            stored = await self.dead_letter(record)
+        except Exception as e:
+            raise WebhookDeliveryError(f"failed to store dead letter: {e}") from e
+        if not stored:
+            raise WebhookDeliveryError("dead letter store did not accept the record")
@@ -1,9 +1,43 @@
 from functools import wraps
 from datetime import datetime, timedelta
 import redis
+from redis.client import Pipeline
 import json
+import os
+from .monitoring.tracing import span
 
-redis_client = redis.Redis(host='localhost', port=6379, db=0)
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+
+class TracedPipeline(Pipeline):
+    def execute(self, raise_on_error=True):
+        with span("redis pipeline", "redis", commands=len(self.command_stack)):
+            return super().execute(raise_on_error)
+
+class TracedRedis(redis.Redis):
+    """为每条命令和每次管道执行记录追踪 span"""
+
+    def execute_command(self, *args, **options):
+        with span(f"redis {args[0]}", "redis"):
+            return super().execute_command(*args, **options)
+
+    def pipeline(self, transaction=True, shard_hint=None):
+        return TracedPipeline(self.connection_pool, self.response_callbacks, transaction, shard_hint)
+
+# 按 URL 复用的客户端，首次使用时才创建
+_redis_clients = {}
+
+def get_redis(url: str = REDIS_URL) -> redis.Redis:
+    """获取 Redis 客户端；连接在第一次执行命令时才建立，导入本模块不访问网络"""
+    client = _redis_clients.get(url)
+    if client is None:
+        client = _redis_clients.setdefault(url, TracedRedis.from_url(url))
+    return client
+
+def close_redis_clients():
+    """关闭所有已创建客户端的连接池（应用关闭时调用）"""
+    for client in _redis_clients.values():
+        client.connection_pool.disconnect()
+    _redis_clients.clear()
 
 def cache(expire_seconds=300):
     def decorator(func):
@@ -13,6 +47,7 @@ def cache(expire_seconds=300):
             cache_key = f"{func.__name__}:{str(args)}:{str(kwargs)}"
             
             # 尝试从缓存获取
+            redis_client = get_redis()
             cached_result = redis_client.get(cache_key)
             if cached_result:
                 return json.loads(cached_result)
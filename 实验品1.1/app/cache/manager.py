@@ -7,8 +7,16 @@ from datetime import datetime, timedelta
 
 class CacheManager:
     def __init__(self, redis_url: str):
-        self.redis = redis.from_url(redis_url)
+        self.redis_url = redis_url
+        self._redis = None
         self.default_ttl = 300  # 5分钟
+
+    @property
+    def redis(self) -> redis.Redis:
+        """首次使用时才创建客户端"""
+        if self._redis is None:
+            self._redis = redis.from_url(self.redis_url)
+        return self._redis
     
     def generate_key(self, prefix: str, *args, **kwargs) -> str:
         """生成缓存键"""
@@ -1,10 +1,12 @@
 from sqlalchemy.orm import Session
 from . import models, schemas
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, date
 from fastapi import HTTPException
+from sqlalchemy import and_, or_, select
+from sqlalchemy.orm.attributes import set_committed_value
 from sqlalchemy.sql import func
-from . import security
-from typing import Optional
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from typing import Optional, Dict, Tuple
 import csv
 import os
 import json
@@ -12,11 +14,31 @@ from statistics import mean
 from collections import defaultdict
 import shutil
 import subprocess
+import random
 from pathlib import Path
-from .cache import cache
+from .alerts.handlers import low_stock_alert
+from .pagination import keyset_paginate
 
 BACKUP_DIR = Path("backups")
-BACKUP_DIR.mkdir(exist_ok=True)
+
+# 库存变动事件发布到的队列（低库存告警仍发往 stock_alerts）
+STOCK_EVENTS_QUEUE = "stock_events"
+
+# 快照只覆盖该时长之前的流水
+SNAPSHOT_SAFETY_LAG = timedelta(minutes=5)
+
+# 同步队列每个事务处理的条目数
+SYNC_BATCH_SIZE = int(os.getenv("SYNC_BATCH_SIZE", "50"))
+# 每条离线操作最多尝试次数，之后标记为 failed 等待人工处理
+SYNC_MAX_ATTEMPTS = int(os.getenv("SYNC_MAX_ATTEMPTS", "3"))
+# 失败重试的退避时间：base * 2^(n-1)，不超过 max，并加随机抖动
+SYNC_BACKOFF_BASE = timedelta(seconds=float(os.getenv("SYNC_BACKOFF_BASE", "30")))
+SYNC_BACKOFF_MAX = timedelta(seconds=float(os.getenv("SYNC_BACKOFF_MAX", "3600")))
+
+# 分片配置咨询锁的命名空间（高 32 位），低 32 位为商品ID：出入库持共享锁，变更配置持排他锁
+SHARD_CONFIG_LOCK_NS = 0x53484152
+# 日汇总表的事务级咨询锁键：增量更新持共享锁，重建持排他锁
+DAILY_MOVEMENT_LOCK_KEY = 0x524F4C4C
 
 def get_user(db: Session, user_id: int):
     return db.query(models.User).filter(models.User.id == user_id).first()
@@ -24,16 +46,14 @@ def get_user(db: Session, user_id: int):
 def get_user_by_username(db: Session, username: str):
     return db.query(models.User).filter(models.User.username == username).first()
 
-def authenticate_user(db: Session, username: str, password: str):
-    user = get_user_by_username(db, username)
-    if not user:
-        return False
-    if not security.verify_password(password, user.hashed_password):
-        return False
+def update_password_hash(db: Session, user: models.User, hashed_password: str):
+    """更新密码哈希（bcrypt 成本参数变更后登录时重新哈希）"""
+    user.hashed_password = hashed_password
+    db.commit()
     return user
 
-def create_user(db: Session, user: schemas.UserCreate):
-    hashed_password = security.get_password_hash(user.password)
+def create_user(db: Session, user: schemas.UserCreate, hashed_password: str):
+    """创建用户；密码哈希由调用方经 security.password_hasher 计算"""
     db_user = models.User(
         username=user.username,
         email=user.email,
@@ -45,9 +65,19 @@ def create_user(db: Session, user: schemas.UserCreate):
     db.refresh(db_user)
     return db_user
 
-@cache(expire_seconds=300)
-def get_products(db: Session, skip: int = 0, limit: int = 100):
-    return db.query(models.Product).offset(skip).limit(limit).all()
+def get_products(
+    db: Session,
+    skip: int = 0,
+    limit: int = 100,
+    cursor: Optional[str] = None,
+    columns: Optional[list] = None
+):
+    # 指定 columns 时只查询这些列并返回行元组，省去 ORM 对象构建
+    query = db.query(*columns) if columns else db.query(models.Product)
+    if skip and not cursor:
+        # 兼容旧的 OFFSET 翻页
+        query = query.offset(skip)
+    return keyset_paginate(query, [models.Product.id], cursor=cursor, limit=limit)
 
 def create_product(db: Session, product: schemas.ProductCreate):
     db_product = models.Product(**product.dict())
@@ -61,22 +91,15 @@ def create_inbound_record(db: Session, inbound: schemas.InboundRecordCreate, ope
     db_inbound = models.InboundRecord(**inbound.dict(), operator_id=operator_id)
     db.add(db_inbound)
     
-    # 更新库存
-    stock = db.query(models.Stock).filter(
-        models.Stock.product_id == inbound.product_id,
-        models.Stock.warehouse_id == inbound.warehouse_id
-    ).first()
+    # 入库只追加库存流水，不更新库存行
+    shards = get_stock_shard_count(db, inbound.product_id)
+    ensure_stock_row(db, inbound.product_id, inbound.warehouse_id, expiry_date=inbound.expiry_date)
+    append_ledger_entry(db, inbound.product_id, inbound.warehouse_id, inbound.quantity, "inbound")
+    if shards:
+        increment_stock_shard(db, inbound.product_id, inbound.warehouse_id, inbound.quantity, shards)
     
-    if stock:
-        stock.quantity += inbound.quantity
-    else:
-        stock = models.Stock(
-            product_id=inbound.product_id,
-            warehouse_id=inbound.warehouse_id,
-            quantity=inbound.quantity,
-            expiry_date=inbound.expiry_date
-        )
-        db.add(stock)
+    # 更新日汇总
+    record_daily_movement(db, inbound.product_id, inbound.warehouse_id, inbound=inbound.quantity, shards=shards)
     
     # 记录操作日志
     log = models.OperationLog(
@@ -86,18 +109,22 @@ def create_inbound_record(db: Session, inbound: schemas.InboundRecordCreate, ope
     )
     db.add(log)
     
+    add_outbox_event(db, STOCK_EVENTS_QUEUE, "stock.inbound", {
+        "product_id": inbound.product_id,
+        "warehouse_id": inbound.warehouse_id,
+        "quantity": inbound.quantity,
+        "batch_number": inbound.batch_number,
+        "operator_id": operator_id
+    })
+    
     db.commit()
     db.refresh(db_inbound)
     return db_inbound
 
 def create_outbound_record(db: Session, outbound: schemas.OutboundRecordCreate):
-    # 检查库存是否充足
-    stock = db.query(models.Stock).filter(
-        models.Stock.product_id == outbound.product_id,
-        models.Stock.warehouse_id == outbound.warehouse_id
-    ).first()
-    
-    if not stock or stock.quantity < outbound.quantity:
+    # 检查库存是否充足并扣减
+    shards = get_stock_shard_count(db, outbound.product_id)
+    if not deduct_stock(db, outbound.product_id, outbound.warehouse_id, outbound.quantity, shards):
         raise HTTPException(status_code=400, detail="Insufficient stock")
     
     # 创建出库记录
@@ -105,20 +132,31 @@ def create_outbound_record(db: Session, outbound: schemas.OutboundRecordCreate):
     db.add(db_outbound)
     
     # 更新库存
-    stock.quantity -= outbound.quantity
+    append_ledger_entry(db, outbound.product_id, outbound.warehouse_id, -outbound.quantity, "outbound")
+    check_low_stock(db, outbound.product_id, outbound.warehouse_id, outbound.quantity, shards)
+    
+    # 更新日汇总
+    record_daily_movement(db, outbound.product_id, outbound.warehouse_id, outbound=outbound.quantity, shards=shards)
+    
+    add_outbox_event(db, STOCK_EVENTS_QUEUE, "stock.outbound", {
+        "product_id": outbound.product_id,
+        "warehouse_id": outbound.warehouse_id,
+        "quantity": outbound.quantity,
+        "reason": outbound.reason
+    })
     
     db.commit()
     db.refresh(db_outbound)
     return db_outbound
 
-@cache(expire_seconds=60)
 def get_product_stock(db: Session, product_id: int):
-    return db.query(models.Stock).filter(models.Stock.product_id == product_id).all()
+    stocks = db.query(models.Stock).filter(models.Stock.product_id == product_id).all()
+    return apply_ledger_quantities(db, stocks, product_id=product_id)
 
 def get_stock_warnings(db: Session):
     """获取库存预警信息"""
     warnings = []
-    stocks = db.query(models.Stock).join(models.Product).all()
+    stocks = apply_ledger_quantities(db, db.query(models.Stock).join(models.Product).all())
     
     for stock in stocks:
         if stock.quantity <= stock.product.min_stock:
@@ -135,9 +173,9 @@ def get_expiry_warnings(db: Session, days_threshold: int = 30):
     warnings = []
     warning_date = datetime.utcnow() + timedelta(days=days_threshold)
     
-    stocks = db.query(models.Stock).filter(
+    stocks = apply_ledger_quantities(db, db.query(models.Stock).filter(
         models.Stock.expiry_date <= warning_date
-    ).all()
+    ).all())
     
     for stock in stocks:
         days_until_expiry = (stock.expiry_date - datetime.utcnow()).days
@@ -152,70 +190,553 @@ def get_expiry_warnings(db: Session, days_threshold: int = 30):
 
 def create_stock_transfer(db: Session, transfer: schemas.StockTransferCreate):
     """创建库存调拨记录"""
-    # 检查源仓库库存
+    # 检查源仓库库存并扣减
+    shards = get_stock_shard_count(db, transfer.product_id)
+    if shards:
+        moved = transfer_stock_shards(
+            db, transfer.product_id, transfer.from_warehouse_id, transfer.to_warehouse_id, transfer.quantity, shards
+        )
+    else:
+        moved = deduct_stock(db, transfer.product_id, transfer.from_warehouse_id, transfer.quantity)
+    if not moved:
+        raise HTTPException(status_code=400, detail="Insufficient stock in source warehouse")
+    
     from_stock = db.query(models.Stock).filter(
         models.Stock.product_id == transfer.product_id,
         models.Stock.warehouse_id == transfer.from_warehouse_id
     ).first()
     
-    if not from_stock or from_stock.quantity < transfer.quantity:
-        raise HTTPException(status_code=400, detail="Insufficient stock in source warehouse")
+    # 更新源仓库和目标仓库库存
+    ensure_stock_row(db, transfer.product_id, transfer.to_warehouse_id, expiry_date=from_stock.expiry_date)
+    append_ledger_entry(db, transfer.product_id, transfer.from_warehouse_id, -transfer.quantity, "transfer_out")
+    append_ledger_entry(db, transfer.product_id, transfer.to_warehouse_id, transfer.quantity, "transfer_in")
+    check_low_stock(db, transfer.product_id, transfer.from_warehouse_id, transfer.quantity, shards)
+    
+    # 创建调拨记录
+    db_transfer = models.StockTransfer(**transfer.dict())
+    db.add(db_transfer)
     
-    # 更新源仓库库存
-    from_stock.quantity -= transfer.quantity
+    add_outbox_event(db, STOCK_EVENTS_QUEUE, "stock.transfer", {
+        "product_id": transfer.product_id,
+        "from_warehouse_id": transfer.from_warehouse_id,
+        "to_warehouse_id": transfer.to_warehouse_id,
+        "quantity": transfer.quantity
+    })
     
-    # 更新目标仓库库存
-    to_stock = db.query(models.Stock).filter(
-        models.Stock.product_id == transfer.product_id,
-        models.Stock.warehouse_id == transfer.to_warehouse_id
+    db.commit()
+    return db_transfer
+
+def ensure_stock_row(db: Session, product_id: int, warehouse_id: int, expiry_date: Optional[datetime] = None):
+    """确保 商品×仓库 的库存行存在（只插入、不更新）"""
+    exists = db.query(models.Stock.id).filter(
+        models.Stock.product_id == product_id,
+        models.Stock.warehouse_id == warehouse_id
     ).first()
+    if exists:
+        return
+    
+    db.execute(pg_insert(models.Stock.__table__).values(
+        product_id=product_id,
+        warehouse_id=warehouse_id,
+        quantity=0,
+        expiry_date=expiry_date
+    ).on_conflict_do_nothing(constraint="uq_stock_product_warehouse"))
+
+def lock_stock(db: Session, product_id: int, warehouse_id: int):
+    """对 商品×仓库 加事务级咨询锁，只用于扣减库存"""
+    db.execute(select(func.pg_advisory_xact_lock(product_id, warehouse_id)))
+
+def append_ledger_entry(db: Session, product_id: int, warehouse_id: int, quantity_change: int, movement_type: str):
+    """追加一条库存流水"""
+    entry = models.StockLedgerEntry(
+        product_id=product_id,
+        warehouse_id=warehouse_id,
+        quantity_change=quantity_change,
+        movement_type=movement_type
+    )
+    db.add(entry)
+    return entry
+
+def shard_config_lock_key(product_id: int) -> int:
+    return (SHARD_CONFIG_LOCK_NS << 32) | product_id
+
+def get_stock_shard_count(db: Session, product_id: int) -> int:
+    """
+    读取商品的库存分片数
+    
+    持有共享咨询锁到事务结束，与分片配置变更互斥；不锁商品行，热点商品的出入库
+    不会在同一行上争用行锁。
+    """
+    db.execute(select(func.pg_advisory_xact_lock_shared(shard_config_lock_key(product_id))))
+    return db.query(models.Product.stock_shards).filter(
+        models.Product.id == product_id
+    ).scalar() or 0
+
+def deduct_stock(db: Session, product_id: int, warehouse_id: int, quantity: int, shards: int = 0) -> bool:
+    """扣减库存，库存不足时返回 False"""
+    if shards:
+        return decrement_stock_shards(db, product_id, warehouse_id, quantity)
+    
+    # 同一商品×仓库的扣减串行执行
+    lock_stock(db, product_id, warehouse_id)
+    levels = get_stock_levels(db, product_id=product_id, warehouse_id=warehouse_id)
+    return levels.get((product_id, warehouse_id), 0) >= quantity
+
+def check_low_stock(db: Session, product_id: int, warehouse_id: int, removed: int, shards: int = 0):
+    """
+    扣减后检查库存是否刚从预警线以上跌到预警线及以下（边沿触发），是则在发件箱中登记告警
     
-    if to_stock:
-        to_stock.quantity += transfer.quantity
+    非分片商品的扣减在咨询锁内串行，每次跌破只告警一次；分片商品的扣减并发执行，
+    看到的余量可能不含同时进行的其他扣减，个别跌破可能漏报或重复。
+    """
+    # 会话关闭了 autoflush，先写出本次扣减的流水和分片，读到的才是扣减后的余量
+    db.flush()
+    min_stock = db.query(models.Product.min_stock).filter(models.Product.id == product_id).scalar() or 0
+    if shards:
+        remaining = sum_stock_shards(db, product_id, warehouse_id)
     else:
-        to_stock = models.Stock(
-            product_id=transfer.product_id,
-            warehouse_id=transfer.to_warehouse_id,
-            quantity=transfer.quantity,
-            expiry_date=from_stock.expiry_date
-        )
-        db.add(to_stock)
+        levels = get_stock_levels(db, product_id=product_id, warehouse_id=warehouse_id)
+        remaining = levels.get((product_id, warehouse_id), 0)
     
-    # 创建调拨记录
-    db_transfer = models.StockTransfer(**transfer.dict())
-    db.add(db_transfer)
+    if remaining <= min_stock < remaining + removed:
+        add_outbox_event(db, "stock_alerts", "low_stock", low_stock_alert(product_id, remaining, warehouse_id, min_stock))
+
+def add_outbox_event(db: Session, queue: str, event_type: str, payload: dict) -> models.OutboxEvent:
+    """
+    在当前事务中写入待发布事件，随业务变更一起提交或回滚
+    
+    请求路径上不访问 RabbitMQ，由 OutboxRelay 异步发布（至少一次，消费方按 message_id 去重）
+    """
+    db_event = models.OutboxEvent(
+        queue=queue,
+        event_type=event_type,
+        payload=json.dumps(payload, default=str)
+    )
+    db.add(db_event)
+    return db_event
+
+def ensure_stock_shards(db: Session, product_id: int, warehouse_id: int, shards: int):
+    """确保 商品×仓库 的分片行存在"""
+    db.execute(pg_insert(models.StockShard.__table__).values([
+        {"product_id": product_id, "warehouse_id": warehouse_id, "shard": shard, "quantity": 0}
+        for shard in range(shards)
+    ]).on_conflict_do_nothing(constraint="uq_stock_shard"))
+
+def increment_stock_shard(db: Session, product_id: int, warehouse_id: int, quantity: int, shards: int):
+    """随机选一个当前未被锁定的分片累加"""
+    shard = models.StockShard
+    target = db.query(shard.id).filter(
+        shard.product_id == product_id,
+        shard.warehouse_id == warehouse_id
+    ).order_by(func.random()).limit(1).with_for_update(skip_locked=True).scalar()
+    
+    if target is None:
+        # 分片行全部被占用时随机等待一个分片；尚未创建时先补齐
+        if not db.query(shard.id).filter(
+            shard.product_id == product_id,
+            shard.warehouse_id == warehouse_id
+        ).first():
+            ensure_stock_shards(db, product_id, warehouse_id, shards)
+        target = db.query(shard.id).filter(
+            shard.product_id == product_id,
+            shard.warehouse_id == warehouse_id,
+            shard.shard == random.randrange(shards)
+        ).scalar()
+    
+    db.query(shard).filter(shard.id == target).update(
+        {shard.quantity: shard.quantity + quantity}, synchronize_session=False
+    )
+
+def decrement_stock_shards(db: Session, product_id: int, warehouse_id: int, quantity: int) -> bool:
+    """
+    从分片扣减库存，任何分片都不会变为负数
+    
+    1. 随机逐个锁定空闲且有余量的分片（SKIP LOCKED，不等待），直到余量足够；
+    2. 不够时回滚到保存点释放已锁分片，等待一个余量足够的随机分片；
+    3. 仍不满足时按分片号顺序锁定全部分片做最终判断。
+    等待锁时最多持有按固定顺序获取的分片锁，不会与其他扣减形成死锁。
+    """
+    shard = models.StockShard
+    candidates = db.query(shard).filter(
+        shard.product_id == product_id,
+        shard.warehouse_id == warehouse_id,
+        shard.quantity > 0
+    )
+    
+    savepoint = db.begin_nested()
+    rows = []
+    available = 0
+    while available < quantity:
+        row = candidates.filter(
+            shard.id.notin_([locked.id for locked in rows])
+        ).order_by(func.random()).limit(1).with_for_update(skip_locked=True).first()
+        if row is None:
+            break
+        rows.append(row)
+        available += row.quantity
+    
+    if available >= quantity:
+        savepoint.commit()
+    else:
+        savepoint.rollback()
+        row = candidates.filter(
+            shard.quantity >= quantity
+        ).order_by(func.random()).limit(1).with_for_update().first()
+        if row is not None:
+            rows = [row]
+        else:
+            rows = candidates.order_by(shard.shard).with_for_update().all()
+            if sum(row.quantity for row in rows) < quantity:
+                return False
+    
+    remaining = quantity
+    for row in rows:
+        taken = min(row.quantity, remaining)
+        row.quantity -= taken
+        remaining -= taken
+        if remaining == 0:
+            break
+    return True
+
+def transfer_stock_shards(
+    db: Session,
+    product_id: int,
+    from_warehouse_id: int,
+    to_warehouse_id: int,
+    quantity: int,
+    shards: int
+) -> bool:
+    """
+    分片商品调拨，源仓库余量不足时返回 False
+    
+    按 (仓库ID, 分片号) 顺序一次锁定两端的全部分片，方向相反的调拨按同一顺序加锁，
+    不会互相等待形成死锁。
+    """
+    shard = models.StockShard
+    ensure_stock_shards(db, product_id, to_warehouse_id, shards)
+    rows = db.query(shard).filter(
+        shard.product_id == product_id,
+        shard.warehouse_id.in_([from_warehouse_id, to_warehouse_id])
+    ).order_by(shard.warehouse_id, shard.shard).with_for_update().all()
+    
+    sources = [row for row in rows if row.warehouse_id == from_warehouse_id]
+    if sum(row.quantity for row in sources) < quantity:
+        return False
+    
+    remaining = quantity
+    for row in sorted(sources, key=lambda row: row.quantity, reverse=True):
+        taken = min(row.quantity, remaining)
+        row.quantity -= taken
+        remaining -= taken
+        if remaining == 0:
+            break
+    random.choice([row for row in rows if row.warehouse_id == to_warehouse_id]).quantity += quantity
+    return True
+
+def sum_stock_shards(db: Session, product_id: int, warehouse_id: int) -> int:
+    """分片库存求和"""
+    return db.query(func.coalesce(func.sum(models.StockShard.quantity), 0)).filter(
+        models.StockShard.product_id == product_id,
+        models.StockShard.warehouse_id == warehouse_id
+    ).scalar()
+
+def configure_stock_sharding(db: Session, product_id: int, shards: int):
+    """
+    开启/调整/关闭商品的分片库存计数
     
+    持有排他咨询锁，等待进行中的出入库提交，期间新的出入库会等待；
+    分片按当前流水数量重新均分，shards=0 时关闭。
+    """
+    db.execute(select(func.pg_advisory_xact_lock(shard_config_lock_key(product_id))))
+    product = db.query(models.Product).filter(models.Product.id == product_id).first()
+    if not product:
+        raise HTTPException(status_code=404, detail="Product not found")
+    
+    db.query(models.StockShard).filter(
+        models.StockShard.product_id == product_id
+    ).delete(synchronize_session=False)
+    
+    if shards:
+        for (_, warehouse_id), quantity in get_stock_levels(db, product_id=product_id).items():
+            base, extra = divmod(max(quantity, 0), shards)
+            db.bulk_insert_mappings(models.StockShard, [
+                {
+                    "product_id": product_id,
+                    "warehouse_id": warehouse_id,
+                    "shard": shard,
+                    "quantity": base + (1 if shard < extra else 0)
+                }
+                for shard in range(shards)
+            ])
+    
+    product.stock_shards = shards
     db.commit()
-    return db_transfer
+    db.refresh(product)
+    return product
+
+def get_stock_levels(
+    db: Session,
+    product_id: Optional[int] = None,
+    warehouse_id: Optional[int] = None,
+    as_of: Optional[datetime] = None
+) -> Dict[Tuple[int, int], int]:
+    """按 最近快照 + 之后的流水 计算库存数量，as_of 指定时查询历史时点"""
+    snapshot = models.StockSnapshot
+    ledger = models.StockLedgerEntry
+    
+    snapshot_query = db.query(
+        snapshot.product_id,
+        snapshot.warehouse_id,
+        snapshot.quantity,
+        snapshot.ledger_entry_id
+    ).distinct(
+        snapshot.product_id, snapshot.warehouse_id
+    ).order_by(
+        snapshot.product_id, snapshot.warehouse_id, snapshot.ledger_entry_id.desc()
+    )
+    tail_filters = []
+    
+    if product_id:
+        snapshot_query = snapshot_query.filter(snapshot.product_id == product_id)
+        tail_filters.append(ledger.product_id == product_id)
+    if warehouse_id:
+        snapshot_query = snapshot_query.filter(snapshot.warehouse_id == warehouse_id)
+        tail_filters.append(ledger.warehouse_id == warehouse_id)
+    if as_of:
+        snapshot_query = snapshot_query.filter(snapshot.as_of <= as_of)
+        tail_filters.append(ledger.created_at <= as_of)
+    
+    latest = snapshot_query.subquery()
+    tail = db.query(
+        ledger.product_id,
+        ledger.warehouse_id,
+        func.sum(ledger.quantity_change).label('change')
+    ).outerjoin(
+        latest,
+        and_(latest.c.product_id == ledger.product_id, latest.c.warehouse_id == ledger.warehouse_id)
+    ).filter(
+        ledger.id > func.coalesce(latest.c.ledger_entry_id, 0),
+        *tail_filters
+    ).group_by(ledger.product_id, ledger.warehouse_id)
+    
+    levels = defaultdict(int)
+    for row in db.query(latest).all():
+        levels[(row.product_id, row.warehouse_id)] += row.quantity
+    for row in tail.all():
+        levels[(row.product_id, row.warehouse_id)] += row.change
+    return levels
+
+def get_stock_quantity(db: Session, product_id: int, warehouse_id: int, as_of: Optional[datetime] = None) -> int:
+    """获取单个 商品×仓库 的库存数量"""
+    if as_of is None:
+        sharded = db.query(models.Product.stock_shards).filter(models.Product.id == product_id).scalar()
+        if sharded:
+            return sum_stock_shards(db, product_id, warehouse_id)
+    
+    levels = get_stock_levels(db, product_id=product_id, warehouse_id=warehouse_id, as_of=as_of)
+    return levels.get((product_id, warehouse_id), 0)
+
+def apply_ledger_quantities(db: Session, stocks: list, product_id: Optional[int] = None):
+    """用流水计算的实时数量覆盖库存行的物化数量（不标记为修改）"""
+    levels = get_stock_levels(db, product_id=product_id)
+    for stock in stocks:
+        set_committed_value(stock, "quantity", levels.get((stock.product_id, stock.warehouse_id), 0))
+    return stocks
+
+def create_stock_snapshots(db: Session) -> int:
+    """
+    为有新流水的 商品×仓库 生成快照，并刷新库存行的物化数量
+    
+    只覆盖 SNAPSHOT_SAFETY_LAG 之前写入的流水，避免遗漏尚未提交的长事务。
+    历史库存行的期初流水由迁移 0001 在切换到流水读取之前一次性回填。
+    """
+    snapshot = models.StockSnapshot
+    ledger = models.StockLedgerEntry
+    
+    cutoff = datetime.utcnow() - SNAPSHOT_SAFETY_LAG
+    latest = db.query(
+        snapshot.product_id,
+        snapshot.warehouse_id,
+        snapshot.quantity,
+        snapshot.ledger_entry_id
+    ).distinct(
+        snapshot.product_id, snapshot.warehouse_id
+    ).order_by(
+        snapshot.product_id, snapshot.warehouse_id, snapshot.ledger_entry_id.desc()
+    ).subquery()
+    
+    pending = db.query(
+        ledger.product_id,
+        ledger.warehouse_id,
+        func.coalesce(func.max(latest.c.quantity), 0).label('base_quantity'),
+        func.sum(ledger.quantity_change).label('change'),
+        func.max(ledger.id).label('last_entry_id'),
+        func.max(ledger.created_at).label('as_of')
+    ).outerjoin(
+        latest,
+        and_(latest.c.product_id == ledger.product_id, latest.c.warehouse_id == ledger.warehouse_id)
+    ).filter(
+        ledger.id > func.coalesce(latest.c.ledger_entry_id, 0),
+        ledger.created_at < cutoff
+    ).group_by(ledger.product_id, ledger.warehouse_id).all()
+    
+    for row in pending:
+        quantity = row.base_quantity + row.change
+        db.add(snapshot(
+            product_id=row.product_id,
+            warehouse_id=row.warehouse_id,
+            quantity=quantity,
+            ledger_entry_id=row.last_entry_id,
+            as_of=row.as_of
+        ))
+        db.query(models.Stock).filter(
+            models.Stock.product_id == row.product_id,
+            models.Stock.warehouse_id == row.warehouse_id
+        ).update({models.Stock.quantity: quantity}, synchronize_session=False)
+    
+    db.commit()
+    return len(pending)
+
+def record_daily_movement(
+    db: Session,
+    product_id: int,
+    warehouse_id: int,
+    inbound: int = 0,
+    outbound: int = 0,
+    day: Optional[date] = None,
+    shards: int = 0
+):
+    """增量更新日汇总表，与出入库在同一事务中提交；分片商品随机写入一个分片行"""
+    # 重建进行中时等待其提交，避免增量落在被重建删除或覆盖的行上
+    db.execute(select(func.pg_advisory_xact_lock_shared(DAILY_MOVEMENT_LOCK_KEY)))
+    table = models.DailyStockMovement.__table__
+    stmt = pg_insert(table).values(
+        day=day or datetime.utcnow().date(),
+        product_id=product_id,
+        warehouse_id=warehouse_id,
+        shard=random.randrange(shards) if shards else 0,
+        inbound_quantity=inbound,
+        outbound_quantity=outbound,
+        net_quantity=inbound - outbound,
+        updated_at=datetime.utcnow()
+    )
+    stmt = stmt.on_conflict_do_update(
+        constraint="uq_daily_stock_movement",
+        set_={
+            "inbound_quantity": table.c.inbound_quantity + stmt.excluded.inbound_quantity,
+            "outbound_quantity": table.c.outbound_quantity + stmt.excluded.outbound_quantity,
+            "net_quantity": table.c.net_quantity + stmt.excluded.net_quantity,
+            "updated_at": stmt.excluded.updated_at
+        }
+    )
+    db.execute(stmt)
+
+def rebuild_daily_movements(db: Session, start_date: date, end_date: date):
+    """
+    从出入库流水重建指定日期范围内的日汇总（补数任务）
+    
+    持排他咨询锁直到提交：已持共享锁的出入库事务先提交，其提交的流水在之后的读取中可见；
+    之后的增量更新等待重建提交后再累加。
+    """
+    db.execute(select(func.pg_advisory_xact_lock(DAILY_MOVEMENT_LOCK_KEY)))
+    totals = defaultdict(lambda: [0, 0])
+    
+    for record_model, index in ((models.InboundRecord, 0), (models.OutboundRecord, 1)):
+        day = func.date(record_model.created_at)
+        rows = db.query(
+            day.label('day'),
+            record_model.product_id,
+            record_model.warehouse_id,
+            func.sum(record_model.quantity).label('total')
+        ).filter(
+            day.between(start_date, end_date)
+        ).group_by(day, record_model.product_id, record_model.warehouse_id).all()
+        
+        for row in rows:
+            totals[(row.day, row.product_id, row.warehouse_id)][index] += row.total or 0
+    
+    db.query(models.DailyStockMovement).filter(
+        models.DailyStockMovement.day.between(start_date, end_date)
+    ).delete(synchronize_session=False)
+    
+    db.bulk_insert_mappings(models.DailyStockMovement, [
+        {
+            "day": day,
+            "product_id": product_id,
+            "warehouse_id": warehouse_id,
+            "inbound_quantity": total_in,
+            "outbound_quantity": total_out,
+            "net_quantity": total_in - total_out
+        }
+        for (day, product_id, warehouse_id), (total_in, total_out) in totals.items()
+    ])
+    db.commit()
+    return len(totals)
 
 def get_stock_statistics(db: Session, start_date: datetime, end_date: datetime):
-    """获取库存统计数据"""
+    """获取库存统计数据（按日汇总表计算）"""
+    rollup = models.DailyStockMovement
+    day_range = rollup.day.between(start_date.date(), end_date.date())
+    
     inbound_stats = db.query(
-        models.InboundRecord.product_id,
-        func.sum(models.InboundRecord.quantity).label('total_in')
+        rollup.product_id,
+        func.sum(rollup.inbound_quantity).label('total_in')
     ).filter(
-        models.InboundRecord.created_at.between(start_date, end_date)
-    ).group_by(models.InboundRecord.product_id).all()
+        day_range,
+        rollup.inbound_quantity > 0
+    ).group_by(rollup.product_id).all()
     
     outbound_stats = db.query(
-        models.OutboundRecord.product_id,
-        func.sum(models.OutboundRecord.quantity).label('total_out')
+        rollup.product_id,
+        func.sum(rollup.outbound_quantity).label('total_out')
     ).filter(
-        models.OutboundRecord.created_at.between(start_date, end_date)
-    ).group_by(models.OutboundRecord.product_id).all()
+        day_range,
+        rollup.outbound_quantity > 0
+    ).group_by(rollup.product_id).all()
     
     return {
         "inbound": inbound_stats,
         "outbound": outbound_stats
     }
 
+def get_stock_trend(
+    db: Session,
+    start_date: datetime,
+    end_date: datetime,
+    granularity: str = "day",
+    product_id: Optional[int] = None,
+    warehouse_id: Optional[int] = None
+):
+    """获取库存变化趋势（日/周/月）"""
+    rollup = models.DailyStockMovement
+    period = func.date_trunc(granularity, rollup.day)
+    
+    query = db.query(
+        period.label('period'),
+        func.sum(rollup.inbound_quantity).label('inbound'),
+        func.sum(rollup.outbound_quantity).label('outbound'),
+        func.sum(rollup.net_quantity).label('net')
+    ).filter(
+        rollup.day.between(start_date.date(), end_date.date())
+    )
+    
+    if product_id:
+        query = query.filter(rollup.product_id == product_id)
+    if warehouse_id:
+        query = query.filter(rollup.warehouse_id == warehouse_id)
+    
+    return query.group_by(period).order_by(period).all()
+
 def get_operation_logs(
     db: Session, 
     start_date: Optional[datetime] = None,
     end_date: Optional[datetime] = None,
-    operation_type: Optional[str] = None
+    operation_type: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: int = 100,
+    columns: Optional[list] = None
 ):
-    query = db.query(models.OperationLog)
+    query = db.query(*columns) if columns else db.query(models.OperationLog)
     
     if start_date:
         query = query.filter(models.OperationLog.created_at >= start_date)
@@ -224,7 +745,61 @@ def get_operation_logs(
     if operation_type:
         query = query.filter(models.OperationLog.operation_type == operation_type)
         
-    return query.order_by(models.OperationLog.created_at.desc()).all()
+    return keyset_paginate(
+        query,
+        [models.OperationLog.created_at, models.OperationLog.id],
+        cursor=cursor,
+        limit=limit,
+        descending=True
+    )
+
+def get_inbound_records(
+    db: Session,
+    product_id: Optional[int] = None,
+    warehouse_id: Optional[int] = None,
+    cursor: Optional[str] = None,
+    limit: int = 100,
+    columns: Optional[list] = None
+):
+    """获取入库流水（游标分页）"""
+    query = db.query(*columns) if columns else db.query(models.InboundRecord)
+    
+    if product_id:
+        query = query.filter(models.InboundRecord.product_id == product_id)
+    if warehouse_id:
+        query = query.filter(models.InboundRecord.warehouse_id == warehouse_id)
+    
+    return keyset_paginate(
+        query,
+        [models.InboundRecord.created_at, models.InboundRecord.id],
+        cursor=cursor,
+        limit=limit,
+        descending=True
+    )
+
+def get_outbound_records(
+    db: Session,
+    product_id: Optional[int] = None,
+    warehouse_id: Optional[int] = None,
+    cursor: Optional[str] = None,
+    limit: int = 100,
+    columns: Optional[list] = None
+):
+    """获取出库流水（游标分页）"""
+    query = db.query(*columns) if columns else db.query(models.OutboundRecord)
+    
+    if product_id:
+        query = query.filter(models.OutboundRecord.product_id == product_id)
+    if warehouse_id:
+        query = query.filter(models.OutboundRecord.warehouse_id == warehouse_id)
+    
+    return keyset_paginate(
+        query,
+        [models.OutboundRecord.created_at, models.OutboundRecord.id],
+        cursor=cursor,
+        limit=limit,
+        descending=True
+    )
 
 def process_barcode(db: Session, barcode_info: schemas.BarcodeInfo):
     """处理条码扫描"""
@@ -279,6 +854,7 @@ def export_stock_data(db: Session, warehouse_id: Optional[int], category: Option
         query = query.filter(models.Product.category == category)
     
     results = query.all()
+    levels = get_stock_levels(db, warehouse_id=warehouse_id)
     
     # 创建CSV文件
     file_path = f"temp/stock_report_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
@@ -297,7 +873,7 @@ def export_stock_data(db: Session, warehouse_id: Optional[int], category: Option
                 product.name,
                 product.category,
                 warehouse.name,
-                stock.quantity,
+                levels.get((stock.product_id, stock.warehouse_id), 0),
                 stock.shelf_number,
                 stock.expiry_date.strftime('%Y-%m-%d')
             ])
@@ -374,51 +950,111 @@ def export_transactions(
     
     return file_path
 
-def queue_offline_operation(db: Session, operation_type: str, data: dict):
-    """将离线操作加入同步队列"""
-    sync_item = models.SyncQueue(
+def queue_offline_operation(db: Session, operation_type: str, data: dict, idempotency_key: Optional[str] = None):
+    """
+    将离线操作加入同步队列
+    
+    给出 idempotency_key 时同一操作只入队一次，客户端重复上传返回已有的条目
+    """
+    if idempotency_key is None:
+        sync_item = models.SyncQueue(operation_type=operation_type, data=json.dumps(data), status="pending")
+        db.add(sync_item)
+        db.commit()
+        db.refresh(sync_item)
+        return sync_item
+    
+    db.execute(pg_insert(models.SyncQueue.__table__).values(
         operation_type=operation_type,
-        data=json.dumps(data)
-    )
-    db.add(sync_item)
+        data=json.dumps(data),
+        status="pending",
+        idempotency_key=idempotency_key,
+        retry_count=0,
+        created_at=datetime.utcnow()
+    ).on_conflict_do_nothing(index_elements=["idempotency_key"]))
     db.commit()
-    db.refresh(sync_item)
-    return sync_item
+    return db.query(models.SyncQueue).filter(models.SyncQueue.idempotency_key == idempotency_key).one()
+
+def sync_backoff(attempts: int) -> timedelta:
+    """第 attempts 次失败后的等待时间，在指数上限的一半到全部之间抖动，避免失败的条目同时重试"""
+    delay = min(SYNC_BACKOFF_MAX, SYNC_BACKOFF_BASE * 2 ** (attempts - 1))
+    return delay * random.uniform(0.5, 1.0)
 
-def process_sync_queue(db: Session):
-    """处理同步队列"""
-    pending_items = db.query(models.SyncQueue).filter(
+def claim_sync_items(db: Session, batch_size: int):
+    """
+    按入队顺序认领一批到期的待处理条目
+    
+    行锁持有到本批提交；其他同步进程跳过已锁定的行，多个进程并行时每条只会被处理一次
+    """
+    return db.query(models.SyncQueue).filter(
         models.SyncQueue.status == "pending",
-        models.SyncQueue.retry_count < 3
-    ).all()
+        or_(models.SyncQueue.next_attempt_at.is_(None), models.SyncQueue.next_attempt_at <= datetime.utcnow())
+    ).order_by(models.SyncQueue.id).limit(batch_size).with_for_update(skip_locked=True).all()
+
+def apply_sync_item(db: Session, item: models.SyncQueue):
+    """重放一条离线操作；数据格式错误或操作类型未知时抛出 ValueError"""
+    data = json.loads(item.data)
+    if item.operation_type == "inbound":
+        operator_id = data.pop("operator_id", None)
+        if operator_id is None:
+            raise ValueError("inbound sync item is missing operator_id")
+        create_inbound_record(db, schemas.InboundRecordCreate(**data), operator_id)
+    elif item.operation_type == "outbound":
+        create_outbound_record(db, schemas.OutboundRecordCreate(**data))
+    else:
+        raise ValueError(f"Unsupported sync operation: {item.operation_type}")
+
+def process_sync_queue(db: Session, batch_size: int = SYNC_BATCH_SIZE) -> Dict[str, int]:
+    """
+    处理一批同步队列条目，整批在一个事务中提交
     
-    for item in pending_items:
-        try:
-            data = json.loads(item.data)
-            if item.operation_type == "inbound":
-                create_inbound_record(db, schemas.InboundRecordCreate(**data))
-            elif item.operation_type == "outbound":
-                create_outbound_record(db, schemas.OutboundRecordCreate(**data))
-            
-            item.status = "synced"
-        except Exception as e:
-            item.status = "failed"
-            item.retry_count += 1
-        
-        item.last_attempt = datetime.utcnow()
+    每条操作在各自的保存点中重放（crud 内部的 commit 只提交保存点），失败只回滚该条；
+    状态与重放结果一起提交，提交成功的条目不会被再次处理，整批提交失败时全部留待重试。
+    ValueError 视为永久失败，其余错误按退避重试，达到 SYNC_MAX_ATTEMPTS 后标记为 failed。
+    """
+    now = datetime.utcnow()
+    results = {"claimed": 0, "synced": 0, "retried": 0, "failed": 0}
+    try:
+        items = claim_sync_items(db, batch_size)
+        for item in items:
+            db.begin_nested()
+            try:
+                apply_sync_item(db, item)
+            except Exception as e:
+                while db.in_nested_transaction():
+                    db.rollback()
+                item.retry_count += 1
+                item.last_error = f"{type(e).__name__}: {e}"[:500]
+                if isinstance(e, ValueError) or item.retry_count >= SYNC_MAX_ATTEMPTS:
+                    item.status = "failed"
+                    results["failed"] += 1
+                else:
+                    item.next_attempt_at = now + sync_backoff(item.retry_count)
+                    results["retried"] += 1
+            else:
+                item.status = "synced"
+                item.last_error = None
+                results["synced"] += 1
+            item.last_attempt = now
+        results["claimed"] = len(items)
         db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    return results
 
 def get_inventory_analysis(db: Session, days: int = 90):
     """获取库存分析数据"""
     end_date = datetime.utcnow()
     start_date = end_date - timedelta(days=days)
     
-    # 获取当前库存
-    current_stocks = db.query(
-        models.Stock.product_id,
-        models.Product.name,
-        func.sum(models.Stock.quantity).label('current_stock')
-    ).join(models.Product).group_by(models.Stock.product_id, models.Product.name).all()
+    # 获取当前库存（按库存流水计算）
+    current_stock = defaultdict(int)
+    for (product_id, _), quantity in get_stock_levels(db).items():
+        current_stock[product_id] += quantity
+    
+    products = db.query(models.Product.id, models.Product.name).filter(
+        models.Product.id.in_(list(current_stock))
+    ).all()
     
     # 获取消耗数据
     outbound_data = db.query(
@@ -430,16 +1066,17 @@ def get_inventory_analysis(db: Session, days: int = 90):
     ).group_by(models.OutboundRecord.product_id).all()
     
     analysis_results = []
-    for stock in current_stocks:
-        outbound = next((o for o in outbound_data if o.product_id == stock.product_id), None)
+    for product in products:
+        stock_quantity = current_stock[product.id]
+        outbound = next((o for o in outbound_data if o.product_id == product.id), None)
         if outbound:
             monthly_consumption = (outbound.total_out * 30) / days
-            turnover_rate = outbound.total_out / stock.current_stock if stock.current_stock > 0 else 0
+            turnover_rate = outbound.total_out / stock_quantity if stock_quantity > 0 else 0
             
             analysis_results.append({
-                "product_id": stock.product_id,
-                "product_name": stock.name,
-                "current_stock": stock.current_stock,
+                "product_id": product.id,
+                "product_name": product.name,
+                "current_stock": stock_quantity,
                 "avg_monthly_consumption": monthly_consumption,
                 "turnover_rate": turnover_rate,
                 "suggested_reorder_point": int(monthly_consumption * 1.5),  # 1.5个月的库存
@@ -502,6 +1139,7 @@ def perform_backup(db: Session, backup_id: int):
     try:
         # 创建备份文件名
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        BACKUP_DIR.mkdir(exist_ok=True)
         backup_file = BACKUP_DIR / f"backup_{backup_record.backup_type}_{timestamp}.sql"
         
         # 执行pg_dump
@@ -543,8 +1181,17 @@ def restore_from_backup(db: Session, backup_id: int):
     except Exception as e:
         raise HTTPException(status_code=500, detail="Restore failed")
 
-def get_backup_records(db: Session):
+def get_backup_records(
+    db: Session,
+    cursor: Optional[str] = None,
+    limit: int = 100,
+    columns: Optional[list] = None
+):
     """获取备份记录列表"""
-    return db.query(models.BackupRecord).order_by(
-        models.BackupRecord.created_at.desc()
-    ).all() 
\ No newline at end of file
+    return keyset_paginate(
+        db.query(*columns) if columns else db.query(models.BackupRecord),
+        [models.BackupRecord.created_at, models.BackupRecord.id],
+        cursor=cursor,
+        limit=limit,
+        descending=True
+    ) 
\ No newline at end of file
@@ -1,19 +1,85 @@
 import logging
 from elasticsearch import Elasticsearch
+from prometheus_client import Counter, Gauge, Histogram
+from ..monitoring.tracing import current_trace_id
 from datetime import datetime
+from queue import Empty, Full, Queue
+import glob
 import json
-from typing import Dict, Any
+import random
+import sys
+import tempfile
+import threading
+import time
+from typing import Dict, Any, List, Optional
 import os
 
+# 单个 bulk 请求最多包含的日志条数与字节数，先到者为准
+LOG_SHIP_BATCH_SIZE = int(os.getenv("LOG_SHIP_BATCH_SIZE", "500"))
+LOG_SHIP_BATCH_BYTES = int(os.getenv("LOG_SHIP_BATCH_BYTES", str(5 * 1024 * 1024)))
+# 未凑满一批时最长等待多久发送（秒）
+LOG_SHIP_FLUSH_INTERVAL = float(os.getenv("LOG_SHIP_FLUSH_INTERVAL", "2"))
+LOG_SHIP_MAX_RETRIES = int(os.getenv("LOG_SHIP_MAX_RETRIES", "5"))
+LOG_SHIP_RETRY_BACKOFF = float(os.getenv("LOG_SHIP_RETRY_BACKOFF", "0.5"))
+LOG_SHIP_TIMEOUT = float(os.getenv("LOG_SHIP_TIMEOUT", "10"))
+# 内存缓冲上限（条），写满后按溢出策略处理：drop 丢弃新日志，spill 写入本地磁盘稍后补发
+LOG_BUFFER_SIZE = int(os.getenv("LOG_BUFFER_SIZE", "10000"))
+LOG_OVERFLOW_POLICY = os.getenv("LOG_OVERFLOW_POLICY", "drop")
+LOG_SPILL_DIR = os.getenv("LOG_SPILL_DIR", os.path.join(tempfile.gettempdir(), "warehouse-log-spill"))
+LOG_SPILL_MAX_BYTES = int(os.getenv("LOG_SPILL_MAX_BYTES", str(100 * 1024 * 1024)))
+
+# 发送日志本身产生的日志不再送回缓冲，避免自我放大
+_INTERNAL_LOGGERS = ("elasticsearch", "elastic_transport", "urllib3")
+
+LOG_RECORDS_SHIPPED = Counter(
+    "log_shipper_records_shipped_total",
+    "Log records indexed in Elasticsearch"
+)
+
+LOG_RECORDS_DROPPED = Counter(
+    "log_shipper_records_dropped_total",
+    "Log records discarded before reaching Elasticsearch",
+    ["reason"]
+)
+
+LOG_RECORDS_SPILLED = Counter(
+    "log_shipper_records_spilled_total",
+    "Log records written to the local spill directory"
+)
+
+LOG_BULK_REQUESTS = Counter(
+    "log_shipper_bulk_requests_total",
+    "Bulk requests sent to Elasticsearch",
+    ["outcome"]
+)
+
+LOG_BULK_LATENCY = Histogram(
+    "log_shipper_bulk_duration_seconds",
+    "Elasticsearch bulk request latency",
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+)
+
+LOG_BUFFERED = Gauge(
+    "log_shipper_buffered_records",
+    "Log records waiting in the in-memory buffer",
+    multiprocess_mode="livesum"
+)
+
 class LogCollector:
     def __init__(self):
-        self.es = Elasticsearch([os.getenv("ELASTICSEARCH_URL", "http://elasticsearch:9200")])
+        self.es = Elasticsearch(
+            [os.getenv("ELASTICSEARCH_URL", "http://elasticsearch:9200")],
+            request_timeout=LOG_SHIP_TIMEOUT,
+            # 重试由 LogShipper 负责
+            max_retries=0
+        )
         self.index_prefix = "warehouse-logs-"
-    
+        self._formatter = logging.Formatter()
+
     def get_index_name(self) -> str:
         """获取当前日期的索引名"""
         return f"{self.index_prefix}{datetime.now().strftime('%Y.%m.%d')}"
-    
+
     def format_log(self, record: logging.LogRecord) -> Dict[str, Any]:
         """格式化日志记录"""
         return {
@@ -24,11 +90,11 @@ class LogCollector:
             "path": record.pathname,
             "line_number": record.lineno,
             "function": record.funcName,
-            "exception": record.exc_info[1] if record.exc_info else None,
-            "trace_id": getattr(record, "trace_id", None),
+            "exception": self._formatter.formatException(record.exc_info) if record.exc_info else None,
+            "trace_id": getattr(record, "trace_id", None) or current_trace_id(),
             "service": os.getenv("SERVICE_NAME", "warehouse-api")
         }
-    
+
     def send_to_elasticsearch(self, log_data: Dict[str, Any]):
         """发送日志到Elasticsearch"""
         try:
@@ -39,14 +105,318 @@ class LogCollector:
         except Exception as e:
             print(f"Failed to send log to Elasticsearch: {e}")
 
+    def send_bulk(self, documents: List[Dict[str, Any]]) -> List[int]:
+        """批量写入，返回每条日志的状态码；请求失败时抛出异常"""
+        index = self.get_index_name()
+        operations = []
+        for document in documents:
+            operations.append({"index": {"_index": index}})
+            operations.append(document)
+        response = self.es.bulk(operations=operations)
+        if not response.get("errors"):
+            return [201] * len(documents)
+        return [item["index"].get("status", 500) for item in response["items"]]
+
+class LogShipper:
+    """
+    后台批量发送日志
+
+    submit() 只把日志放入有界内存缓冲，不做任何网络请求；后台线程按条数、字节数
+    或 flush_interval 凑批，通过 bulk 请求写入 Elasticsearch。
+    - 请求失败或单条返回 429/5xx 时按指数退避重试，其余单条错误（如映射冲突）直接丢弃；
+    - 缓冲写满或重试耗尽时，overflow="spill" 将日志追加到 spill_dir 下的 .ndjson 文件，
+      写满或关闭后改名为 .ndjson.ready；缓冲空闲时逐个补发 .ready 文件。目录可由多个
+      进程共享：只补发已关闭的文件，通过重命名认领，磁盘配额按目录实际大小计算；
+      overflow="drop" 或磁盘配额用尽时丢弃并计数。
+    """
+
+    def __init__(
+        self,
+        collector: Optional[LogCollector] = None,
+        batch_size: int = LOG_SHIP_BATCH_SIZE,
+        batch_bytes: int = LOG_SHIP_BATCH_BYTES,
+        flush_interval: float = LOG_SHIP_FLUSH_INTERVAL,
+        buffer_size: int = LOG_BUFFER_SIZE,
+        overflow: str = LOG_OVERFLOW_POLICY,
+        spill_dir: str = LOG_SPILL_DIR,
+        spill_max_bytes: int = LOG_SPILL_MAX_BYTES,
+        max_retries: int = LOG_SHIP_MAX_RETRIES,
+        retry_backoff: float = LOG_SHIP_RETRY_BACKOFF
+    ):
+        if overflow not in ("drop", "spill"):
+            raise ValueError(f"unknown log overflow policy: {overflow}")
+        self.collector = collector or LogCollector()
+        self.batch_size = batch_size
+        self.batch_bytes = batch_bytes
+        self.flush_interval = flush_interval
+        self.overflow = overflow
+        self.spill_dir = spill_dir
+        self.spill_max_bytes = spill_max_bytes
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self._queue = Queue(maxsize=buffer_size)
+        # 已提交但尚未发送完成的条数，供 flush() 等待
+        self._unfinished = 0
+        self._unfinished_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._spill_lock = threading.Lock()
+        self._spill_file = None
+        self._spill_lines = 0
+        self._spill_seq = 0
+        self._spill_bytes = 0
+        if overflow == "spill":
+            os.makedirs(spill_dir, exist_ok=True)
+            self._recover_orphaned_spill_files()
+            self._spill_bytes = self._spill_dir_bytes()
+
+    @property
+    def thread_ident(self) -> Optional[int]:
+        return self._thread.ident if self._thread is not None else None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="log-shipper", daemon=True)
+        self._thread.start()
+
+    def submit(self, document: Dict[str, Any]) -> bool:
+        """放入缓冲，从不阻塞；缓冲已满时按溢出策略处理并返回 False"""
+        with self._unfinished_lock:
+            self._unfinished += 1
+        try:
+            self._queue.put_nowait(document)
+            return True
+        except Full:
+            self._done(1)
+        if self.overflow == "spill":
+            self._spill([document])
+        else:
+            LOG_RECORDS_DROPPED.labels("buffer_full").inc()
+        return False
+
+    def flush(self, timeout: float = 10.0) -> bool:
+        """等待缓冲中的日志发送完成（或溢出），返回是否在超时前完成"""
+        deadline = time.monotonic() + timeout
+        while self._unfinished and time.monotonic() < deadline:
+            time.sleep(0.01)
+        return not self._unfinished
+
+    def close(self, timeout: float = 10.0):
+        """发送缓冲中剩余的日志后停止后台线程"""
+        self.flush(timeout)
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        with self._spill_lock:
+            self._close_spill_file()
+
+    def _done(self, count: int):
+        with self._unfinished_lock:
+            self._unfinished -= count
+
+    def _run(self):
+        while not (self._stop.is_set() and self._queue.empty()):
+            batch = self._collect()
+            LOG_BUFFERED.set(self._queue.qsize())
+            if batch:
+                try:
+                    failed = self._send(batch, self.max_retries)
+                    if failed:
+                        self._overflow(failed)
+                finally:
+                    self._done(len(batch))
+            elif self.overflow == "spill" and not self._stop.is_set():
+                self._replay_spill()
+
+    def _collect(self) -> List[Dict[str, Any]]:
+        """取一批日志：第一条最多等待 flush_interval，之后凑满条数或字节数，或等到 flush_interval 截止"""
+        try:
+            first = self._queue.get(timeout=self.flush_interval)
+        except Empty:
+            return []
+        batch, size = [first], len(json.dumps(first, default=str))
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size and size < self.batch_bytes:
+            remaining = deadline - time.monotonic()
+            if self._stop.is_set():
+                remaining = 0
+            try:
+                document = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except Empty:
+                break
+            batch.append(document)
+            size += len(json.dumps(document, default=str))
+        return batch
+
+    def _send(self, documents: List[Dict[str, Any]], retries: int) -> List[Dict[str, Any]]:
+        """发送一批日志，返回重试耗尽后仍未写入的日志"""
+        for attempt in range(retries + 1):
+            if attempt:
+                delay = random.uniform(0, self.retry_backoff * 2 ** (attempt - 1))
+                # 停止时不再等待退避，剩余日志交给溢出策略
+                if self._stop.wait(delay):
+                    break
+            start = time.perf_counter()
+            try:
+                statuses = self.collector.send_bulk(documents)
+            except Exception as e:
+                LOG_BULK_REQUESTS.labels("error").inc()
+                print(f"Failed to ship {len(documents)} logs to Elasticsearch: {e}", file=sys.stderr)
+                continue
+            LOG_BULK_LATENCY.observe(time.perf_counter() - start)
+
+            retry = []
+            for document, status in zip(documents, statuses):
+                if status < 300:
+                    LOG_RECORDS_SHIPPED.inc()
+                elif status == 429 or status >= 500:
+                    retry.append(document)
+                else:
+                    LOG_RECORDS_DROPPED.labels("rejected").inc()
+            LOG_BULK_REQUESTS.labels("partial" if retry else "success").inc()
+            if not retry:
+                return []
+            documents = retry
+        return documents
+
+    def _overflow(self, documents: List[Dict[str, Any]]):
+        if self.overflow == "spill":
+            self._spill(documents)
+        else:
+            LOG_RECORDS_DROPPED.labels("retries_exhausted").inc(len(documents))
+
+    def _spill_files(self) -> List[str]:
+        """已关闭、可以补发的溢出文件，按创建时间排序"""
+        return sorted(glob.glob(os.path.join(self.spill_dir, "*.ndjson.ready")))
+
+    def _spill_dir_bytes(self) -> int:
+        """溢出目录中所有文件（含其他进程正在写入和补发的）的总大小"""
+        size = 0
+        for path in glob.glob(os.path.join(self.spill_dir, "*.ndjson*")):
+            try:
+                size += os.path.getsize(path)
+            except OSError:
+                # 已被其他进程补发删除
+                pass
+        return size
+
+    def _recover_orphaned_spill_files(self):
+        """已退出进程留下的写入中或认领中的文件改回 .ready，交给存活的进程补发"""
+        for path in glob.glob(os.path.join(self.spill_dir, "*.ndjson*")):
+            name = os.path.basename(path)
+            if name.endswith(".ndjson"):
+                # {时间}-{pid}-{序号}.ndjson
+                owner, ready = name.split("-")[1], f"{path}.ready"
+            elif ".ndjson.ready." in name:
+                # 认领时追加 .{pid}
+                ready, owner = path.rsplit(".", 1)
+            else:
+                continue
+            if owner.isdigit() and not _process_alive(int(owner)):
+                try:
+                    os.rename(path, ready)
+                except OSError:
+                    pass
+
+    def _close_spill_file(self):
+        if self._spill_file is not None:
+            self._spill_file.close()
+            try:
+                os.rename(self._spill_file.name, f"{self._spill_file.name}.ready")
+            except OSError as e:
+                print(f"Failed to release spill file {self._spill_file.name}: {e}", file=sys.stderr)
+            self._spill_file = None
+            self._spill_lines = 0
+
+    def _spill(self, documents: List[Dict[str, Any]]):
+        """追加到当前溢出文件；每个文件最多 batch_size 条，补发时一个文件对应一次 bulk 请求"""
+        lines = [json.dumps(document, default=str) + "\n" for document in documents]
+        size = sum(len(line) for line in lines)
+        with self._spill_lock:
+            if self._spill_bytes + size > self.spill_max_bytes:
+                LOG_RECORDS_DROPPED.labels("spill_full").inc(len(documents))
+                return
+            try:
+                for line in lines:
+                    if self._spill_file is None:
+                        self._spill_seq += 1
+                        name = f"{time.time_ns()}-{os.getpid()}-{self._spill_seq}.ndjson"
+                        self._spill_file = open(os.path.join(self.spill_dir, name), "a", encoding="utf-8")
+                    self._spill_file.write(line)
+                    self._spill_lines += 1
+                    if self._spill_lines >= self.batch_size:
+                        self._close_spill_file()
+                if self._spill_file is not None:
+                    self._spill_file.flush()
+            except OSError as e:
+                print(f"Failed to spill logs to {self.spill_dir}: {e}", file=sys.stderr)
+                LOG_RECORDS_DROPPED.labels("spill_error").inc(len(documents))
+                return
+            self._spill_bytes += size
+        LOG_RECORDS_SPILLED.inc(len(documents))
+
+    def _replay_spill(self):
+        """补发最早的一个已关闭的溢出文件，只尝试一次；失败的日志重新写回溢出目录"""
+        with self._spill_lock:
+            paths = self._spill_files()
+            if not paths and self._spill_file is not None:
+                self._close_spill_file()
+                paths = self._spill_files()
+            # 其他进程的写入与补发也改变目录大小，每轮按实际大小校正
+            self._spill_bytes = self._spill_dir_bytes()
+        if not paths:
+            return
+
+        claimed = f"{paths[0]}.{os.getpid()}"
+        try:
+            os.rename(paths[0], claimed)
+        except OSError:
+            # 已被其他进程认领
+            return
+        with open(claimed, encoding="utf-8") as f:
+            documents = [json.loads(line) for line in f if line.strip()]
+        size = os.path.getsize(claimed)
+        failed = self._send(documents, 0)
+        os.remove(claimed)
+        with self._spill_lock:
+            self._spill_bytes = max(0, self._spill_bytes - size)
+        if failed:
+            self._spill(failed)
+
+def _process_alive(pid: int) -> bool:
+    if pid == os.getpid():
+        # 本进程刚启动，同 pid 的文件属于已退出的旧进程
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
 class ElasticsearchHandler(logging.Handler):
-    def __init__(self):
+    def __init__(self, shipper: Optional[LogShipper] = None):
         super().__init__()
-        self.collector = LogCollector()
-    
+        self.shipper = shipper or LogShipper()
+        self.collector = self.shipper.collector
+        self.shipper.start()
+
     def emit(self, record):
+        # 请求线程只做格式化和入队，发送由后台线程完成
+        if record.name.startswith(_INTERNAL_LOGGERS) or record.thread == self.shipper.thread_ident:
+            return
         try:
-            log_data = self.collector.format_log(record)
-            self.collector.send_to_elasticsearch(log_data)
+            self.shipper.submit(self.collector.format_log(record))
         except Exception as e:
-            print(f"Failed to emit log: {e}") 
\ No newline at end of file
+            print(f"Failed to emit log: {e}")
+
+    def flush(self):
+        self.shipper.flush()
+
+    def close(self):
+        self.shipper.close()
+        super().close()
@@ -1,23 +1,34 @@
-from fastapi import FastAPI, Depends, HTTPException, Security, BackgroundTasks, Request
+from fastapi import FastAPI, Depends, HTTPException, Security, BackgroundTasks, Request, Header, Query
 from sqlalchemy.orm import Session
+from sqlalchemy.exc import OperationalError
 from typing import List, Optional
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from fastapi.responses import FileResponse
+from starlette.concurrency import run_in_threadpool
 import csv
+import logging
 import os
 from datetime import datetime, timedelta
-from . import crud, models, schemas, security
+from . import crud, models, schemas, security, versioning
+from .cache import close_redis_clients
+from .queue.rabbitmq import close_publisher
+from .queue.async_rabbitmq import messaging
 from .database import SessionLocal, engine
+from .schema import upgrade_schema
+from .stock_snapshots import run_snapshot_job
+from .pagination import MAX_PAGE_SIZE
+from .serialization import list_response, schema_columns
 from fastapi.openapi.utils import get_openapi
 from fastapi.middleware.cors import CORSMiddleware
 from prometheus_client import make_asgi_app
-from .middleware import performance_middleware
-from .middleware.security import security_middleware
+from .middleware import RequestPipelineMiddleware
+from .middleware.compression import CompressionMiddleware
+from .monitoring.metrics import metrics_registry
 from .security_config import security_settings
-from .security.middleware import security_middleware
+from .security.middleware import rate_limiter, rate_limit_redis_client
 from .security.config import security_config
 
-models.Base.metadata.create_all(bind=engine)
+logger = logging.getLogger(__name__)
 
 app = FastAPI(
     title="Warehouse Management System",
@@ -38,7 +49,7 @@ app = FastAPI(
 )
 
 # 创建Prometheus metrics endpoint
-metrics_app = make_asgi_app()
+metrics_app = make_asgi_app(metrics_registry())
 
 # 配置CORS
 app.add_middleware(
@@ -49,6 +60,43 @@ app.add_middleware(
     allow_headers=security_config.CORS_HEADERS,
 )
 
+# 响应压缩（JSON 列表与 CSV 导出）
+app.add_middleware(CompressionMiddleware)
+
+# 安全头部、限流与请求指标在同一个纯ASGI中间件中完成，位于最外层
+app.add_middleware(
+    RequestPipelineMiddleware,
+    rate_limiter=rate_limiter if security_config.RATE_LIMIT_ENABLED else None,
+    security_headers=security_config.SECURITY_HEADERS,
+    ip_whitelist=security_config.IP_WHITELIST,
+    ip_blacklist=security_config.IP_BLACKLIST,
+)
+
+# 建表与外部连接放在启动阶段，导入 app.main 不访问数据库和 Redis
+@app.on_event("startup")
+def init_dependencies():
+    try:
+        upgrade_schema(engine)
+    except OperationalError as e:
+        # 数据库暂不可用时照常启动，由健康检查和请求重试暴露问题
+        logger.error(f"Database unavailable at startup, schema upgrade skipped: {e}")
+    rate_limiter.bind_redis(rate_limit_redis_client())
+
+@app.on_event("startup")
+async def start_messaging():
+    # 后台连接 RabbitMQ，代理不可用时不阻塞启动
+    await messaging.start()
+
+@app.on_event("shutdown")
+async def stop_messaging():
+    await messaging.close()
+
+@app.on_event("shutdown")
+def close_dependencies():
+    close_publisher()
+    close_redis_clients()
+    engine.dispose()
+
 # Dependency
 def get_db():
     db = SessionLocal()
@@ -58,30 +106,63 @@ def get_db():
         db.close()
 
 @app.post("/users/", response_model=schemas.User)
-def create_user(user: schemas.UserCreate, db: Session = Depends(get_db)):
-    db_user = crud.get_user_by_username(db, username=user.username)
+async def create_user(user: schemas.UserCreate, db: Session = Depends(get_db)):
+    db_user = await run_in_threadpool(crud.get_user_by_username, db, user.username)
     if db_user:
         raise HTTPException(status_code=400, detail="Username already registered")
-    return crud.create_user(db=db, user=user)
+    # bcrypt 在独立的有界线程池中计算，不阻塞事件循环
+    hashed_password = await security.password_hasher.hash(user.password)
+    return await run_in_threadpool(crud.create_user, db, user, hashed_password)
 
 @app.get("/products/", response_model=List[schemas.Product])
-def read_products(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    products = crud.get_products(db, skip=skip, limit=limit)
-    return products
+def read_products(
+    request: Request,
+    skip: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    db: Session = Depends(get_db)
+):
+    """商品列表，支持 If-None-Match 条件请求"""
+    etag, not_modified = versioning.check_not_modified(request, versioning.CATALOG)
+    if not_modified:
+        return not_modified
+    
+    products, next_cursor = crud.get_products(
+        db, skip=skip, limit=limit, cursor=cursor,
+        columns=schema_columns(models.Product, schemas.Product)
+    )
+    return list_response(products, schemas.Product, next_cursor, etag=etag)
 
 @app.post("/products/", response_model=schemas.Product)
 def create_product(
     product: schemas.ProductCreate, 
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(security.check_permissions("admin"))
+    current_user: security.Principal = Depends(security.check_permissions("admin"))
 ):
     return crud.create_product(db=db, product=product)
 
+@app.put("/products/{product_id}/stock-shards")
+def configure_stock_sharding(
+    product_id: int,
+    shards: int,
+    db: Session = Depends(get_db),
+    current_user: security.Principal = Depends(security.check_permissions("admin"))
+):
+    """
+    为热点商品开启分片库存计数
+    
+    - **shards**: 分片数，0 表示关闭
+    """
+    if shards < 0:
+        raise HTTPException(status_code=400, detail="shards must be non-negative")
+    product = crud.configure_stock_sharding(db, product_id, shards)
+    return {"product_id": product.id, "stock_shards": product.stock_shards}
+
 @app.post("/inbound/", response_model=schemas.InboundRecord)
 def create_inbound_record(
     inbound: schemas.InboundRecordCreate, 
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(security.check_permissions("warehouse"))
+    current_user: security.Principal = Depends(security.check_permissions("warehouse"))
 ):
     return crud.create_inbound_record(db=db, inbound=inbound, operator_id=current_user.id)
 
@@ -89,36 +170,98 @@ def create_inbound_record(
 def create_outbound_record(
     outbound: schemas.OutboundRecordCreate, 
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(security.check_permissions("warehouse"))
+    current_user: security.Principal = Depends(security.check_permissions("warehouse"))
 ):
     return crud.create_outbound_record(db=db, outbound=outbound, operator_id=current_user.id)
 
+@app.get("/inbound/", response_model=List[schemas.InboundRecord])
+def read_inbound_records(
+    product_id: Optional[int] = None,
+    warehouse_id: Optional[int] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=MAX_PAGE_SIZE),
+    db: Session = Depends(get_db),
+    current_user: security.Principal = Depends(security.check_permissions("warehouse"))
+):
+    """入库流水，下一页游标见响应头 X-Next-Cursor"""
+    records, next_cursor = crud.get_inbound_records(
+        db, product_id=product_id, warehouse_id=warehouse_id, cursor=cursor, limit=limit,
+        columns=schema_columns(models.InboundRecord, schemas.InboundRecord)
+    )
+    return list_response(records, schemas.InboundRecord, next_cursor)
+
+@app.get("/outbound/", response_model=List[schemas.OutboundRecord])
+def read_outbound_records(
+    product_id: Optional[int] = None,
+    warehouse_id: Optional[int] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=MAX_PAGE_SIZE),
+    db: Session = Depends(get_db),
+    current_user: security.Principal = Depends(security.check_permissions("warehouse"))
+):
+    """出库流水，下一页游标见响应头 X-Next-Cursor"""
+    records, next_cursor = crud.get_outbound_records(
+        db, product_id=product_id, warehouse_id=warehouse_id, cursor=cursor, limit=limit,
+        columns=schema_columns(models.OutboundRecord, schemas.OutboundRecord)
+    )
+    return list_response(records, schemas.OutboundRecord, next_cursor)
+
 @app.get("/stock/{product_id}", response_model=List[schemas.Stock])
-def read_product_stock(product_id: int, db: Session = Depends(get_db)):
+def read_product_stock(request: Request, product_id: int, db: Session = Depends(get_db)):
+    """商品库存，支持 If-None-Match 条件请求"""
+    etag, not_modified = versioning.check_not_modified(request, versioning.stock_resource(product_id))
+    if not_modified:
+        return not_modified
+    
     stocks = crud.get_product_stock(db, product_id=product_id)
-    return stocks
+    return list_response(stocks, schemas.Stock, etag=etag)
+
+@app.get("/stock/{product_id}/as-of", response_model=List[schemas.StockLevel])
+def read_product_stock_as_of(
+    product_id: int,
+    at: datetime,
+    warehouse_id: Optional[int] = None,
+    db: Session = Depends(get_db)
+):
+    """查询指定时点的库存（最近快照 + 之后的流水）"""
+    levels = crud.get_stock_levels(db, product_id=product_id, warehouse_id=warehouse_id, as_of=at)
+    return [
+        {"product_id": pid, "warehouse_id": wid, "quantity": quantity, "as_of": at}
+        for (pid, wid), quantity in sorted(levels.items())
+    ]
+
+@app.post("/stock/snapshots")
+def create_stock_snapshots(
+    background_tasks: BackgroundTasks,
+    current_user: security.Principal = Depends(security.check_permissions("admin"))
+):
+    """立即生成一轮库存快照；快照平时由 app.stock_snapshots 定时生成"""
+    # 后台任务在响应之后执行，使用自己的会话，不复用请求的会话
+    background_tasks.add_task(run_snapshot_job)
+    return {"message": "Stock snapshot started"}
 
 @app.post("/token", response_model=schemas.Token)
-async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends()):
-    user = crud.authenticate_user(form_data.username, form_data.password)
+async def login_for_access_token(
+    form_data: OAuth2PasswordRequestForm = Depends(),
+    db: Session = Depends(get_db)
+):
+    user = await security.authenticate_user(db, form_data.username, form_data.password)
     if not user:
         raise HTTPException(
             status_code=401,
             detail="Incorrect username or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    access_token = security.create_access_token(
-        data={"sub": user.username}
-    )
+    access_token = security.create_user_access_token(user)
     return {"access_token": access_token, "token_type": "bearer"}
 
 @app.get("/stock/warnings", response_model=List[schemas.StockWarning])
 def get_stock_warnings(db: Session = Depends(get_db)):
-    return crud.get_stock_warnings(db)
+    return list_response(crud.get_stock_warnings(db), schemas.StockWarning)
 
 @app.get("/stock/expiry-warnings", response_model=List[schemas.ExpiryWarning])
 def get_expiry_warnings(db: Session = Depends(get_db)):
-    return crud.get_expiry_warnings(db)
+    return list_response(crud.get_expiry_warnings(db), schemas.ExpiryWarning)
 
 @app.post("/stock/transfer", response_model=schemas.StockTransfer)
 def transfer_stock(
@@ -135,6 +278,53 @@ def get_stock_statistics(
 ):
     return crud.get_stock_statistics(db, start_date, end_date)
 
+@app.get("/statistics/trend", response_model=List[schemas.StockTrendPoint])
+def get_stock_trend(
+    start_date: datetime,
+    end_date: datetime,
+    granularity: schemas.TrendGranularity = schemas.TrendGranularity.DAY,
+    product_id: Optional[int] = None,
+    warehouse_id: Optional[int] = None,
+    db: Session = Depends(get_db)
+):
+    """
+    库存变化趋势
+    
+    - **granularity**: 统计粒度 (day/week/month)
+    """
+    return crud.get_stock_trend(
+        db,
+        start_date,
+        end_date,
+        granularity=granularity.value,
+        product_id=product_id,
+        warehouse_id=warehouse_id
+    )
+
+@app.post("/statistics/rebuild")
+def rebuild_stock_statistics(
+    start_date: datetime,
+    end_date: datetime,
+    background_tasks: BackgroundTasks,
+    current_user: security.Principal = Depends(security.check_permissions("admin"))
+):
+    """从出入库流水重建日汇总表"""
+    # 后台任务在响应之后执行，使用自己的会话，不复用请求的会话
+    background_tasks.add_task(run_statistics_rebuild, start_date.date(), end_date.date())
+    return {"message": "Statistics rebuild started"}
+
+def run_statistics_rebuild(start_date, end_date, session_factory=SessionLocal):
+    """在独立会话中重建日汇总，失败时回滚并记录日志"""
+    db = session_factory()
+    try:
+        count = crud.rebuild_daily_movements(db, start_date, end_date)
+        logger.info(f"Rebuilt {count} daily stock movement rows from {start_date} to {end_date}")
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Statistics rebuild failed: {e}")
+    finally:
+        db.close()
+
 @app.get("/statistics/supplier")
 def get_supplier_statistics(
     start_date: datetime,
@@ -148,22 +338,28 @@ def get_operation_logs(
     start_date: Optional[datetime] = None,
     end_date: Optional[datetime] = None,
     operation_type: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=MAX_PAGE_SIZE),
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(security.check_permissions("admin"))
+    current_user: security.Principal = Depends(security.check_permissions("admin"))
 ):
-    return crud.get_operation_logs(
+    logs, next_cursor = crud.get_operation_logs(
         db, 
         start_date=start_date, 
         end_date=end_date, 
-        operation_type=operation_type
+        operation_type=operation_type,
+        cursor=cursor,
+        limit=limit,
+        columns=schema_columns(models.OperationLog, schemas.OperationLog)
     )
+    return list_response(logs, schemas.OperationLog, next_cursor)
 
 # 条码扫描
 @app.post("/barcode/scan", response_model=schemas.BarcodeResponse)
 def scan_barcode(
     barcode_info: schemas.BarcodeInfo,
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(security.check_permissions("warehouse"))
+    current_user: security.Principal = Depends(security.check_permissions("warehouse"))
 ):
     return crud.process_barcode(db, barcode_info)
 
@@ -173,7 +369,7 @@ def export_stock_data(
     warehouse_id: Optional[int] = None,
     category: Optional[str] = None,
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(security.check_permissions("admin"))
+    current_user: security.Principal = Depends(security.check_permissions("admin"))
 ):
     file_path = crud.export_stock_data(db, warehouse_id, category)
     return FileResponse(
@@ -187,7 +383,7 @@ def export_transactions(
     end_date: datetime,
     transaction_type: Optional[str] = None,
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(security.check_permissions("admin"))
+    current_user: security.Principal = Depends(security.check_permissions("admin"))
 ):
     file_path = crud.export_transactions(db, start_date, end_date, transaction_type)
     return FileResponse(
@@ -200,34 +396,37 @@ def export_transactions(
 def add_to_sync_queue(
     operation_type: str,
     data: dict,
+    idempotency_key: Optional[str] = Header(None),
     db: Session = Depends(get_db)
 ):
-    return crud.queue_offline_operation(db, operation_type, data)
+    """离线客户端重传时带上同一个 Idempotency-Key，操作只入队一次"""
+    return crud.queue_offline_operation(db, operation_type, data, idempotency_key)
 
 @app.post("/sync/process")
 def process_sync_queue(
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(security.check_permissions("admin"))
+    current_user: security.Principal = Depends(security.check_permissions("admin"))
 ):
-    crud.process_sync_queue(db)
-    return {"message": "Sync queue processed"}
+    """立即处理一批到期条目；队列由 app.sync_worker 持续处理，此接口只用于手动触发"""
+    results = crud.process_sync_queue(db)
+    return {"message": "Sync queue batch processed", **results}
 
 # 高级分析
 @app.get("/analysis/inventory", response_model=List[schemas.InventoryAnalysis])
 def get_inventory_analysis(
     days: int = 90,
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(security.check_permissions("admin"))
+    current_user: security.Principal = Depends(security.check_permissions("admin"))
 ):
-    return crud.get_inventory_analysis(db, days)
+    return list_response(crud.get_inventory_analysis(db, days), schemas.InventoryAnalysis)
 
 @app.get("/analysis/supplier", response_model=List[schemas.SupplierAnalysis])
 def get_supplier_analysis(
     days: int = 180,
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(security.check_permissions("admin"))
+    current_user: security.Principal = Depends(security.check_permissions("admin"))
 ):
-    return crud.get_supplier_analysis(db, days)
+    return list_response(crud.get_supplier_analysis(db, days), schemas.SupplierAnalysis)
 
 # 数据备份
 @app.post("/backup/create", response_model=schemas.BackupRecord)
@@ -235,7 +434,7 @@ def create_backup(
     backup_type: str,
     background_tasks: BackgroundTasks,
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(security.check_permissions("admin"))
+    current_user: security.Principal = Depends(security.check_permissions("admin"))
 ):
     """
     创建数据备份
@@ -251,7 +450,7 @@ def restore_backup(
     backup_id: int,
     background_tasks: BackgroundTasks,
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(security.check_permissions("admin"))
+    current_user: security.Principal = Depends(security.check_permissions("admin"))
 ):
     """
     从备份恢复数据
@@ -263,11 +462,17 @@ def restore_backup(
 
 @app.get("/backup/list", response_model=List[schemas.BackupRecord])
 def list_backups(
+    cursor: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=MAX_PAGE_SIZE),
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(security.check_permissions("admin"))
+    current_user: security.Principal = Depends(security.check_permissions("admin"))
 ):
     """获取备份记录列表"""
-    return crud.get_backup_records(db)
+    backups, next_cursor = crud.get_backup_records(
+        db, cursor=cursor, limit=limit,
+        columns=schema_columns(models.BackupRecord, schemas.BackupRecord)
+    )
+    return list_response(backups, schemas.BackupRecord, next_cursor)
 
 # 自定义OpenAPI文档
 def custom_openapi():
@@ -296,10 +501,6 @@ def custom_openapi():
 
 app.openapi = custom_openapi 
 
-@app.middleware("http")
-async def add_performance_middleware(request: Request, call_next):
-    return await performance_middleware(request, call_next)
-
 # 添加Prometheus metrics endpoint
 app.mount("/metrics", metrics_app)
 
@@ -315,7 +516,7 @@ async def health_check():
 # 添加系统状态检查
 @app.get("/status")
 async def system_status(
-    current_user: models.User = Depends(security.check_permissions("admin"))
+    current_user: security.Principal = Depends(security.check_permissions("admin"))
 ):
     return {
         "database": check_database_connection(),
@@ -324,6 +525,3 @@ async def system_status(
         "memory_usage": get_memory_usage(),
         "backup_status": get_last_backup_status()
     }
-
-# 添加安全中间件
-app.middleware("http")(security_middleware) 
\ No newline at end of file
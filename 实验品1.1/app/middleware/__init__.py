@@ -0,0 +1,144 @@
+import time
+import math
+import logging
+from typing import Dict, Iterable, Optional
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from ..monitoring.metrics import observe_request, route_template
+from ..monitoring.sql import start_statement_tracking
+from ..monitoring.tracing import REQUEST_SPAN_TIME, finish_trace, start_trace
+from ..rate_limit import RateLimiter
+
+# 设置日志
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# 超过该耗时的请求记为慢请求
+SLOW_REQUEST_SECONDS = 1.0
+
+class RequestPipelineMiddleware:
+    """
+    纯 ASGI 请求管线：IP 访问控制、限流、安全头部、追踪、指标与请求日志一次完成
+
+    直接包装 send 注入响应头，不经过 BaseHTTPMiddleware 的任务和队列，
+    流式响应按原样逐块转发。
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        rate_limiter: Optional[RateLimiter] = None,
+        security_headers: Optional[Dict[str, str]] = None,
+        ip_whitelist: Iterable[str] = (),
+        ip_blacklist: Iterable[str] = ()
+    ):
+        self.app = app
+        self.rate_limiter = rate_limiter
+        self.ip_whitelist = frozenset(ip_whitelist)
+        self.ip_blacklist = frozenset(ip_blacklist)
+        self.security_headers = [
+            (name.lower().encode("latin-1"), value.encode("latin-1"))
+            for name, value in (security_headers or {}).items()
+        ]
+        self.security_header_names = frozenset(name for name, _ in self.security_headers)
+
+    async def _reject(self, client_ip: str) -> Optional[JSONResponse]:
+        if client_ip in self.ip_blacklist:
+            return JSONResponse({"detail": "IP blocked"}, status_code=403)
+        if self.ip_whitelist and client_ip not in self.ip_whitelist:
+            return JSONResponse({"detail": "IP not allowed"}, status_code=403)
+        if self.rate_limiter is not None:
+            allowed, retry_after = await self.rate_limiter.allow_async(client_ip)
+            if not allowed:
+                return JSONResponse(
+                    {"detail": "Too many requests"},
+                    status_code=429,
+                    headers={"Retry-After": str(math.ceil(retry_after))}
+                )
+        return None
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start_time = time.perf_counter()
+        db_stats = start_statement_tracking()
+        trace = start_trace(scope["method"], traceparent=_header(scope, b"traceparent"))
+        request_id = _header(scope, b"x-request-id")
+        if request_id:
+            trace.root.attributes["request_id"] = request_id[:64]
+        client = scope.get("client")
+        client_ip = client[0] if client else ""
+        status_code = 500
+
+        async def send_wrapper(message: Message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                if self.security_headers:
+                    headers = [
+                        header for header in message.get("headers", [])
+                        if header[0].lower() not in self.security_header_names
+                    ]
+                    headers.extend(self.security_headers)
+                    message = {**message, "headers": headers}
+            await send(message)
+
+        error = None
+        try:
+            rejection = await self._reject(client_ip)
+            if rejection is not None:
+                await rejection(scope, receive, send_wrapper)
+            else:
+                await self.app(scope, receive, send_wrapper)
+        except Exception as e:
+            error = type(e).__name__
+            raise
+        finally:
+            if error is None and status_code >= 500:
+                error = f"HTTP {status_code}"
+            self._record(scope, status_code, time.perf_counter() - start_time, db_stats, trace, error)
+
+    def _record(self, scope: Scope, status_code: int, process_time: float, db_stats, trace, error):
+        method = scope["method"]
+        path = scope["path"]
+        endpoint = route_template(scope)
+
+        # 只有导出的追踪才作为指标样例，保证样例能在追踪后端查到
+        trace.root.attributes["status"] = status_code
+        kept = finish_trace(trace, name=f"{method} {endpoint}", error=error)
+        trace_id = trace.trace_id if kept else None
+
+        # 记录metrics（按路由模板聚合）
+        observe_request(scope, status_code, process_time, trace_id)
+        for kind, duration in trace.time_by_kind().items():
+            REQUEST_SPAN_TIME.labels(endpoint=endpoint, kind=kind).observe(
+                duration, exemplar={"trace_id": trace_id} if trace_id else None
+            )
+
+        # 请求日志附带SQL执行统计
+        db_summary = (
+            f"db_statements={db_stats.count} db_time={db_stats.duration * 1000:.1f}ms "
+            f"db_rows={db_stats.rows}"
+        )
+
+        # 记录慢请求
+        if process_time > SLOW_REQUEST_SECONDS:
+            logger.warning(
+                f"Slow request: {method} {path} "
+                f"took {process_time:.2f} seconds, {db_summary}",
+                extra={"trace_id": trace.trace_id}
+            )
+        else:
+            logger.info(
+                f"{method} {path} {status_code} "
+                f"{process_time * 1000:.1f}ms, {db_summary}",
+                extra={"trace_id": trace.trace_id}
+            )
+
+def _header(scope: Scope, name: bytes) -> Optional[str]:
+    for key, value in scope.get("headers", []):
+        if key == name:
+            return value.decode("latin-1")
+    return None
@@ -0,0 +1,226 @@
+import os
+import time
+import zlib
+import threading
+from typing import Optional
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+try:
+    import brotli
+except ImportError:  # 未安装时不协商 br
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # 未安装时不协商 zstd
+    zstandard = None
+
+# 小于该字节数的完整响应不压缩
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))
+# 每秒最多用于压缩的 CPU 秒数，超出后新响应不再压缩
+COMPRESSION_CPU_BUDGET = float(os.getenv("COMPRESSION_CPU_BUDGET", "0.5"))
+# 超过该字节数的完整响应在线程池中压缩，避免阻塞事件循环
+COMPRESSION_OFFLOAD_SIZE = 256 * 1024
+
+GZIP_LEVEL = int(os.getenv("COMPRESSION_GZIP_LEVEL", "5"))
+BROTLI_QUALITY = int(os.getenv("COMPRESSION_BROTLI_QUALITY", "4"))
+ZSTD_LEVEL = int(os.getenv("COMPRESSION_ZSTD_LEVEL", "3"))
+
+COMPRESSIBLE_TYPES = (
+    "application/json",
+    "application/javascript",
+    "application/xml",
+    "text/",
+)
+
+class _GzipEncoder:
+    def __init__(self):
+        self._compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes, final: bool) -> bytes:
+        if final:
+            return self._compressor.compress(data) + self._compressor.flush()
+        return self._compressor.compress(data) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+class _BrotliEncoder:
+    def __init__(self):
+        self._compressor = brotli.Compressor(quality=BROTLI_QUALITY, mode=brotli.MODE_TEXT)
+
+    def compress(self, data: bytes, final: bool) -> bytes:
+        if final:
+            return self._compressor.process(data) + self._compressor.finish()
+        return self._compressor.process(data) + self._compressor.flush()
+
+class _ZstdEncoder:
+    def __init__(self):
+        self._compressor = zstandard.ZstdCompressor(level=ZSTD_LEVEL).compressobj()
+
+    def compress(self, data: bytes, final: bool) -> bytes:
+        if final:
+            return self._compressor.compress(data) + self._compressor.flush()
+        return self._compressor.compress(data) + self._compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+# 服务端偏好顺序：压缩率相近时 zstd 与 brotli 的解压和压缩都更快
+ENCODERS = [
+    (name, encoder) for name, encoder, available in (
+        ("zstd", _ZstdEncoder, zstandard is not None),
+        ("br", _BrotliEncoder, brotli is not None),
+        ("gzip", _GzipEncoder, True),
+    ) if available
+]
+
+def negotiate_encoding(accept_encoding: str) -> Optional[str]:
+    """按 Accept-Encoding（含 q 值）选择服务端支持的编码，q 值相同时按服务端偏好"""
+    accepted = {}
+    for item in accept_encoding.split(","):
+        parts = item.strip().split(";")
+        name = parts[0].strip().lower()
+        if not name:
+            continue
+        q = 1.0
+        for param in parts[1:]:
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        accepted[name] = q
+
+    best, best_q = None, 0.0
+    for name, _ in ENCODERS:
+        q = accepted.get(name, accepted.get("*", 0.0))
+        if q > best_q:
+            best, best_q = name, q
+    return best
+
+class CPUBudget:
+    """压缩耗时的令牌桶：每秒补充 budget 秒，耗尽时跳过压缩"""
+
+    def __init__(self, budget: float):
+        self.budget = budget
+        self._available = budget
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            now = time.monotonic()
+            self._available = min(self.budget, self._available + (now - self._updated) * self.budget)
+            self._updated = now
+            return self._available > 0
+
+    def charge(self, seconds: float):
+        with self._lock:
+            self._available -= seconds
+
+class CompressionMiddleware:
+    """
+    纯 ASGI 响应压缩
+
+    - 按 Accept-Encoding 协商 zstd / br / gzip，只压缩 JSON、文本与 CSV；
+    - 完整响应小于 minimum_size 时原样返回；
+    - 流式响应（含 FileResponse 导出）逐块压缩并刷新，客户端可边收边解；
+    - 压缩耗时计入 CPU 预算，预算耗尽时新响应暂不压缩。
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        minimum_size: int = COMPRESSION_MIN_SIZE,
+        cpu_budget: float = COMPRESSION_CPU_BUDGET
+    ):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.budget = CPUBudget(cpu_budget)
+        self.encoders = dict(ENCODERS)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        encoding = negotiate_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        responder = _CompressionResponder(self, encoding, send)
+        await self.app(scope, receive, responder.send)
+
+class _CompressionResponder:
+    def __init__(self, middleware: CompressionMiddleware, encoding: str, send: Send):
+        self.middleware = middleware
+        self.encoding = encoding
+        self._send = send
+        self.start_message: Optional[Message] = None
+        self.encoder = None
+        self.passthrough = False
+
+    async def send(self, message: Message):
+        if message["type"] == "http.response.start":
+            self.start_message = message
+            return
+        if message["type"] != "http.response.body" or self.passthrough:
+            await self._send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+
+        if self.encoder is None:
+            if not self._should_compress(body, more_body):
+                self.passthrough = True
+                await self._send(self.start_message)
+                await self._send(message)
+                return
+            self.encoder = self.middleware.encoders[self.encoding]()
+            if not more_body:
+                compressed = await self._compress(body, final=True)
+                self._rewrite_headers(content_length=len(compressed))
+                await self._send(self.start_message)
+                await self._send({"type": "http.response.body", "body": compressed})
+                return
+            self._rewrite_headers()
+            await self._send(self.start_message)
+
+        compressed = await self._compress(body, final=not more_body)
+        if compressed or not more_body:
+            await self._send({"type": "http.response.body", "body": compressed, "more_body": more_body})
+
+    def _should_compress(self, body: bytes, more_body: bool) -> bool:
+        headers = Headers(raw=self.start_message["headers"])
+        if self.start_message["status"] in (204, 304) or "content-encoding" in headers:
+            return False
+        content_type = headers.get("content-type", "")
+        if not content_type.startswith(COMPRESSIBLE_TYPES):
+            return False
+        if not more_body and len(body) < self.middleware.minimum_size:
+            return False
+        return self.middleware.budget.allow()
+
+    def _rewrite_headers(self, content_length: Optional[int] = None):
+        """设置编码相关头部；流式响应长度未知，去掉 Content-Length 改用分块传输"""
+        headers = MutableHeaders(raw=list(self.start_message["headers"]))
+        headers["Content-Encoding"] = self.encoding
+        headers.add_vary_header("Accept-Encoding")
+        if content_length is not None:
+            headers["Content-Length"] = str(content_length)
+        elif "content-length" in headers:
+            del headers["content-length"]
+        # 压缩后表示不同，强 ETag 降为弱 ETag
+        etag = headers.get("etag")
+        if etag and not etag.startswith("W/"):
+            headers["ETag"] = f"W/{etag}"
+        self.start_message = {**self.start_message, "headers": headers.raw}
+
+    async def _compress(self, body: bytes, final: bool) -> bytes:
+        start = time.perf_counter()
+        if len(body) >= COMPRESSION_OFFLOAD_SIZE:
+            compressed = await run_in_threadpool(self.encoder.compress, body, final)
+        else:
+            compressed = self.encoder.compress(body, final)
+        self.middleware.budget.charge(time.perf_counter() - start)
+        return compressed
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Enum
+from sqlalchemy import Column, Integer, String, Text, Float, DateTime, Date, ForeignKey, Enum, UniqueConstraint, Index, CheckConstraint, text
 from sqlalchemy.orm import relationship
 from sqlalchemy.ext.declarative import declarative_base
 from datetime import datetime
@@ -31,6 +31,7 @@ class Product(Base):
     unit = Column(String(20))
     price = Column(Float)
     min_stock = Column(Integer, default=0)  # 库存预警阈值
+    stock_shards = Column(Integer, default=0)  # 热点商品的库存分片数，0 表示不分片
     created_at = Column(DateTime, default=datetime.utcnow)
     
     stocks = relationship("Stock", back_populates="product")
@@ -47,11 +48,14 @@ class Warehouse(Base):
 
 class Stock(Base):
     __tablename__ = "stocks"
+    __table_args__ = (
+        UniqueConstraint("product_id", "warehouse_id", name="uq_stock_product_warehouse"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     product_id = Column(Integer, ForeignKey("products.id"))
     warehouse_id = Column(Integer, ForeignKey("warehouses.id"))
-    quantity = Column(Integer, default=0)
+    quantity = Column(Integer, default=0)  # 物化值，由快照任务刷新；实时数量以库存流水为准
     shelf_number = Column(String(50))  # 货架号
     expiry_date = Column(DateTime)
     
@@ -70,6 +74,9 @@ class Supplier(Base):
 
 class InboundRecord(Base):
     __tablename__ = "inbound_records"
+    __table_args__ = (
+        Index("ix_inbound_records_created_at_id", "created_at", "id"),  # 游标分页
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     product_id = Column(Integer, ForeignKey("products.id"))
@@ -84,6 +91,9 @@ class InboundRecord(Base):
 
 class OutboundRecord(Base):
     __tablename__ = "outbound_records"
+    __table_args__ = (
+        Index("ix_outbound_records_created_at_id", "created_at", "id"),  # 游标分页
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     product_id = Column(Integer, ForeignKey("products.id"))
@@ -96,6 +106,9 @@ class OutboundRecord(Base):
 
 class OperationLog(Base):
     __tablename__ = "operation_logs"
+    __table_args__ = (
+        Index("ix_operation_logs_created_at_id", "created_at", "id"),  # 游标分页
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     operation_type = Column(String(50))  # 操作类型：入库、出库、调拨等
@@ -107,17 +120,26 @@ class OperationLog(Base):
 
 class SyncQueue(Base):
     __tablename__ = "sync_queue"
+    __table_args__ = (
+        Index("ix_sync_queue_pending", "next_attempt_at", "id", postgresql_where=text("status = 'pending'")),  # 同步进程只扫描待处理的行
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     operation_type = Column(String(50))  # inbound, outbound, transfer, etc.
     data = Column(String(1000))  # JSON格式的操作数据
-    status = Column(String(20))  # pending, synced, failed
+    status = Column(String(20), default="pending")  # pending, synced, failed
+    idempotency_key = Column(String(100), unique=True, nullable=True)  # 客户端重复上传同一操作时只入队一次
     retry_count = Column(Integer, default=0)
     created_at = Column(DateTime, default=datetime.utcnow)
     last_attempt = Column(DateTime, nullable=True)
+    next_attempt_at = Column(DateTime, nullable=True)  # 失败后按指数退避推迟的下次处理时间
+    last_error = Column(String(500), nullable=True)
 
 class BackupRecord(Base):
     __tablename__ = "backup_records"
+    __table_args__ = (
+        Index("ix_backup_records_created_at_id", "created_at", "id"),  # 游标分页
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     backup_path = Column(String(500))
@@ -126,4 +148,80 @@ class BackupRecord(Base):
     operator_id = Column(Integer, ForeignKey("users.id"))
     created_at = Column(DateTime, default=datetime.utcnow)
     
-    operator = relationship("User") 
\ No newline at end of file
+    operator = relationship("User")
+
+class DailyStockMovement(Base):
+    """按 日×商品×仓库 汇总的出入库流水，随出入库增量更新"""
+    __tablename__ = "daily_stock_movements"
+    __table_args__ = (
+        UniqueConstraint("day", "product_id", "warehouse_id", "shard", name="uq_daily_stock_movement"),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    day = Column(Date, index=True)
+    product_id = Column(Integer, ForeignKey("products.id"), index=True)
+    warehouse_id = Column(Integer, ForeignKey("warehouses.id"))
+    shard = Column(Integer, default=0)  # 分片商品分散写入，读取时求和
+    inbound_quantity = Column(Integer, default=0)
+    outbound_quantity = Column(Integer, default=0)
+    net_quantity = Column(Integer, default=0)  # 入库 - 出库
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class StockLedgerEntry(Base):
+    """库存流水（只追加），每次库存变动一行"""
+    __tablename__ = "stock_ledger"
+    __table_args__ = (
+        Index("ix_stock_ledger_product_warehouse_id", "product_id", "warehouse_id", "id"),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    product_id = Column(Integer, ForeignKey("products.id"))
+    warehouse_id = Column(Integer, ForeignKey("warehouses.id"))
+    quantity_change = Column(Integer)  # 正数入、负数出
+    movement_type = Column(String(20))  # opening, inbound, outbound, transfer_in, transfer_out
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
+
+class StockSnapshot(Base):
+    """库存快照：截至某条流水的 商品×仓库 数量"""
+    __tablename__ = "stock_snapshots"
+    __table_args__ = (
+        Index("ix_stock_snapshots_product_warehouse_entry", "product_id", "warehouse_id", "ledger_entry_id"),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    product_id = Column(Integer, ForeignKey("products.id"))
+    warehouse_id = Column(Integer, ForeignKey("warehouses.id"))
+    quantity = Column(Integer)
+    ledger_entry_id = Column(Integer, ForeignKey("stock_ledger.id"))  # 已包含的最后一条流水
+    as_of = Column(DateTime)  # 已包含流水中最晚的时间
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+class StockShard(Base):
+    """热点商品的分片库存计数，数量分散在多行上，读取时求和"""
+    __tablename__ = "stock_shards"
+    __table_args__ = (
+        UniqueConstraint("product_id", "warehouse_id", "shard", name="uq_stock_shard"),
+        CheckConstraint("quantity >= 0", name="ck_stock_shard_non_negative"),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    product_id = Column(Integer, ForeignKey("products.id"))
+    warehouse_id = Column(Integer, ForeignKey("warehouses.id"))
+    shard = Column(Integer)
+    quantity = Column(Integer, default=0)
+
+class OutboxEvent(Base):
+    """事务性发件箱：与业务变更在同一事务中写入，由 OutboxRelay 发布到 RabbitMQ"""
+    __tablename__ = "outbox_events"
+    __table_args__ = (
+        Index("ix_outbox_events_unsent", "id", postgresql_where=text("sent_at IS NULL")),  # 中继只扫描未发送的行
+        Index("ix_outbox_events_sent_at", "sent_at"),  # 清理已发送的行
+    )
+    
+    id = Column(Integer, primary_key=True)
+    queue = Column(String(100))  # 目标队列
+    event_type = Column(String(50))  # stock.inbound, stock.outbound, stock.transfer, low_stock
+    payload = Column(Text)  # JSON格式的事件内容
+    attempts = Column(Integer, default=0)  # 发布失败次数
+    created_at = Column(DateTime, default=datetime.utcnow)
+    sent_at = Column(DateTime, nullable=True)  # 代理确认后写入
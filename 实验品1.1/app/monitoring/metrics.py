@@ -1,10 +1,22 @@
-from prometheus_client import Counter, Histogram, Gauge
+from prometheus_client import CollectorRegistry, Counter, Histogram, Gauge, REGISTRY, multiprocess
 from functools import wraps
 import time
-from typing import Dict, List
-import psutil
+import os
+from typing import Dict, List, Optional
 
-# 请求指标
+# 请求耗时直方图的桶边界（秒），可通过环境变量以逗号分隔覆盖
+HTTP_LATENCY_BUCKETS = tuple(
+    float(bucket) for bucket in os.getenv(
+        "HTTP_LATENCY_BUCKETS",
+        "0.005,0.01,0.025,0.05,0.1,0.25,0.5,1,2.5,5,10"
+    ).split(",")
+)
+
+# 未匹配任何路由的请求统一记到该标签下，避免任意路径产生新的时间序列
+UNMATCHED_ROUTE = "__unmatched__"
+KNOWN_METHODS = frozenset(["GET", "POST", "PUT", "PATCH", "DELETE", "HEAD", "OPTIONS"])
+
+# 请求指标：endpoint 标签为路由模板（如 /stock/{product_id}），而不是实际路径
 REQUEST_COUNT = Counter(
     "http_requests_total",
     "Total HTTP requests",
@@ -14,14 +26,77 @@ REQUEST_COUNT = Counter(
 REQUEST_LATENCY = Histogram(
     "http_request_duration_seconds",
     "HTTP request latency",
-    ["method", "endpoint"]
+    ["method", "endpoint"],
+    buckets=HTTP_LATENCY_BUCKETS
 )
 
+# 路由模板映射 {endpoint: 路由模板} 缓存在路由器对象上
+_TEMPLATES_ATTR = "_metrics_route_templates"
+
+def _collect_templates(routes, prefix: str, templates: dict):
+    for route in routes or []:
+        path = prefix + getattr(route, "path", "")
+        sub_routes = getattr(route, "routes", None)
+        if sub_routes:
+            _collect_templates(sub_routes, path, templates)
+        endpoint = getattr(route, "endpoint", None) or getattr(route, "app", None)
+        if endpoint is not None:
+            templates.setdefault(endpoint, path)
+
+def route_template(scope) -> str:
+    """返回请求匹配到的路由模板；须在路由完成后调用，未匹配时返回 UNMATCHED_ROUTE"""
+    endpoint = scope.get("endpoint")
+    router = getattr(scope.get("app"), "router", None)
+    if endpoint is None or router is None:
+        return UNMATCHED_ROUTE
+
+    templates = getattr(router, _TEMPLATES_ATTR, None)
+    if templates is None or endpoint not in templates:
+        # 首次请求或运行期新增了路由时重建
+        templates = {}
+        _collect_templates(router.routes, "", templates)
+        setattr(router, _TEMPLATES_ATTR, templates)
+    return templates.get(endpoint, UNMATCHED_ROUTE)
+
+def request_trace_id(scope) -> Optional[str]:
+    """从 traceparent 或 X-Request-ID 请求头中取出追踪ID，用作指标样例"""
+    request_id = None
+    for name, value in scope.get("headers", []):
+        if name == b"traceparent":
+            parts = value.decode("latin-1").split("-")
+            if len(parts) >= 2 and parts[1]:
+                return parts[1]
+        elif name in (b"x-request-id", b"x-trace-id"):
+            request_id = value.decode("latin-1")[:64]
+    return request_id
+
+# (method, endpoint, status) -> (计数器子项, 直方图子项)；标签取值有界，缓存大小也有界
+_request_children = {}
+
+def observe_request(scope, status_code: int, duration: float, trace_id: Optional[str] = None):
+    """按路由模板记录一次请求；带追踪ID时附加样例，便于从指标跳转到具体请求"""
+    method = scope["method"] if scope["method"] in KNOWN_METHODS else "OTHER"
+    endpoint = route_template(scope)
+    key = (method, endpoint, status_code)
+    children = _request_children.get(key)
+    if children is None:
+        children = (
+            REQUEST_COUNT.labels(method=method, endpoint=endpoint, status=status_code),
+            REQUEST_LATENCY.labels(method=method, endpoint=endpoint)
+        )
+        _request_children[key] = children
+
+    exemplar = {"trace_id": trace_id} if trace_id else None
+    children[0].inc(exemplar=exemplar)
+    children[1].observe(duration, exemplar=exemplar)
+    return endpoint
+
 # 业务指标
 STOCK_LEVEL = Gauge(
     "warehouse_stock_level",
     "Current stock level",
-    ["product_id", "warehouse_id"]
+    ["product_id", "warehouse_id"],
+    multiprocess_mode="liveall"
 )
 
 INBOUND_COUNT = Counter(
@@ -40,17 +115,34 @@ OUTBOUND_COUNT = Counter(
 SYSTEM_MEMORY = Gauge(
     "system_memory_usage_bytes",
     "System memory usage in bytes",
-    ["type"]
+    ["type"],
+    multiprocess_mode="liveall"
 )
 
 SYSTEM_CPU = Gauge(
     "system_cpu_usage_percent",
     "System CPU usage percentage",
-    ["cpu"]
+    ["cpu"],
+    multiprocess_mode="liveall"
 )
 
+def metrics_registry() -> CollectorRegistry:
+    """
+    /metrics 暴露的指标注册表
+
+    多 worker 部署时（见 app.server）各进程把指标写入 PROMETHEUS_MULTIPROC_DIR，
+    由 MultiProcessCollector 汇总，每次抓取都得到所有 worker 的合计，而不是随机一个 worker 的值。
+    """
+    if not os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        return REGISTRY
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return registry
+
 def collect_system_metrics():
     """收集系统指标"""
+    import psutil
+    
     # 内存使用
     memory = psutil.virtual_memory()
     SYSTEM_MEMORY.labels("total").set(memory.total)
@@ -66,23 +158,20 @@ def monitor_request():
     def decorator(func):
         @wraps(func)
         async def wrapper(*args, **kwargs):
-            method = kwargs.get("request").method
-            endpoint = kwargs.get("request").url.path
-            
+            request = kwargs.get("request")
             start_time = time.time()
+            status_code = 500
             try:
                 response = await func(*args, **kwargs)
-                REQUEST_COUNT.labels(
-                    method=method,
-                    endpoint=endpoint,
-                    status=response.status_code
-                ).inc()
+                status_code = response.status_code
                 return response
             finally:
-                REQUEST_LATENCY.labels(
-                    method=method,
-                    endpoint=endpoint
-                ).observe(time.time() - start_time)
+                observe_request(
+                    request.scope,
+                    status_code,
+                    time.time() - start_time,
+                    request_trace_id(request.scope)
+                )
         return wrapper
     return decorator
 
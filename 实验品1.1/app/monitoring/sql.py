@@ -0,0 +1,168 @@
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from prometheus_client import Counter, Histogram
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import ContextVar
+from typing import Any, Optional
+import hashlib
+import logging
+import random
+import re
+import time
+import os
+from .tracing import record_span
+
+logger = logging.getLogger(__name__)
+
+# 慢查询阈值与 EXPLAIN 采样率
+SLOW_QUERY_THRESHOLD_MS = float(os.getenv("SLOW_QUERY_THRESHOLD_MS", "200"))
+SLOW_QUERY_EXPLAIN_SAMPLE_RATE = float(os.getenv("SLOW_QUERY_EXPLAIN_SAMPLE_RATE", "0"))
+
+STATEMENT_LATENCY = Histogram(
+    "db_statement_duration_seconds",
+    "SQL statement latency",
+    ["operation", "fingerprint"],
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+)
+
+STATEMENT_ROWS = Histogram(
+    "db_statement_rows",
+    "Rows returned or affected per SQL statement",
+    ["operation", "fingerprint"],
+    buckets=(0, 1, 10, 100, 1000, 10000, 100000)
+)
+
+SLOW_STATEMENT_COUNT = Counter(
+    "db_slow_statements_total",
+    "SQL statements slower than the slow-query threshold",
+    ["operation", "fingerprint"]
+)
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r"\b\d+(?:\.\d+)?\b")
+_BIND_PARAM = re.compile(r"%\(\w+\)s|%s|:\w+|\?")
+_IN_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)")
+_COMMENT = re.compile(r"--[^\n]*|/\*.*?\*/", re.S)
+_WHITESPACE = re.compile(r"\s+")
+# 加行锁或咨询锁的语句往往因等锁而慢，EXPLAIN ANALYZE 重新执行会排在原事务之后，
+# 或抢走并发进程要认领的行，只能取不执行的估算计划
+_LOCKING = re.compile(r"\bfor\s+(?:no\s+key\s+|key\s+)?(?:update|share)\b|\bpg_(?:try_)?advisory", re.I)
+
+_current_stats: ContextVar[Optional["StatementStats"]] = ContextVar("sql_statement_stats", default=None)
+_explain_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sql-explain")
+
+class StatementStats:
+    """单个请求内的 SQL 执行统计"""
+    __slots__ = ("count", "duration", "rows")
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.rows = 0
+
+def normalize_statement(statement: str) -> str:
+    """将 SQL 归一化：去掉注释、字面量与参数，合并 IN 列表"""
+    normalized = _COMMENT.sub(" ", statement)
+    normalized = _STRING_LITERAL.sub("?", normalized)
+    normalized = _BIND_PARAM.sub("?", normalized)
+    normalized = _NUMBER_LITERAL.sub("?", normalized)
+    normalized = _IN_LIST.sub("(?+)", normalized)
+    return _WHITESPACE.sub(" ", normalized).strip().lower()
+
+def fingerprint_statement(statement: str) -> str:
+    """生成 SQL 指纹（归一化语句的短哈希），用作指标标签"""
+    return hashlib.md5(normalize_statement(statement).encode()).hexdigest()[:12]
+
+def statement_operation(statement: str) -> str:
+    """提取语句类型（select/insert/update/...）"""
+    parts = statement.lstrip().split(None, 1)
+    return parts[0].lower() if parts else "unknown"
+
+def redact_parameters(parameters: Any) -> Any:
+    """脱敏参数，只保留类型信息"""
+    if parameters is None:
+        return None
+    if isinstance(parameters, dict):
+        return {key: redact_parameters(value) for key, value in parameters.items()}
+    if isinstance(parameters, (list, tuple)):
+        return [redact_parameters(value) for value in parameters]
+    return f"<{type(parameters).__name__}>"
+
+def start_statement_tracking() -> StatementStats:
+    """为当前请求开启 SQL 统计"""
+    stats = StatementStats()
+    _current_stats.set(stats)
+    return stats
+
+def explain_command(statement: str) -> str:
+    """慢查询的 EXPLAIN 语句；加锁的语句不实际执行"""
+    if _LOCKING.search(statement):
+        return f"EXPLAIN {statement}"
+    return f"EXPLAIN (ANALYZE, BUFFERS) {statement}"
+
+def _explain(engine: Engine, statement: str, parameters: Any, fingerprint: str):
+    """在独立连接上采集执行计划，完成后回滚"""
+    connection = engine.raw_connection()
+    try:
+        cursor = connection.cursor()
+        cursor.execute(explain_command(statement), parameters)
+        plan = "\n".join(row[0] for row in cursor.fetchall())
+        logger.warning(f"Slow query plan [{fingerprint}]:\n{plan}")
+    except Exception as e:
+        logger.error(f"Failed to explain slow query [{fingerprint}]: {e}")
+    finally:
+        connection.rollback()
+        connection.close()
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start_time", []).append((statement, time.perf_counter()))
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["query_start_time"].pop()[1]
+    rows = max(cursor.rowcount, 0)
+    operation = statement_operation(statement)
+    fingerprint = fingerprint_statement(statement)
+
+    STATEMENT_LATENCY.labels(operation=operation, fingerprint=fingerprint).observe(elapsed)
+    STATEMENT_ROWS.labels(operation=operation, fingerprint=fingerprint).observe(rows)
+
+    stats = _current_stats.get()
+    if stats is not None:
+        stats.count += 1
+        stats.duration += elapsed
+        stats.rows += rows
+    record_span(operation, "db", elapsed, fingerprint=fingerprint, rows=rows)
+
+    if elapsed * 1000 < SLOW_QUERY_THRESHOLD_MS:
+        return
+
+    SLOW_STATEMENT_COUNT.labels(operation=operation, fingerprint=fingerprint).inc()
+    logger.warning(
+        f"Slow query [{fingerprint}] took {elapsed * 1000:.1f}ms, rows={rows}: "
+        f"{normalize_statement(statement)} params={redact_parameters(parameters)}"
+    )
+
+    if (
+        operation == "select"
+        and not executemany
+        and random.random() < SLOW_QUERY_EXPLAIN_SAMPLE_RATE
+    ):
+        _explain_executor.submit(_explain, conn.engine, statement, parameters, fingerprint)
+
+def _handle_error(exception_context):
+    # 语句执行失败时不会触发 after_cursor_execute，弹出对应的开始时间，避免计时栈在连接上累积；
+    # 连接或建游标阶段的失败发生在压栈之前，栈顶不是该语句时不处理
+    conn = exception_context.connection
+    if conn is None:
+        return
+    starts = conn.info.get("query_start_time")
+    if starts and starts[-1][0] == exception_context.statement:
+        starts.pop()
+
+def instrument_engine(engine: Engine):
+    """为引擎注册 SQL 执行监控"""
+    if event.contains(engine, "before_cursor_execute", _before_cursor_execute):
+        return
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(engine, "handle_error", _handle_error)
@@ -0,0 +1,286 @@
+from prometheus_client import Histogram
+from contextlib import contextmanager
+from contextvars import ContextVar
+from queue import Empty, Full, Queue
+from typing import Any, Dict, List, Optional, Tuple
+import json
+import logging
+import random
+import re
+import threading
+import time
+import urllib.request
+import os
+from .metrics import HTTP_LATENCY_BUCKETS
+
+logger = logging.getLogger(__name__)
+
+# 头部采样率：请求开始时按该概率决定是否导出；上游 traceparent 标记了采样时始终导出
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "0.01"))
+# 尾部采样：未被头部采样的追踪，耗时超过该阈值或以错误结束时仍然导出
+TRACE_SLOW_MS = float(os.getenv("TRACE_SLOW_MS", "500"))
+# 单个追踪最多记录的 span 数，超出部分只计数
+TRACE_MAX_SPANS = int(os.getenv("TRACE_MAX_SPANS", "256"))
+# 导出方式：log 写结构化日志，zipkin 批量发送到本地采集器（Zipkin v2 JSON），none 不导出
+TRACE_EXPORTER = os.getenv("TRACE_EXPORTER", "log")
+TRACE_COLLECTOR_URL = os.getenv("TRACE_COLLECTOR_URL", "http://localhost:9411/api/v2/spans")
+SERVICE_NAME = os.getenv("SERVICE_NAME", "warehouse-api")
+
+# span 类型；每个请求在各类型上的耗时都计入直方图，没有调用时记 0
+SPAN_KINDS = ("db", "redis", "amqp", "http")
+
+REQUEST_SPAN_TIME = Histogram(
+    "http_request_span_seconds",
+    "Time a request spent in downstream calls, by span kind",
+    ["endpoint", "kind"],
+    buckets=HTTP_LATENCY_BUCKETS
+)
+
+_TRACEPARENT = re.compile(r"^[0-9a-f]{2}-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+
+class Span:
+    __slots__ = ("name", "kind", "span_id", "parent_id", "start", "duration", "attributes", "error")
+
+    def __init__(self, name: str, kind: str, parent_id: Optional[str], attributes: Dict[str, Any]):
+        self.name = name
+        self.kind = kind
+        self.span_id = f"{random.getrandbits(64):016x}"
+        self.parent_id = parent_id
+        self.start = time.perf_counter()
+        self.duration = 0.0
+        self.attributes = attributes
+        self.error = None
+
+class Trace:
+    """一次请求或一条消息的处理过程；span 在处理结束后统一判断是否导出"""
+
+    def __init__(self, name: str, kind: str, trace_id: str, parent_id: Optional[str], sampled: bool):
+        self.trace_id = trace_id
+        self.sampled = sampled
+        self.kept = False
+        self.start_wall = time.time()
+        self.root = Span(name, kind, parent_id, {})
+        self.spans: List[Span] = []
+        self.dropped_spans = 0
+        self._tokens = None
+
+    @property
+    def duration(self) -> float:
+        return self.root.duration
+
+    def add(self, span: Span) -> bool:
+        if len(self.spans) >= TRACE_MAX_SPANS:
+            self.dropped_spans += 1
+            return False
+        self.spans.append(span)
+        return True
+
+    def time_by_kind(self) -> Dict[str, float]:
+        totals = dict.fromkeys(SPAN_KINDS, 0.0)
+        for span in self.spans:
+            if span.kind in totals:
+                totals[span.kind] += span.duration
+        return totals
+
+    def wall_time(self, span: Span) -> float:
+        """span 开始的时间戳（秒）"""
+        return self.start_wall + (span.start - self.root.start)
+
+_current_trace: ContextVar[Optional[Trace]] = ContextVar("current_trace", default=None)
+_current_span: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+
+def parse_traceparent(value: Optional[str]) -> Optional[Tuple[str, str, bool]]:
+    """解析 W3C traceparent，返回 (trace_id, parent_id, 是否已采样)"""
+    match = _TRACEPARENT.match(value.strip().lower()) if value else None
+    if match is None or match.group(1) == "0" * 32:
+        return None
+    return match.group(1), match.group(2), bool(int(match.group(3), 16) & 1)
+
+def start_trace(name: str, kind: str = "server", traceparent: Optional[str] = None) -> Trace:
+    """在当前上下文开始追踪；有上游 traceparent 时沿用其 trace_id 与采样标记"""
+    parent = parse_traceparent(traceparent)
+    if parent is not None:
+        trace = Trace(name, kind, parent[0], parent[1], parent[2] or random.random() < TRACE_SAMPLE_RATE)
+    else:
+        trace = Trace(name, kind, f"{random.getrandbits(128):032x}", None, random.random() < TRACE_SAMPLE_RATE)
+    trace._tokens = (_current_trace.set(trace), _current_span.set(trace.root))
+    return trace
+
+def finish_trace(trace: Trace, name: Optional[str] = None, error: Optional[str] = None) -> bool:
+    """结束追踪并恢复上下文；按头部与尾部采样决定是否导出，返回是否导出"""
+    trace.root.duration = time.perf_counter() - trace.root.start
+    if name is not None:
+        trace.root.name = name
+    trace.root.error = error
+    if trace._tokens is not None:
+        _current_trace.reset(trace._tokens[0])
+        _current_span.reset(trace._tokens[1])
+        trace._tokens = None
+
+    trace.kept = trace.sampled or error is not None or trace.duration * 1000 >= TRACE_SLOW_MS
+    if trace.kept:
+        exporter = get_exporter()
+        if exporter is not None:
+            exporter.export(trace)
+    return trace.kept
+
+def current_trace_id() -> Optional[str]:
+    trace = _current_trace.get()
+    return trace.trace_id if trace is not None else None
+
+def current_traceparent() -> Optional[str]:
+    """传给下游的 traceparent，父 span 为当前 span"""
+    trace = _current_trace.get()
+    if trace is None:
+        return None
+    return f"00-{trace.trace_id}-{_current_span.get().span_id}-{'01' if trace.sampled else '00'}"
+
+@contextmanager
+def span(name: str, kind: str, **attributes):
+    """记录一次下游调用；当前上下文没有追踪时不做任何事"""
+    trace = _current_trace.get()
+    if trace is None:
+        yield None
+        return
+    current = Span(name, kind, _current_span.get().span_id, attributes)
+    if not trace.add(current):
+        yield None
+        return
+    token = _current_span.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.error = type(e).__name__
+        raise
+    finally:
+        current.duration = time.perf_counter() - current.start
+        _current_span.reset(token)
+
+def record_span(name: str, kind: str, duration: float, **attributes):
+    """记录一个已结束的 span（用于 SQLAlchemy 等事件钩子，开始时间由耗时倒推）"""
+    trace = _current_trace.get()
+    if trace is None:
+        return
+    finished = Span(name, kind, _current_span.get().span_id, attributes)
+    finished.start -= duration
+    finished.duration = duration
+    trace.add(finished)
+
+def _span_record(trace: Trace, span: Span) -> Dict[str, Any]:
+    return {
+        "name": span.name,
+        "kind": span.kind,
+        "span_id": span.span_id,
+        "parent_id": span.parent_id,
+        "offset_ms": round((span.start - trace.root.start) * 1000, 3),
+        "duration_ms": round(span.duration * 1000, 3),
+        "attributes": span.attributes,
+        "error": span.error,
+    }
+
+class LogExporter:
+    """每个导出的追踪写一条结构化 JSON 日志，随日志管道进入 Elasticsearch"""
+
+    def export(self, trace: Trace):
+        logger.info(
+            json.dumps({
+                "trace_id": trace.trace_id,
+                "duration_ms": round(trace.duration * 1000, 3),
+                "time_by_kind_ms": {kind: round(total * 1000, 3) for kind, total in trace.time_by_kind().items()},
+                "dropped_spans": trace.dropped_spans,
+                "spans": [_span_record(trace, span) for span in [trace.root] + trace.spans],
+            }, default=str),
+            extra={"trace_id": trace.trace_id}
+        )
+
+class ZipkinExporter:
+    """
+    批量发送到本地采集器（Zipkin v2 JSON，Jaeger 与 OpenTelemetry Collector 均可接收）
+
+    export() 只入队，后台线程每 interval 秒或攒够 batch_size 个追踪发送一次；
+    队列已满或发送失败时丢弃，不影响请求。
+    """
+
+    def __init__(
+        self,
+        url: str = TRACE_COLLECTOR_URL,
+        service_name: str = SERVICE_NAME,
+        batch_size: int = 100,
+        interval: float = 1.0,
+        max_queue: int = 1000,
+        timeout: float = 2.0
+    ):
+        self.url = url
+        self.service_name = service_name
+        self.batch_size = batch_size
+        self.interval = interval
+        self.timeout = timeout
+        self.dropped = 0
+        self._queue = Queue(maxsize=max_queue)
+        self._thread = threading.Thread(target=self._run, name="trace-exporter", daemon=True)
+        self._thread.start()
+
+    def export(self, trace: Trace):
+        try:
+            self._queue.put_nowait(trace)
+        except Full:
+            self.dropped += 1
+
+    def _spans(self, trace: Trace) -> List[Dict[str, Any]]:
+        spans = []
+        for span in [trace.root] + trace.spans:
+            record = {
+                "traceId": trace.trace_id,
+                "id": span.span_id,
+                "name": span.name,
+                "kind": "SERVER" if span is trace.root else "CLIENT",
+                "timestamp": int(trace.wall_time(span) * 1_000_000),
+                "duration": max(1, int(span.duration * 1_000_000)),
+                "localEndpoint": {"serviceName": self.service_name},
+                "tags": {key: str(value) for key, value in span.attributes.items()},
+            }
+            record["tags"]["kind"] = span.kind
+            if span.parent_id:
+                record["parentId"] = span.parent_id
+            if span.error:
+                record["tags"]["error"] = span.error
+            spans.append(record)
+        return spans
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.interval
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get(timeout=max(0.0, deadline - time.monotonic())))
+                except Empty:
+                    break
+            body = json.dumps([record for trace in batch for record in self._spans(trace)]).encode()
+            request = urllib.request.Request(
+                self.url, data=body, headers={"Content-Type": "application/json"}, method="POST"
+            )
+            try:
+                urllib.request.urlopen(request, timeout=self.timeout).close()
+            except OSError as e:
+                self.dropped += len(batch)
+                logger.warning(f"Failed to export {len(batch)} traces to {self.url}: {e}")
+
+_exporter = None
+_exporter_lock = threading.Lock()
+
+def get_exporter():
+    """按 TRACE_EXPORTER 创建的导出器，首次导出时才创建"""
+    global _exporter
+    if _exporter is None:
+        with _exporter_lock:
+            if _exporter is None:
+                if TRACE_EXPORTER == "zipkin":
+                    _exporter = ZipkinExporter()
+                elif TRACE_EXPORTER == "log":
+                    _exporter = LogExporter()
+    return _exporter
+
+def set_exporter(exporter):
+    global _exporter
+    _exporter = exporter
@@ -0,0 +1,62 @@
+from sqlalchemy import DateTime, tuple_
+from sqlalchemy.orm import Query
+from fastapi import HTTPException
+from datetime import datetime
+from typing import List, Optional, Tuple
+import base64
+import json
+
+# 下一页游标通过响应头返回，保持响应体结构不变
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+# 列表接口单页条数上限
+MAX_PAGE_SIZE = 1000
+
+def encode_cursor(values: list) -> str:
+    """将排序键编码为不透明游标"""
+    raw = json.dumps([
+        value.isoformat() if isinstance(value, datetime) else value
+        for value in values
+    ])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str, columns: list) -> list:
+    """解码游标，按列类型还原排序键"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        if not isinstance(values, list) or len(values) != len(columns):
+            raise ValueError("cursor length mismatch")
+        return [
+            datetime.fromisoformat(value) if isinstance(column.type, DateTime) else value
+            for column, value in zip(columns, values)
+        ]
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def keyset_paginate(
+    query: Query,
+    columns: list,
+    cursor: Optional[str] = None,
+    limit: int = 100,
+    descending: bool = False
+) -> Tuple[List, Optional[str]]:
+    """
+    基于排序键的游标分页
+
+    按 columns 排序并从游标位置继续读取，深翻页与首页代价相同；
+    columns 的组合必须唯一（通常以主键收尾）。
+    """
+    if cursor:
+        key = tuple_(*columns)
+        position = tuple_(*decode_cursor(cursor, columns))
+        query = query.filter(key < position if descending else key > position)
+
+    order = [column.desc() if descending else column.asc() for column in columns]
+    rows = query.order_by(*order).limit(limit + 1).all()
+
+    if len(rows) <= limit:
+        return rows, None
+
+    rows = rows[:limit]
+    last = rows[-1]
+    return rows, encode_cursor([getattr(last, column.key) for column in columns])
@@ -0,0 +1,354 @@
+import asyncio
+import json
+import logging
+import uuid
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+import pika
+from pika.adapters.asyncio_connection import AsyncioConnection
+
+from ..monitoring.tracing import current_traceparent, finish_trace, span, start_trace
+from .rabbitmq import QUEUES, RABBITMQ_HOST, RABBITMQ_PORT
+
+logger = logging.getLogger(__name__)
+
+JSON_CONTENT_TYPE = "application/json"
+
+Handler = Callable[[Any, pika.BasicProperties], Awaitable[Any]]
+
+class _ConsumerSpec:
+    def __init__(self, queue: str, handler: Handler, prefetch: int):
+        self.queue = queue
+        self.handler = handler
+        self.prefetch = prefetch
+        self.channel = None
+        self.consumer_tag = None
+
+class AsyncRabbitMQ:
+    """
+    基于 asyncio 的 RabbitMQ 客户端，供异步接口与消费者使用，不阻塞事件循环
+
+    - start() 在后台建立连接并在断开后按指数退避重连，代理不可用不影响应用启动；
+    - publish 等待代理确认后返回；未确认消息达到 max_unconfirmed 或代理发出
+      Connection.Blocked 时，新的 publish 在 publish_timeout 内等待（背压）；
+    - consume 按 prefetch 限制并发，处理函数成功后确认，异常时拒绝
+      （首次投递重新入队，重复投递后丢弃）；每条消息的处理是一个追踪，
+      消息头带 traceparent 时延续发布方的追踪；
+    - request / serve 基于独占回复队列和 correlation_id 实现请求-应答。
+    """
+
+    def __init__(
+        self,
+        host: str = RABBITMQ_HOST,
+        port: int = RABBITMQ_PORT,
+        max_unconfirmed: int = 1000,
+        publish_timeout: float = 5.0,
+        request_timeout: float = 10.0,
+        reconnect_delay: float = 0.5,
+        max_reconnect_delay: float = 30.0
+    ):
+        self.parameters = pika.ConnectionParameters(host=host, port=port)
+        self.max_unconfirmed = max_unconfirmed
+        self.publish_timeout = publish_timeout
+        self.request_timeout = request_timeout
+        self.reconnect_delay = reconnect_delay
+        self.max_reconnect_delay = max_reconnect_delay
+
+        self._consumers: List[_ConsumerSpec] = []
+        self._replies: Dict[str, asyncio.Future] = {}
+        self._confirms = OrderedDict()
+        self._handler_tasks = set()
+        self._connection = None
+        self._channel = None
+        self._next_tag = 1
+        self._reply_queue = None
+        self._closing = False
+        self._task = None
+        # asyncio 原语在 start() 中创建，绑定到应用的事件循环
+        self._loop = None
+        self._ready = None
+        self._closed = None
+        self._slots = None
+
+    @property
+    def unconfirmed(self) -> int:
+        return len(self._confirms)
+
+    async def start(self):
+        """启动后台连接任务，不等待连接建立"""
+        if self._task is not None:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._ready = asyncio.Event()
+        self._closed = asyncio.Event()
+        self._slots = asyncio.Semaphore(self.max_unconfirmed)
+        self._closing = False
+        self._task = asyncio.ensure_future(self._maintain())
+
+    async def wait_ready(self, timeout: Optional[float] = None) -> bool:
+        try:
+            await asyncio.wait_for(self._ready.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    async def close(self, timeout: float = 5.0):
+        """停止消费，等待处理中的消息完成确认后关闭连接"""
+        if self._task is None:
+            return
+        self._closing = True
+        for spec in self._consumers:
+            if spec.channel is not None and spec.channel.is_open:
+                spec.channel.basic_cancel(spec.consumer_tag)
+        if self._handler_tasks:
+            await asyncio.wait(self._handler_tasks, timeout=timeout)
+        if self._connection is not None and self._connection.is_open:
+            self._connection.close()
+            try:
+                await asyncio.wait_for(self._closed.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _maintain(self):
+        delay = self.reconnect_delay
+        while not self._closing:
+            # 每条连接使用独立的事件，旧连接迟到的关闭回调不会影响新连接
+            self._closed = asyncio.Event()
+            try:
+                self._connection = await self._open_connection()
+                await self._setup()
+                delay = self.reconnect_delay
+                logger.info("Async messaging client connected to RabbitMQ")
+                await self._closed.wait()
+            except Exception as e:
+                logger.warning(f"Async messaging client failed to connect to RabbitMQ: {e}")
+                if self._connection is not None and self._connection.is_open:
+                    self._connection.close()
+            self._on_disconnected()
+            if self._closing:
+                break
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, self.max_reconnect_delay)
+
+    def _future(self) -> asyncio.Future:
+        return self._loop.create_future()
+
+    @staticmethod
+    def _resolve(future: asyncio.Future, result=None):
+        if not future.done():
+            future.set_result(result)
+
+    async def _open_connection(self):
+        opened = self._future()
+        closed = self._closed
+
+        def on_open_error(connection, error):
+            if not opened.done():
+                opened.set_exception(ConnectionError(str(error)))
+
+        connection = AsyncioConnection(
+            self.parameters,
+            on_open_callback=lambda connection: self._resolve(opened, connection),
+            on_open_error_callback=on_open_error,
+            on_close_callback=lambda connection, reason: self._on_connection_closed(closed, reason),
+            custom_ioloop=self._loop
+        )
+        connection.add_on_connection_blocked_callback(self._on_blocked)
+        connection.add_on_connection_unblocked_callback(self._on_unblocked)
+        return await opened
+
+    async def _open_channel(self):
+        opened = self._future()
+        self._connection.channel(on_open_callback=lambda channel: self._resolve(opened, channel))
+        return await opened
+
+    async def _call(self, method, *args, **kwargs):
+        """把 pika 的回调式方法转换为可等待对象"""
+        done = self._future()
+        method(*args, callback=lambda frame: self._resolve(done, frame), **kwargs)
+        return await done
+
+    async def _setup(self):
+        channel = await self._open_channel()
+        await self._call(channel.confirm_delivery, self._on_confirm)
+        for queue in QUEUES:
+            await self._call(channel.queue_declare, queue)
+        channel.add_on_close_callback(self._on_channel_closed)
+
+        reply = await self._call(channel.queue_declare, "", exclusive=True)
+        self._reply_queue = reply.method.queue
+        reply_channel = await self._open_channel()
+        reply_channel.basic_consume(self._reply_queue, self._on_reply, auto_ack=True)
+
+        for spec in self._consumers:
+            await self._start_consumer(spec)
+
+        self._channel = channel
+        self._next_tag = 1
+        self._ready.set()
+
+    def _on_connection_closed(self, closed: asyncio.Event, reason):
+        if not self._closing:
+            logger.warning(f"Async messaging connection closed: {reason}")
+        closed.set()
+
+    def _on_channel_closed(self, channel, reason):
+        # 发布通道被代理关闭时整条连接重建
+        if self._connection is not None and self._connection.is_open and not self._closing:
+            logger.warning(f"Async messaging publish channel closed: {reason}")
+            self._connection.close()
+
+    def _on_disconnected(self):
+        self._ready.clear()
+        self._channel = None
+        self._connection = None
+        self._reply_queue = None
+        for spec in self._consumers:
+            spec.channel = None
+        # 未确认的发布由各自的 publish 调用重试
+        for future in self._confirms.values():
+            self._resolve(future, False)
+        self._confirms.clear()
+
+    def _on_blocked(self, connection, frame):
+        logger.warning("RabbitMQ blocked publishing, waiting for resources")
+        self._ready.clear()
+
+    def _on_unblocked(self, connection, frame):
+        logger.info("RabbitMQ unblocked publishing")
+        if self._channel is not None:
+            self._ready.set()
+
+    def _on_confirm(self, frame):
+        method = frame.method
+        acked = isinstance(method, pika.spec.Basic.Ack)
+        if method.multiple:
+            while self._confirms and next(iter(self._confirms)) <= method.delivery_tag:
+                self._resolve(self._confirms.popitem(last=False)[1], acked)
+        elif method.delivery_tag in self._confirms:
+            self._resolve(self._confirms.pop(method.delivery_tag), acked)
+
+    async def publish(
+        self,
+        queue: str,
+        message: Any,
+        properties: Optional[pika.BasicProperties] = None,
+        timeout: Optional[float] = None
+    ) -> bool:
+        """发布消息并等待代理确认；超时返回 False，连接中断或被拒绝时在超时前重试"""
+        with span(f"publish {queue}", "amqp", queue=queue):
+            return await self._publish(queue, message, properties, timeout)
+
+    async def _publish(self, queue, message, properties, timeout) -> bool:
+        body = json.dumps(message).encode()
+        if properties is None:
+            traceparent = current_traceparent()
+            headers = {"traceparent": traceparent} if traceparent else None
+            properties = pika.BasicProperties(content_type=JSON_CONTENT_TYPE, headers=headers)
+        deadline = self._loop.time() + (timeout or self.publish_timeout)
+        try:
+            await asyncio.wait_for(self._slots.acquire(), deadline - self._loop.time())
+        except asyncio.TimeoutError:
+            logger.error(f"Publish to {queue} timed out waiting for unconfirmed messages to drain")
+            return False
+        try:
+            while True:
+                await asyncio.wait_for(self._ready.wait(), deadline - self._loop.time())
+                confirmed = self._future()
+                self._confirms[self._next_tag] = confirmed
+                self._next_tag += 1
+                self._channel.basic_publish("", queue, body, properties)
+                if await asyncio.wait_for(asyncio.shield(confirmed), deadline - self._loop.time()):
+                    return True
+        except asyncio.TimeoutError:
+            logger.error(f"Publish to {queue} was not confirmed in time")
+            return False
+        finally:
+            self._slots.release()
+
+    async def consume(self, queue: str, handler: Handler, prefetch: int = 10):
+        """注册消费者；断线重连后自动恢复"""
+        spec = _ConsumerSpec(queue, handler, prefetch)
+        self._consumers.append(spec)
+        if self._ready is not None and self._ready.is_set():
+            await self._start_consumer(spec)
+
+    async def _start_consumer(self, spec: _ConsumerSpec):
+        channel = await self._open_channel()
+        await self._call(channel.basic_qos, prefetch_count=spec.prefetch)
+        await self._call(channel.queue_declare, spec.queue)
+        spec.channel = channel
+        spec.consumer_tag = channel.basic_consume(
+            spec.queue,
+            lambda ch, method, properties, body: self._dispatch(spec, ch, method, properties, body)
+        )
+
+    def _dispatch(self, spec: _ConsumerSpec, channel, method, properties, body):
+        task = asyncio.ensure_future(self._handle(spec, channel, method, properties, body))
+        self._handler_tasks.add(task)
+        task.add_done_callback(self._handler_tasks.discard)
+
+    async def _handle(self, spec: _ConsumerSpec, channel, method, properties, body):
+        trace = start_trace(f"consume {spec.queue}", "consumer", (properties.headers or {}).get("traceparent"))
+        try:
+            await spec.handler(json.loads(body), properties)
+        except Exception as e:
+            finish_trace(trace, error=type(e).__name__)
+            logger.error(f"Failed to handle message from {spec.queue}: {e}")
+            if channel.is_open:
+                channel.basic_nack(method.delivery_tag, requeue=not method.redelivered)
+            return
+        finish_trace(trace)
+        # 连接已断开时代理会重新投递，此处无需处理
+        if channel.is_open:
+            channel.basic_ack(method.delivery_tag)
+
+    async def serve(self, queue: str, handler: Callable[[Any], Awaitable[Any]], prefetch: int = 10):
+        """以 handler 的返回值应答 request 发来的消息"""
+        async def respond(message, properties: pika.BasicProperties):
+            result = await handler(message)
+            if properties.reply_to:
+                await self.publish(
+                    properties.reply_to,
+                    result,
+                    pika.BasicProperties(
+                        content_type=JSON_CONTENT_TYPE,
+                        correlation_id=properties.correlation_id
+                    )
+                )
+
+        await self.consume(queue, respond, prefetch)
+
+    async def request(self, queue: str, message: Any, timeout: Optional[float] = None) -> Any:
+        """发送请求并等待应答，超时抛出 asyncio.TimeoutError"""
+        timeout = timeout or self.request_timeout
+        deadline = self._loop.time() + timeout
+        await asyncio.wait_for(self._ready.wait(), timeout)
+        correlation_id = uuid.uuid4().hex
+        reply = self._replies[correlation_id] = self._future()
+        try:
+            properties = pika.BasicProperties(
+                content_type=JSON_CONTENT_TYPE,
+                correlation_id=correlation_id,
+                reply_to=self._reply_queue
+            )
+            if not await self.publish(queue, message, properties, deadline - self._loop.time()):
+                raise asyncio.TimeoutError(f"request to {queue} was not accepted by the broker")
+            return await asyncio.wait_for(reply, deadline - self._loop.time())
+        finally:
+            self._replies.pop(correlation_id, None)
+
+    def _on_reply(self, channel, method, properties, body):
+        reply = self._replies.get(properties.correlation_id)
+        if reply is not None:
+            self._resolve(reply, json.loads(body))
+
+# 应用共享的客户端，由 app.main 的 startup / shutdown 钩子启动和关闭
+messaging = AsyncRabbitMQ()
@@ -0,0 +1,245 @@
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import signal
+from datetime import datetime, timedelta
+from typing import List, Optional, Tuple
+
+import pika
+from prometheus_client import Counter, Histogram, start_http_server
+from sqlalchemy.orm import Session
+
+from .. import models
+from ..database import SessionLocal
+from .async_rabbitmq import JSON_CONTENT_TYPE, AsyncRabbitMQ
+
+logger = logging.getLogger(__name__)
+
+# 每批认领并发布的事件数
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "200"))
+# 发件箱为空时的轮询间隔（秒）
+OUTBOX_POLL_INTERVAL = float(os.getenv("OUTBOX_POLL_INTERVAL", "0.5"))
+# 整批都未确认（代理不可用）或本轮出错时的重试等待：base * 2^(n-1)，不超过 max，并加随机抖动
+OUTBOX_RETRY_BACKOFF = float(os.getenv("OUTBOX_RETRY_BACKOFF", "1"))
+OUTBOX_RETRY_BACKOFF_MAX = float(os.getenv("OUTBOX_RETRY_BACKOFF_MAX", "60"))
+# 等待代理确认的秒数，超时的事件留在发件箱中下一轮重发
+OUTBOX_PUBLISH_TIMEOUT = float(os.getenv("OUTBOX_PUBLISH_TIMEOUT", "10"))
+# 已发送事件保留的小时数，之后由中继分批删除
+OUTBOX_RETENTION_HOURS = float(os.getenv("OUTBOX_RETENTION_HOURS", "24"))
+# 中继指标的暴露端口，0 表示不暴露
+OUTBOX_METRICS_PORT = int(os.getenv("OUTBOX_METRICS_PORT", "0"))
+
+OUTBOX_PUBLISHED = Counter(
+    "outbox_events_published_total",
+    "Outbox events confirmed by the broker",
+    ["queue"]
+)
+
+OUTBOX_PUBLISH_FAILURES = Counter(
+    "outbox_publish_failures_total",
+    "Outbox events that were not confirmed and stay pending",
+    ["queue"]
+)
+
+OUTBOX_DELIVERY_LAG = Histogram(
+    "outbox_delivery_lag_seconds",
+    "Time from outbox commit to broker confirmation",
+    buckets=(0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+)
+
+def claim_batch(db: Session, batch_size: int) -> List[models.OutboxEvent]:
+    """
+    按写入顺序认领一批未发送事件
+
+    行锁持有到本批标记完成后提交；其他中继跳过已锁定的行，
+    多个中继并行时每条事件只会被一个中继发布。
+    """
+    return db.query(models.OutboxEvent).filter(
+        models.OutboxEvent.sent_at.is_(None)
+    ).order_by(models.OutboxEvent.id).limit(batch_size).with_for_update(skip_locked=True).all()
+
+def mark_batch(db: Session, sent: List[int], failed: List[int]):
+    now = datetime.utcnow()
+    if sent:
+        db.query(models.OutboxEvent).filter(models.OutboxEvent.id.in_(sent)).update(
+            {models.OutboxEvent.sent_at: now}, synchronize_session=False
+        )
+    if failed:
+        db.query(models.OutboxEvent).filter(models.OutboxEvent.id.in_(failed)).update(
+            {models.OutboxEvent.attempts: models.OutboxEvent.attempts + 1}, synchronize_session=False
+        )
+    db.commit()
+
+def purge_sent(db: Session, older_than: datetime, limit: int = 10000) -> int:
+    """分批删除已发送的旧事件，避免一次长事务"""
+    ids = db.query(models.OutboxEvent.id).filter(
+        models.OutboxEvent.sent_at < older_than
+    ).limit(limit).subquery()
+    deleted = db.query(models.OutboxEvent).filter(
+        models.OutboxEvent.id.in_(ids)
+    ).delete(synchronize_session=False)
+    db.commit()
+    return deleted
+
+class OutboxRelay:
+    """
+    发件箱中继：把 crud 在业务事务中写入的事件发布到 RabbitMQ
+
+    - 每轮用 FOR UPDATE SKIP LOCKED 认领一批事件，并发发布并等待代理确认；
+    - 已确认的事件标记 sent_at，未确认的累加 attempts 后留待下一轮，投递语义为至少一次，
+      消息的 message_id 为 outbox-<id>，消费方据此去重；
+    - 整批都未确认或本轮出错时按指数退避等待，代理不可用期间不会反复认领、累加 attempts；
+    - 多个中继可同时运行，彼此不会重复认领；同一中继内按写入顺序发布，跨中继不保证顺序；
+    - 数据库操作在线程池中执行，不阻塞事件循环。
+    """
+
+    def __init__(
+        self,
+        client: Optional[AsyncRabbitMQ] = None,
+        session_factory=SessionLocal,
+        batch_size: int = OUTBOX_BATCH_SIZE,
+        poll_interval: float = OUTBOX_POLL_INTERVAL,
+        publish_timeout: float = OUTBOX_PUBLISH_TIMEOUT,
+        retention: timedelta = timedelta(hours=OUTBOX_RETENTION_HOURS),
+        purge_interval: float = 300.0,
+        retry_backoff: float = OUTBOX_RETRY_BACKOFF,
+        retry_backoff_max: float = OUTBOX_RETRY_BACKOFF_MAX
+    ):
+        self.client = client or AsyncRabbitMQ(publish_timeout=publish_timeout)
+        self.session_factory = session_factory
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.publish_timeout = publish_timeout
+        self.retention = retention
+        self.purge_interval = purge_interval
+        self.retry_backoff = retry_backoff
+        self.retry_backoff_max = retry_backoff_max
+        self._loop = None
+        self._stop = None
+
+    async def _db(self, func, *args):
+        return await self._loop.run_in_executor(None, func, *args)
+
+    async def _publish(self, event: models.OutboxEvent) -> bool:
+        properties = pika.BasicProperties(
+            content_type=JSON_CONTENT_TYPE,
+            delivery_mode=2,
+            message_id=f"outbox-{event.id}",
+            type=event.event_type
+        )
+        try:
+            return await self.client.publish(event.queue, json.loads(event.payload), properties, self.publish_timeout)
+        except Exception as e:
+            logger.error(f"Failed to publish outbox event {event.id} to {event.queue}: {e}")
+            return False
+
+    async def relay_batch(self) -> Tuple[int, int]:
+        """认领并发布一批事件，返回 (认领数, 代理确认数)"""
+        self._loop = self._loop or asyncio.get_running_loop()
+        db = self.session_factory()
+        try:
+            events = await self._db(claim_batch, db, self.batch_size)
+            if not events:
+                await self._db(db.rollback)
+                return 0, 0
+
+            # 依次发起发布，代理按认领顺序收到消息
+            results = await asyncio.gather(*[self._publish(event) for event in events])
+            sent, failed = [], []
+            now = datetime.utcnow()
+            for event, confirmed in zip(events, results):
+                if confirmed:
+                    sent.append(event.id)
+                    OUTBOX_PUBLISHED.labels(event.queue).inc()
+                    OUTBOX_DELIVERY_LAG.observe(max(0.0, (now - event.created_at).total_seconds()))
+                else:
+                    failed.append(event.id)
+                    OUTBOX_PUBLISH_FAILURES.labels(event.queue).inc()
+            await self._db(mark_batch, db, sent, failed)
+            if failed:
+                logger.warning(f"{len(failed)} of {len(events)} outbox events were not confirmed, will retry")
+            return len(events), len(sent)
+        finally:
+            await self._db(db.close)
+
+    async def purge(self) -> int:
+        db = self.session_factory()
+        try:
+            return await self._db(purge_sent, db, datetime.utcnow() - self.retention)
+        finally:
+            await self._db(db.close)
+
+    async def _wait(self, seconds: float):
+        try:
+            await asyncio.wait_for(self._stop.wait(), seconds)
+        except asyncio.TimeoutError:
+            pass
+
+    def backoff_delay(self, failures: int) -> float:
+        """连续第 failures 次失败后的等待秒数"""
+        delay = min(self.retry_backoff * 2 ** (failures - 1), self.retry_backoff_max)
+        return random.uniform(delay / 2, delay)
+
+    async def run(self):
+        """持续发布直到 stop() 被调用；发件箱有积压时不等待，连续认领下一批，连续失败时退避"""
+        self._loop = asyncio.get_running_loop()
+        self._stop = asyncio.Event()
+        await self.client.start()
+        logger.info(f"Outbox relay started (pid {os.getpid()})")
+        next_purge = self._loop.time() + self.purge_interval
+        failures = 0
+
+        while not self._stop.is_set():
+            try:
+                claimed, confirmed = await self.relay_batch()
+                if self._loop.time() >= next_purge:
+                    next_purge = self._loop.time() + self.purge_interval
+                    purged = await self.purge()
+                    if purged:
+                        logger.info(f"Purged {purged} sent outbox events")
+            except Exception as e:
+                logger.error(f"Outbox relay iteration failed: {e}")
+                claimed, confirmed = None, 0
+            if claimed is None or (claimed and not confirmed):
+                failures += 1
+                await self._wait(self.backoff_delay(failures))
+                continue
+            failures = 0
+            if claimed < self.batch_size:
+                await self._wait(self.poll_interval)
+
+        await self.client.close()
+        logger.info("Outbox relay stopped")
+
+    def stop(self):
+        """可从任意线程调用"""
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._stop.set)
+
+    def start(self):
+        """启动中继，收到 SIGTERM / SIGINT 后处理完当前批次再退出"""
+        async def main():
+            loop = asyncio.get_running_loop()
+            for sig in (signal.SIGTERM, signal.SIGINT):
+                loop.add_signal_handler(sig, self.stop)
+            await self.run()
+
+        asyncio.run(main())
+
+def main():
+    parser = argparse.ArgumentParser(description="Transactional outbox relay")
+    parser.add_argument("--batch-size", type=int, default=OUTBOX_BATCH_SIZE)
+    parser.add_argument("--poll-interval", type=float, default=OUTBOX_POLL_INTERVAL)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    logging.getLogger("pika").setLevel(logging.WARNING)
+    if OUTBOX_METRICS_PORT:
+        start_http_server(OUTBOX_METRICS_PORT)
+    OutboxRelay(batch_size=args.batch_size, poll_interval=args.poll_interval).start()
+
+if __name__ == "__main__":
+    main()
@@ -1,22 +1,31 @@
 import pika
 import json
-from typing import Callable, Any
+from typing import Callable, Any, Optional
 import logging
+import os
+import threading
+import time
+from collections import OrderedDict, deque
 from functools import wraps
+from ..monitoring.tracing import current_traceparent, span
 
 logger = logging.getLogger(__name__)
 
+QUEUES = ("stock_alerts", "stock_events", "system_events", "audit_logs", "webhook_dead_letters")
+
+RABBITMQ_HOST = os.getenv("RABBITMQ_HOST", "rabbitmq")
+RABBITMQ_PORT = int(os.getenv("RABBITMQ_PORT", "5672"))
+
 class RabbitMQ:
-    def __init__(self, host: str = "rabbitmq", port: int = 5672):
+    def __init__(self, host: str = RABBITMQ_HOST, port: int = RABBITMQ_PORT):
         self.connection = pika.BlockingConnection(
             pika.ConnectionParameters(host=host, port=port)
         )
         self.channel = self.connection.channel()
         
         # 声明队列
-        self.channel.queue_declare(queue='stock_alerts')
-        self.channel.queue_declare(queue='system_events')
-        self.channel.queue_declare(queue='audit_logs')
+        for queue in QUEUES:
+            self.channel.queue_declare(queue=queue)
     
     def publish(self, queue: str, message: dict):
         """发布消息到指定队列"""
@@ -38,17 +47,274 @@ class RabbitMQ:
         )
         self.channel.start_consuming()
 
+JSON_PROPERTIES = pika.BasicProperties(content_type="application/json")
+
+def message_properties() -> pika.BasicProperties:
+    """在追踪中发布时附带 traceparent 头，消费者据此延续同一追踪"""
+    traceparent = current_traceparent()
+    if traceparent is None:
+        return JSON_PROPERTIES
+    return pika.BasicProperties(content_type="application/json", headers={"traceparent": traceparent})
+
+class _PublishChannel:
+    """I/O 线程内的一个确认模式通道及其未确认消息（delivery_tag -> 消息）"""
+
+    def __init__(self, channel):
+        self.channel = channel
+        self.ready = False
+        self.next_tag = 1
+        self.unconfirmed = OrderedDict()
+
+class RabbitMQPublisher:
+    """
+    进程内共享的长连接发布者
+
+    - 后台 I/O 线程持有一条连接和 channel_pool_size 个确认模式通道，
+      publish 只把序列化后的消息放入有界队列，可被任意线程并发调用
+      （pika 连接不是线程安全的，调用线程从不直接操作通道）；
+    - 消息轮流发往各通道，发布确认异步返回，Basic.Ack(multiple) 一次清除一批；
+    - 连接断开后按指数退避重连，未确认和被 Nack 的消息重新发布（至少一次）；
+    - 待发送与未确认的消息总数达到 max_pending 时，publish 最多阻塞 publish_timeout 秒。
+    """
+
+    def __init__(
+        self,
+        host: str = RABBITMQ_HOST,
+        port: int = RABBITMQ_PORT,
+        channel_pool_size: int = 4,
+        max_pending: int = 10000,
+        max_unconfirmed: int = 1000,
+        batch_size: int = 500,
+        publish_timeout: float = 5.0,
+        reconnect_delay: float = 0.5,
+        max_reconnect_delay: float = 30.0
+    ):
+        self.parameters = pika.ConnectionParameters(host=host, port=port)
+        self.channel_pool_size = channel_pool_size
+        self.max_pending = max_pending
+        self.max_unconfirmed = max_unconfirmed
+        self.batch_size = batch_size
+        self.publish_timeout = publish_timeout
+        self.reconnect_delay = reconnect_delay
+        self.max_reconnect_delay = max_reconnect_delay
+
+        self.confirmed = 0
+        self.nacked = 0
+        self.republished = 0
+
+        self._outbox = deque()
+        self._unconfirmed = 0
+        self._cond = threading.Condition()
+        self._connection = None
+        self._channels = []
+        self._next_channel = 0
+        self._wakeup_scheduled = False
+        self._closing = False
+        self._thread = threading.Thread(target=self._run, name="rabbitmq-publisher", daemon=True)
+        self._thread.start()
+
+    @property
+    def pending(self) -> int:
+        """待发送与已发送未确认的消息数"""
+        return len(self._outbox) + self._unconfirmed
+
+    def publish(self, queue: str, message: dict) -> bool:
+        """发布消息到指定队列；积压超限且在 publish_timeout 内未缓解时丢弃并返回 False"""
+        body = json.dumps(message).encode()
+        with span(f"publish {queue}", "amqp", queue=queue), self._cond:
+            if self._closing:
+                logger.error(f"Publisher is closed, dropping message for {queue}")
+                return False
+            if not self._cond.wait_for(lambda: self.pending < self.max_pending, self.publish_timeout):
+                logger.error(f"Publisher backlog full ({self.pending}), dropping message for {queue}")
+                return False
+            self._outbox.append((queue, body, message_properties()))
+            self._wakeup()
+        return True
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """等待所有已接收的消息得到确认"""
+        with self._cond:
+            return self._cond.wait_for(lambda: self.pending == 0, timeout)
+
+    def close(self, timeout: float = 5.0):
+        """确认剩余消息后关闭连接"""
+        if not self.flush(timeout):
+            logger.warning(f"Closing publisher with {self.pending} unconfirmed messages")
+        with self._cond:
+            self._closing = True
+            connection = self._connection
+        if connection is not None:
+            connection.ioloop.add_callback_threadsafe(lambda: connection.is_open and connection.close())
+        self._thread.join(timeout)
+
+    def _wakeup(self):
+        """调用方持有锁；I/O 线程尚未排空时不重复调度"""
+        if self._wakeup_scheduled or self._connection is None:
+            return
+        self._wakeup_scheduled = True
+        self._connection.ioloop.add_callback_threadsafe(self._drain)
+
+    def _run(self):
+        delay = self.reconnect_delay
+        while not self._closing:
+            connection = pika.SelectConnection(
+                self.parameters,
+                on_open_callback=self._on_connection_open,
+                on_open_error_callback=self._on_connection_failed,
+                on_close_callback=self._on_connection_closed
+            )
+            started = time.monotonic()
+            connection.ioloop.start()
+            if self._closing:
+                break
+            # 连接稳定运行过一段时间后重置退避
+            if time.monotonic() - started > self.max_reconnect_delay:
+                delay = self.reconnect_delay
+            time.sleep(delay)
+            delay = min(delay * 2, self.max_reconnect_delay)
+
+    def _on_connection_open(self, connection):
+        logger.info("Publisher connected to RabbitMQ")
+        for _ in range(self.channel_pool_size):
+            connection.channel(on_open_callback=self._on_channel_open)
+
+    def _on_connection_failed(self, connection, error):
+        logger.warning(f"Publisher failed to connect to RabbitMQ: {error}")
+        connection.ioloop.stop()
+
+    def _on_connection_closed(self, connection, reason):
+        with self._cond:
+            self._requeue_unconfirmed()
+            self._connection = None
+            self._wakeup_scheduled = False
+        if not self._closing:
+            logger.warning(f"Publisher connection closed, reconnecting: {reason}")
+        connection.ioloop.stop()
+
+    def _on_channel_open(self, channel):
+        state = _PublishChannel(channel)
+        channel.add_on_close_callback(lambda ch, reason: self._on_channel_closed(state, reason))
+        channel.confirm_delivery(
+            lambda frame: self._on_confirm(state, frame),
+            callback=lambda _: self._declare_queues(state, list(QUEUES))
+        )
+
+    def _declare_queues(self, state: _PublishChannel, queues: list):
+        if queues:
+            state.channel.queue_declare(
+                queues[0], callback=lambda _: self._declare_queues(state, queues[1:])
+            )
+            return
+        with self._cond:
+            state.ready = True
+            self._channels.append(state)
+            self._connection = state.channel.connection
+            self._wakeup_scheduled = False
+        self._drain()
+
+    def _on_channel_closed(self, state: _PublishChannel, reason):
+        with self._cond:
+            if state in self._channels:
+                self._channels.remove(state)
+            self._requeue(state)
+        connection = state.channel.connection
+        if not self._closing and connection.is_open:
+            logger.warning(f"Publisher channel closed, reopening: {reason}")
+            connection.channel(on_open_callback=self._on_channel_open)
+
+    def _requeue(self, state: _PublishChannel):
+        """调用方持有锁；未确认的消息按原顺序放回队首"""
+        if state.unconfirmed:
+            self.republished += len(state.unconfirmed)
+            self._unconfirmed -= len(state.unconfirmed)
+            self._outbox.extendleft(reversed(list(state.unconfirmed.values())))
+            state.unconfirmed.clear()
+
+    def _requeue_unconfirmed(self):
+        for state in self._channels:
+            self._requeue(state)
+        self._channels = []
+
+    def _drain(self):
+        """在 I/O 线程中把队列中的消息分批发往有确认余量的通道"""
+        with self._cond:
+            self._wakeup_scheduled = False
+            sent = 0
+            while self._outbox and sent < self.batch_size:
+                state = self._pick_channel()
+                if state is None:
+                    break
+                message = self._outbox.popleft()
+                state.channel.basic_publish("", *message)
+                state.unconfirmed[state.next_tag] = message
+                state.next_tag += 1
+                self._unconfirmed += 1
+                sent += 1
+            # 一批发完后让出 I/O 循环处理确认，再继续发送
+            if self._outbox and sent == self.batch_size:
+                self._wakeup()
+
+    def _pick_channel(self) -> Optional[_PublishChannel]:
+        for _ in range(len(self._channels)):
+            state = self._channels[self._next_channel % len(self._channels)]
+            self._next_channel += 1
+            if state.ready and len(state.unconfirmed) < self.max_unconfirmed:
+                return state
+        return None
+
+    def _on_confirm(self, state: _PublishChannel, frame):
+        method = frame.method
+        acked = isinstance(method, pika.spec.Basic.Ack)
+        with self._cond:
+            settled = []
+            if method.multiple:
+                while state.unconfirmed and next(iter(state.unconfirmed)) <= method.delivery_tag:
+                    settled.append(state.unconfirmed.popitem(last=False)[1])
+            elif method.delivery_tag in state.unconfirmed:
+                settled.append(state.unconfirmed.pop(method.delivery_tag))
+            self._unconfirmed -= len(settled)
+            if acked:
+                self.confirmed += len(settled)
+            else:
+                self.nacked += len(settled)
+                self.republished += len(settled)
+                self._outbox.extend(settled)
+                logger.warning(f"Broker rejected {len(settled)} messages, republishing")
+            self._cond.notify_all()
+        self._drain()
+
+_publisher: Optional[RabbitMQPublisher] = None
+_publisher_pid: Optional[int] = None
+_publisher_lock = threading.Lock()
+
+def get_publisher() -> RabbitMQPublisher:
+    """进程内共享的发布者，首次使用时创建；fork 出的子进程会重新创建"""
+    global _publisher, _publisher_pid
+    with _publisher_lock:
+        if _publisher is None or _publisher_pid != os.getpid():
+            _publisher = RabbitMQPublisher()
+            _publisher_pid = os.getpid()
+        return _publisher
+
+def close_publisher(timeout: float = 5.0):
+    """确认剩余消息后关闭共享发布者（应用关闭时调用）"""
+    global _publisher
+    with _publisher_lock:
+        publisher, _publisher = _publisher, None
+    if publisher is not None and _publisher_pid == os.getpid():
+        publisher.close(timeout)
+
 def async_task(queue: str):
     """异步任务装饰器"""
     def decorator(func: Callable):
         @wraps(func)
         def wrapper(*args, **kwargs):
-            rabbitmq = RabbitMQ()
             task_data = {
                 "function": func.__name__,
                 "args": args,
                 "kwargs": kwargs
             }
-            rabbitmq.publish(queue, task_data)
+            get_publisher().publish(queue, task_data)
         return wrapper
-    return decorator 
\ No newline at end of file
+    return decorator
\ No newline at end of file
@@ -0,0 +1,199 @@
+from collections import OrderedDict
+from typing import Optional, Tuple
+import logging
+import math
+import threading
+import time
+from starlette.concurrency import run_in_threadpool
+
+logger = logging.getLogger(__name__)
+
+# 令牌桶：容量为突发上限，按固定速率补充；读取、补充、扣减在一次脚本调用内原子完成
+# 时间取自 Redis 服务器，多实例之间不受本机时钟偏差影响
+TOKEN_BUCKET_SCRIPT = """
+if redis.replicate_commands then redis.replicate_commands() end
+local key = KEYS[1]
+local rate = tonumber(ARGV[1])
+local capacity = tonumber(ARGV[2])
+local requested = tonumber(ARGV[3])
+local ttl = tonumber(ARGV[4])
+
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) * 1000 + math.floor(tonumber(clock[2]) / 1000)
+
+local state = redis.call('HMGET', key, 'tokens', 'ts')
+local tokens = tonumber(state[1]) or capacity
+local ts = tonumber(state[2]) or now
+if now > ts then
+    tokens = math.min(capacity, tokens + (now - ts) * rate)
+end
+
+local granted = math.min(requested, math.floor(tokens))
+tokens = tokens - granted
+local retry_after = 0
+if granted == 0 then
+    retry_after = math.ceil((1 - tokens) / rate)
+end
+
+redis.call('HMSET', key, 'tokens', tostring(tokens), 'ts', now)
+redis.call('PEXPIRE', key, ttl)
+return {granted, retry_after}
+"""
+
+class _KeyState:
+    """单个限流键的本地状态：预取的令牌、拒绝截止时间、降级时使用的本地令牌桶"""
+    __slots__ = ("leased", "lease_size", "lease_expires", "denied_until", "tokens", "updated")
+
+    def __init__(self, capacity: float, now: float):
+        self.leased = 0
+        self.lease_size = 1
+        self.lease_expires = 0.0
+        self.denied_until = 0.0
+        self.tokens = capacity
+        self.updated = now
+
+class RateLimiter:
+    """
+    令牌桶限流器
+
+    每分钟补充 rate_per_minute 个令牌，桶容量为 burst。配置 Redis 时由 Lua 脚本
+    原子完成判定，单次请求一次往返；本地先做预准入：
+    - 被拒绝的键在 retry_after 到期前直接本地拒绝，不访问 Redis；
+    - 持续消耗令牌的热点键一次预取多个令牌（最多 max_lease 个，lease_ttl 内有效），
+      后续请求在本地扣减。预取数量在上一批用完后才翻倍，低频键始终只取 1 个。
+    本地状态为有界 LRU，空闲键会被淘汰；Redis 不可用时退化为单机令牌桶，
+    每隔 redis_retry_interval 秒重试一次。
+    """
+
+    def __init__(
+        self,
+        rate_per_minute: int,
+        burst: int,
+        redis_client=None,
+        prefix: str = "rate_limit",
+        max_lease: int = 8,
+        lease_ttl: float = 1.0,
+        max_local_keys: int = 10000,
+        redis_retry_interval: float = 5.0,
+        clock=time.monotonic
+    ):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = max(burst, 1)
+        self.redis = redis_client
+        self.prefix = prefix
+        self.max_lease = max(1, min(max_lease, self.capacity))
+        self.lease_ttl = lease_ttl
+        self.max_local_keys = max_local_keys
+        self.clock = clock
+        # 桶从空补满所需时间，过期后 Redis 中的键等价于满桶
+        self.key_ttl_ms = int(math.ceil(self.capacity / self.rate * 1000)) + 1000
+        self._states = OrderedDict()
+        self._lock = threading.Lock()
+        self._script = None
+        if redis_client is not None:
+            self.bind_redis(redis_client)
+        self.redis_retry_interval = redis_retry_interval
+        self._redis_failed = False
+        self._redis_retry_at = 0.0
+
+    def bind_redis(self, redis_client):
+        """切换到共享的 Redis 令牌桶；未绑定前按单机令牌桶限流"""
+        self.redis = redis_client
+        self._script = redis_client.register_script(TOKEN_BUCKET_SCRIPT)
+
+    def _state(self, key: str, now: float) -> _KeyState:
+        state = self._states.get(key)
+        if state is None:
+            state = _KeyState(self.capacity, now)
+            self._states[key] = state
+            while len(self._states) > self.max_local_keys:
+                self._states.popitem(last=False)
+        else:
+            self._states.move_to_end(key)
+        return state
+
+    def allow(self, key: str) -> Tuple[bool, float]:
+        """判定一次请求，返回 (是否放行, 建议重试等待秒数)"""
+        now = self.clock()
+        decision, requested = self._admit(key, now)
+        if decision is not None:
+            return decision
+        return self._settle(key, now, *self._acquire(key, requested))
+
+    async def allow_async(self, key: str) -> Tuple[bool, float]:
+        """allow 的协程版本：本地预准入在事件循环内完成，Redis 往返放到线程池执行"""
+        now = self.clock()
+        decision, requested = self._admit(key, now)
+        if decision is not None:
+            return decision
+        return self._settle(key, now, *await run_in_threadpool(self._acquire, key, requested))
+
+    def _admit(self, key: str, now: float) -> Tuple[Optional[Tuple[bool, float]], int]:
+        """本地预准入；能在本地判定时返回 (判定结果, 0)，否则返回 (None, 需向 Redis 申请的令牌数)"""
+        with self._lock:
+            state = self._state(key, now)
+            if now < state.denied_until:
+                return (False, state.denied_until - now), 0
+            if state.leased and now < state.lease_expires:
+                state.leased -= 1
+                return (True, 0.0), 0
+            if self._script is None or now < self._redis_retry_at:
+                return self._allow_local(state, now), 0
+
+            # 上一批预取在有效期内用完才扩大预取量
+            if state.lease_size > 1 and state.leased:
+                state.lease_size = 1
+            elif not state.leased and now < state.lease_expires:
+                state.lease_size = min(state.lease_size * 2, self.max_lease)
+            state.leased = 0
+            return None, state.lease_size
+
+    def _settle(self, key: str, now: float, granted: Optional[int], retry_after_ms: int) -> Tuple[bool, float]:
+        """按 Redis 的申请结果更新本地状态；Redis 异常时退化为本地令牌桶"""
+        with self._lock:
+            state = self._state(key, now)
+            if granted is None:
+                return self._allow_local(state, now)
+            if granted == 0:
+                state.denied_until = now + retry_after_ms / 1000.0
+                return False, retry_after_ms / 1000.0
+            state.leased = granted - 1
+            state.lease_expires = now + self.lease_ttl
+            return True, 0.0
+
+    def _acquire(self, key: str, requested: int) -> Tuple[Optional[int], int]:
+        """执行令牌桶脚本；Redis 异常时返回 (None, 0)"""
+        try:
+            granted, retry_after_ms = self._script(
+                keys=[f"{self.prefix}:{key}"],
+                args=[self.rate / 1000.0, self.capacity, requested, self.key_ttl_ms]
+            )
+        except Exception as e:
+            if not self._redis_failed:
+                logger.warning(f"Rate limiter falling back to local buckets: {e}")
+                self._redis_failed = True
+            # 故障期间不再逐请求重连
+            self._redis_retry_at = self.clock() + self.redis_retry_interval
+            return None, 0
+        if self._redis_failed:
+            logger.info("Rate limiter reconnected to Redis")
+            self._redis_failed = False
+        return int(granted), int(retry_after_ms)
+
+    def _allow_local(self, state: _KeyState, now: float) -> Tuple[bool, float]:
+        state.tokens = min(self.capacity, state.tokens + (now - state.updated) * self.rate)
+        state.updated = now
+        if state.tokens >= 1:
+            state.tokens -= 1
+            return True, 0.0
+        retry_after = (1 - state.tokens) / self.rate
+        state.denied_until = now + retry_after
+        return False, retry_after
+
+    def reset(self, key: Optional[str] = None):
+        """清除本地状态（测试或解除封禁时使用）"""
+        with self._lock:
+            if key is None:
+                self._states.clear()
+            else:
+                self._states.pop(key, None)
@@ -0,0 +1,52 @@
+"""
+数据库结构升级
+
+用法：
+    python -m app.schema
+
+先用 create_all 创建模型中新增的表，再执行 migrations/ 中的 Alembic 迁移，
+补上已有表缺少的列、约束、索引并回填数据。应用启动时自动执行；多个进程或副本
+同时启动时由咨询锁串行化，只有第一个实际执行迁移。
+"""
+import logging
+from pathlib import Path
+
+from alembic import command
+from alembic.config import Config
+from sqlalchemy import func, select
+from sqlalchemy.engine import Engine
+
+from . import models
+
+logger = logging.getLogger(__name__)
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# 结构升级的会话级咨询锁键
+SCHEMA_LOCK_KEY = 0x5343484D
+
+def alembic_config() -> Config:
+    config = Config(str(ROOT / "alembic.ini"))
+    config.set_main_option("script_location", str(ROOT / "migrations"))
+    return config
+
+def upgrade_schema(engine: Engine):
+    with engine.connect() as connection:
+        connection.execute(select(func.pg_advisory_lock(SCHEMA_LOCK_KEY)))
+        try:
+            models.Base.metadata.create_all(bind=connection)
+            config = alembic_config()
+            config.attributes["connection"] = connection
+            command.upgrade(config, "head")
+        finally:
+            connection.execute(select(func.pg_advisory_unlock(SCHEMA_LOCK_KEY)))
+
+def main():
+    from .database import engine
+
+    logging.basicConfig(level=logging.INFO)
+    upgrade_schema(engine)
+    logger.info("Database schema is up to date")
+
+if __name__ == "__main__":
+    main()
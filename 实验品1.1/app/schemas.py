@@ -57,6 +57,12 @@ class Stock(StockBase):
     class Config:
         orm_mode = True
 
+class StockLevel(BaseModel):
+    product_id: int
+    warehouse_id: int
+    quantity: int
+    as_of: datetime
+
 class InboundRecordBase(BaseModel):
     product_id: int
     warehouse_id: int
@@ -156,9 +162,12 @@ class SyncQueueBase(BaseModel):
 
 class SyncQueue(SyncQueueBase):
     id: int
+    idempotency_key: Optional[str]
     retry_count: int
     created_at: datetime
     last_attempt: Optional[datetime]
+    next_attempt_at: Optional[datetime]
+    last_error: Optional[str]
 
     class Config:
         orm_mode = True
@@ -191,4 +200,18 @@ class BackupRecord(BackupRecordBase):
     created_at: datetime
 
     class Config:
-        orm_mode = True 
\ No newline at end of file
+        orm_mode = True 
+
+class TrendGranularity(str, Enum):
+    DAY = "day"
+    WEEK = "week"
+    MONTH = "month"
+
+class StockTrendPoint(BaseModel):
+    period: datetime
+    inbound: int
+    outbound: int
+    net: int
+
+    class Config:
+        orm_mode = True
@@ -0,0 +1,279 @@
+from datetime import datetime, timedelta
+from typing import Optional
+from collections import OrderedDict
+from jose import JWTError, jwt
+from passlib.context import CryptContext
+from fastapi import Depends, HTTPException, status
+from fastapi.security import OAuth2PasswordBearer
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
+from starlette.concurrency import run_in_threadpool
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import logging
+import threading
+import time
+import os
+from .. import crud, models
+from ..database import SessionLocal
+from .middleware import redis_client
+
+logger = logging.getLogger(__name__)
+
+# 配置
+SECRET_KEY = "your-secret-key-here"  # 在生产环境中应该使用环境变量
+ALGORITHM = "HS256"
+ACCESS_TOKEN_EXPIRE_MINUTES = 30
+
+# 密码哈希：bcrypt 成本与独立线程池大小
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(os.cpu_count() or 2)))
+PASSWORD_HASH_MAX_PENDING = int(os.getenv("PASSWORD_HASH_MAX_PENDING", "64"))
+
+# 认证用户缓存
+PRINCIPAL_CACHE_SIZE = 10000
+PRINCIPAL_CACHE_TTL_SECONDS = 300
+# 用户变更时间记录在共享 Redis 中，所有进程和副本每次请求都据此校验令牌声明与缓存
+USER_CHANGED_KEY_PREFIX = "user_changed"
+
+_CHANGED_USERS_KEY = "changed_users"
+
+# 成本参数与配置不一致的哈希会在登录时重新生成
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__default_rounds=BCRYPT_ROUNDS,
+    bcrypt__min_rounds=BCRYPT_ROUNDS,
+    bcrypt__max_rounds=BCRYPT_ROUNDS
+)
+oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
+
+class Principal:
+    """已认证用户的最小信息，权限校验无需访问数据库"""
+    __slots__ = ("id", "username", "role")
+
+    def __init__(self, id: int, username: str, role: models.UserRole):
+        self.id = id
+        self.username = username
+        self.role = role
+
+    @classmethod
+    def from_user(cls, user: models.User) -> "Principal":
+        return cls(id=user.id, username=user.username, role=user.role)
+
+class TTLCache:
+    """线程安全的有界 LRU 缓存，条目超过 TTL 后失效"""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            value, expires_at = item
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + self.ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+class PasswordHasher:
+    """
+    在独立的有界线程池中执行 bcrypt，避免阻塞事件循环
+
+    bcrypt 计算期间释放 GIL，线程池即可利用多核；排队数超过上限时立即返回 503，
+    登录高峰不会拖慢其他请求。
+    """
+
+    def __init__(self, context: CryptContext, workers: int, max_pending: int):
+        self.context = context
+        self.max_pending = max_pending
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="password-hash")
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    async def _submit(self, func, *args):
+        with self._lock:
+            if self._pending >= self.max_pending:
+                raise HTTPException(
+                    status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                    detail="Authentication service busy, please retry",
+                    headers={"Retry-After": "1"},
+                )
+            self._pending += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, func, *args)
+        finally:
+            with self._lock:
+                self._pending -= 1
+
+    async def hash(self, password: str) -> str:
+        return await self._submit(self.context.hash, password)
+
+    async def verify_and_update(self, plain_password: str, hashed_password: str):
+        """校验密码，成本参数变更时同时返回新哈希"""
+        return await self._submit(self.context.verify_and_update, plain_password, hashed_password)
+
+password_hasher = PasswordHasher(pwd_context, PASSWORD_HASH_WORKERS, PASSWORD_HASH_MAX_PENDING)
+
+# 用户名 -> (Principal, 加载时间)
+principal_cache = TTLCache(PRINCIPAL_CACHE_SIZE, PRINCIPAL_CACHE_TTL_SECONDS)
+
+def verify_password(plain_password: str, hashed_password: str):
+    return pwd_context.verify(plain_password, hashed_password)
+
+def get_password_hash(password: str):
+    return pwd_context.hash(password)
+
+def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
+    to_encode = data.copy()
+    if expires_delta:
+        expire = datetime.utcnow() + expires_delta
+    else:
+        expire = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+    to_encode.update({"exp": expire, "iat": int(time.time())})
+    encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+    return encoded_jwt
+
+def create_user_access_token(user: models.User, expires_delta: Optional[timedelta] = None):
+    """签发携带用户ID与角色声明的令牌"""
+    return create_access_token(
+        data={"sub": user.username, "uid": user.id, "role": user.role.value},
+        expires_delta=expires_delta
+    )
+
+async def authenticate_user(db, username: str, password: str):
+    """登录校验：查库在线程池中执行，哈希在独立线程池中执行，必要时重新哈希"""
+    user = await run_in_threadpool(crud.get_user_by_username, db, username)
+    if not user:
+        return None
+
+    valid, new_hash = await password_hasher.verify_and_update(password, user.hashed_password)
+    if not valid:
+        return None
+    if new_hash:
+        await run_in_threadpool(crud.update_password_hash, db, user, new_hash)
+    return user
+
+def _user_changed_key(username: str) -> str:
+    return f"{USER_CHANGED_KEY_PREFIX}:{username}"
+
+def invalidate_principals(usernames):
+    """
+    记录用户变更时间：此前签发的令牌中的角色声明、此前加载的缓存一律不再可信
+
+    键的过期时间等于令牌有效期，过期后旧令牌也已失效。
+    """
+    now = time.time()
+    pipe = redis_client().pipeline(transaction=False)
+    for username in usernames:
+        principal_cache.pop(username)
+        pipe.set(_user_changed_key(username), now, ex=ACCESS_TOKEN_EXPIRE_MINUTES * 60)
+    pipe.execute()
+
+def get_user_changed_at(username: str) -> float:
+    """用户最近一次变更的时间，没有记录返回 0；Redis 不可用时返回当前时间，即不信任令牌声明和缓存，改为查库"""
+    try:
+        changed_at = redis_client().get(_user_changed_key(username))
+        return float(changed_at) if changed_at else 0.0
+    except Exception as e:
+        logger.warning(f"Failed to read change time of user {username}: {e}")
+        return time.time()
+
+@event.listens_for(models.User, "after_insert")
+@event.listens_for(models.User, "after_update")
+@event.listens_for(models.User, "after_delete")
+def _on_user_changed(mapper, connection, target):
+    object_session(target).info.setdefault(_CHANGED_USERS_KEY, set()).add(target.username)
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_after_commit(session):
+    # 外层事务提交后才记录：提交前其他进程查库读到的仍是旧数据，其加载时间早于变更时间
+    # 回滚的事务留下的用户名会在下次提交时多失效一次，不影响正确性
+    if session.in_nested_transaction():
+        return
+    usernames = session.info.pop(_CHANGED_USERS_KEY, None)
+    if not usernames:
+        return
+    try:
+        invalidate_principals(usernames)
+    except Exception as e:
+        logger.error(f"Failed to invalidate principals {sorted(usernames)}: {e}")
+
+def _load_principal(username: str) -> Optional[Principal]:
+    db = SessionLocal()
+    try:
+        user = crud.get_user_by_username(db, username=username)
+        return Principal.from_user(user) if user else None
+    finally:
+        db.close()
+
+async def get_current_user(token: str = Depends(oauth2_scheme)):
+    credentials_exception = HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Could not validate credentials",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        username: str = payload.get("sub")
+        if username is None:
+            raise credentials_exception
+    except JWTError:
+        raise credentials_exception
+
+    # 每次请求都读取共享的变更时间，任一进程修改用户后其他进程立即生效
+    changed_at = await run_in_threadpool(get_user_changed_at, username)
+    cached = principal_cache.get(username)
+    if cached is not None and cached[1] > changed_at:
+        return cached[0]
+
+    # 令牌携带角色声明且签发后用户未变更，无需查库
+    loaded_at = time.time()
+    if (
+        payload.get("uid") is not None
+        and payload.get("role") is not None
+        and payload.get("iat", 0) > changed_at
+    ):
+        try:
+            principal = Principal(payload["uid"], username, models.UserRole(payload["role"]))
+        except ValueError:
+            raise credentials_exception
+    else:
+        principal = await run_in_threadpool(_load_principal, username)
+        if principal is None:
+            raise credentials_exception
+
+    principal_cache.set(username, (principal, loaded_at))
+    return principal
+
+def check_permissions(required_role: str):
+    async def permission_checker(user: Principal = Depends(get_current_user)):
+        if user.role.value != required_role:
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="Operation not permitted"
+            )
+        return user
+    return permission_checker
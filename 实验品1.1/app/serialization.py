@@ -0,0 +1,80 @@
+from pydantic import BaseModel
+from pydantic.fields import SHAPE_SINGLETON
+from starlette.responses import Response
+from decimal import Decimal
+from enum import Enum
+from functools import lru_cache
+from typing import Any, Dict, Iterable, List, Optional, Type
+import orjson
+from .pagination import NEXT_CURSOR_HEADER
+
+# 与 pydantic 输出一致的标量类型转换（如 SUM 返回的 Decimal -> int/float）
+_COERCE = {int: int, float: float}
+
+def _default(value: Any):
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, Enum):
+        return value.value
+    raise TypeError(f"Type is not JSON serializable: {type(value).__name__}")
+
+class ORJSONResponse(Response):
+    """使用 orjson 编码的 JSON 响应"""
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content, default=_default)
+
+@lru_cache(maxsize=None)
+def _field_plan(schema: Type[BaseModel]) -> tuple:
+    """预先计算每个字段的输出名、嵌套模型和类型转换"""
+    plan = []
+    for name, field in schema.__fields__.items():
+        nested = field.type_ if isinstance(field.type_, type) and issubclass(field.type_, BaseModel) else None
+        plan.append((
+            name,
+            field.alias,
+            nested,
+            field.shape != SHAPE_SINGLETON,
+            None if nested else _COERCE.get(field.type_)
+        ))
+    return tuple(plan)
+
+def dump(obj: Any, schema: Type[BaseModel]) -> Optional[Dict[str, Any]]:
+    """按 schema 字段直接读取 ORM 对象、查询结果行或字典，不做 pydantic 校验"""
+    if obj is None:
+        return None
+    is_dict = isinstance(obj, dict)
+    result = {}
+    for name, alias, nested, many, coerce in _field_plan(schema):
+        value = obj.get(name) if is_dict else getattr(obj, name)
+        if value is not None:
+            if nested is not None:
+                value = [dump(item, nested) for item in value] if many else dump(value, nested)
+            elif coerce is not None and type(value) is not coerce:
+                value = coerce(value)
+        result[alias] = value
+    return result
+
+def schema_columns(model, schema: Type[BaseModel]) -> List:
+    """schema 字段对应的模型列，用于只查询响应需要的列"""
+    return [getattr(model, name) for name in schema.__fields__]
+
+def list_response(
+    items: Iterable[Any],
+    schema: Type[BaseModel],
+    next_cursor: Optional[str] = None,
+    etag: Optional[str] = None
+) -> ORJSONResponse:
+    """
+    大列表响应的快速路径
+
+    端点仍声明 response_model（OpenAPI 不变），但直接返回响应对象，
+    跳过逐条 pydantic 校验与 jsonable_encoder，由 orjson 一次编码。
+    """
+    headers = {}
+    if next_cursor:
+        headers[NEXT_CURSOR_HEADER] = next_cursor
+    if etag:
+        headers["ETag"] = etag
+    return ORJSONResponse([dump(item, schema) for item in items], headers=headers)
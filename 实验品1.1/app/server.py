@@ -0,0 +1,181 @@
+"""
+生产环境启动入口
+
+用法：
+    python -m app.server
+
+由 gunicorn 管理多个 uvicorn worker 进程，所有参数来自环境变量或 .env（见 ServerSettings）。
+未安装 gunicorn 的平台（如 Windows 开发机）退回 uvicorn 自带的多进程模式。
+各 worker 的 Prometheus 指标写入 METRICS_DIR，/metrics 汇总所有 worker 后返回。
+"""
+import glob
+import logging
+import os
+import sys
+import tempfile
+from pydantic import BaseSettings
+from typing import Optional
+
+try:
+    from gunicorn.app.base import BaseApplication
+    from uvicorn.workers import UvicornWorker
+except ImportError:  # gunicorn 不支持 Windows
+    BaseApplication = None
+    UvicornWorker = None
+
+logger = logging.getLogger(__name__)
+
+class ServerSettings(BaseSettings):
+    APP_MODULE: str = "app.main:app"
+    HOST: str = "0.0.0.0"
+    PORT: int = 8000
+
+    # worker 数：0 表示按 CPU 核数 × WORKERS_PER_CORE 计算，并限制在 MAX_WORKERS 以内
+    WORKERS: int = 0
+    WORKERS_PER_CORE: float = 2
+    MAX_WORKERS: int = 16
+
+    # auto：已安装 uvloop / httptools 时使用，否则退回 asyncio / h11
+    LOOP: str = "auto"
+    HTTP: str = "auto"
+
+    # 须大于前置负载均衡的空闲超时，避免复用中的连接被本端先关闭
+    KEEPALIVE_TIMEOUT: int = 65
+    BACKLOG: int = 2048
+    # 单个 worker 的最大并发连接数，超出返回 503；0 表示不限制
+    LIMIT_CONCURRENCY: int = 0
+    # worker 处理这么多请求后重启，抖动避免所有 worker 同时重启；0 表示不重启
+    MAX_REQUESTS: int = 1000
+    MAX_REQUESTS_JITTER: int = 50
+
+    # 收到 SIGTERM 后停止接收新连接，最多等待这么多秒处理完进行中的请求
+    GRACEFUL_TIMEOUT: int = 30
+    # worker 心跳超时，超时未响应的 worker 会被重启
+    WORKER_TIMEOUT: int = 60
+    # 在主进程中导入应用后再 fork，worker 共享只读内存、启动更快
+    PRELOAD: bool = True
+
+    # 多进程 Prometheus 指标文件目录，启动时清空；已设置 PROMETHEUS_MULTIPROC_DIR 时以其为准
+    METRICS_DIR: str = os.path.join(tempfile.gettempdir(), "warehouse-metrics")
+
+    FORWARDED_ALLOW_IPS: str = "127.0.0.1"
+    LOG_LEVEL: str = "info"
+
+    class Config:
+        env_file = ".env"
+
+    def worker_count(self, cpu_count: Optional[int] = None) -> int:
+        if self.WORKERS > 0:
+            return self.WORKERS
+        if cpu_count is None:
+            cpu_count = _available_cpus()
+        return max(1, min(self.MAX_WORKERS, int(cpu_count * self.WORKERS_PER_CORE)))
+
+    def gunicorn_options(self) -> dict:
+        return {
+            "bind": f"{self.HOST}:{self.PORT}",
+            "workers": self.worker_count(),
+            "worker_class": "app.server.TunedUvicornWorker",
+            "keepalive": self.KEEPALIVE_TIMEOUT,
+            "backlog": self.BACKLOG,
+            "max_requests": self.MAX_REQUESTS,
+            "max_requests_jitter": self.MAX_REQUESTS_JITTER,
+            "graceful_timeout": self.GRACEFUL_TIMEOUT,
+            "timeout": self.WORKER_TIMEOUT,
+            "preload_app": self.PRELOAD,
+            "forwarded_allow_ips": self.FORWARDED_ALLOW_IPS,
+            "loglevel": self.LOG_LEVEL,
+            "worker_tmp_dir": "/dev/shm" if os.path.isdir("/dev/shm") else None,
+            "pre_fork": _pre_fork,
+            "child_exit": _child_exit,
+        }
+
+def _available_cpus() -> int:
+    """容器内按 CPU 亲和性计算，而不是宿主机核数"""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+def _pre_fork(server, worker):
+    """
+    预加载时主进程可能已建立数据库连接，fork 前先释放，
+    否则多个 worker 会共用同一个 socket
+    """
+    database = sys.modules.get(f"{__package__}.database")
+    if database is not None:
+        database.engine.dispose()
+
+def _child_exit(server, worker):
+    """删除已退出 worker 的 live* 仪表盘文件，计数器和直方图的累计值保留"""
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
+
+def prepare_metrics_dir(server_settings: "ServerSettings") -> str:
+    """
+    启用 Prometheus 多进程模式：须在导入应用（创建指标）之前调用，worker 继承该环境变量
+
+    目录中残留的上次运行的文件会被合计进来，启动时先清空。
+    """
+    path = os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", server_settings.METRICS_DIR)
+    os.makedirs(path, exist_ok=True)
+    for stale in glob.glob(os.path.join(path, "*.db")):
+        os.remove(stale)
+    if "prometheus_client" in sys.modules:
+        logger.warning("prometheus_client was imported before the metrics directory was set, metrics stay per worker")
+    return path
+
+settings = ServerSettings()
+
+if UvicornWorker is not None:
+    class TunedUvicornWorker(UvicornWorker):
+        """按 ServerSettings 选择事件循环、HTTP 解析器和并发上限的 worker"""
+        CONFIG_KWARGS = {
+            "loop": settings.LOOP,
+            "http": settings.HTTP,
+            "limit_concurrency": settings.LIMIT_CONCURRENCY or None,
+            "proxy_headers": True,
+        }
+
+if BaseApplication is not None:
+    class Server(BaseApplication):
+        def __init__(self, app: str, options: dict):
+            self.app_uri = app
+            self.options = options
+            super().__init__()
+
+        def load_config(self):
+            for key, value in self.options.items():
+                if value is not None:
+                    self.cfg.set(key, value)
+
+        def load(self):
+            from gunicorn.util import import_app
+            return import_app(self.app_uri)
+
+def run(server_settings: ServerSettings = settings):
+    app = server_settings.APP_MODULE
+    prepare_metrics_dir(server_settings)
+    if BaseApplication is None:
+        import uvicorn
+        logger.warning("gunicorn is not available, falling back to uvicorn workers without preloading")
+        uvicorn.run(
+            app,
+            host=server_settings.HOST,
+            port=server_settings.PORT,
+            workers=server_settings.worker_count(),
+            loop=server_settings.LOOP,
+            http=server_settings.HTTP,
+            backlog=server_settings.BACKLOG,
+            timeout_keep_alive=server_settings.KEEPALIVE_TIMEOUT,
+            limit_concurrency=server_settings.LIMIT_CONCURRENCY or None,
+            limit_max_requests=server_settings.MAX_REQUESTS or None,
+            forwarded_allow_ips=server_settings.FORWARDED_ALLOW_IPS,
+            log_level=server_settings.LOG_LEVEL,
+            access_log=False
+        )
+        return
+    Server(app, server_settings.gunicorn_options()).run()
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,66 @@
+"""
+库存快照定时任务
+
+用法：
+    python -m app.stock_snapshots                 # 执行一次（k8s CronJob）
+    python -m app.stock_snapshots --interval 300  # 常驻，每 300 秒执行一次（docker-compose）
+
+每次执行用独立的数据库会话；多个副本同时触发时由咨询锁保证只有一个执行，其余直接跳过。
+"""
+import argparse
+import logging
+import os
+import signal
+import threading
+from typing import Optional
+
+from sqlalchemy import func, select
+
+from . import crud
+from .database import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+# 常驻模式下两次快照之间的秒数，0 表示只执行一次
+STOCK_SNAPSHOT_INTERVAL = float(os.getenv("STOCK_SNAPSHOT_INTERVAL", "0"))
+# 快照任务的事务级咨询锁键
+SNAPSHOT_LOCK_KEY = 0x534E4150
+
+def run_snapshot_job(session_factory=SessionLocal) -> Optional[int]:
+    """生成一轮快照，返回快照数；其他进程正在执行或执行失败时返回 None"""
+    db = session_factory()
+    try:
+        if not db.execute(select(func.pg_try_advisory_xact_lock(SNAPSHOT_LOCK_KEY))).scalar():
+            logger.info("Stock snapshot is already running elsewhere, skipped")
+            db.rollback()
+            return None
+        # 提交时同时释放咨询锁
+        count = crud.create_stock_snapshots(db)
+        logger.info(f"Created {count} stock snapshots")
+        return count
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Stock snapshot failed: {e}")
+        return None
+    finally:
+        db.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Periodic stock snapshot job")
+    parser.add_argument("--interval", type=float, default=STOCK_SNAPSHOT_INTERVAL, help="seconds between runs, 0 runs once")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    if args.interval <= 0:
+        run_snapshot_job()
+        return
+
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop.set())
+    signal.signal(signal.SIGINT, lambda signum, frame: stop.set())
+    while not stop.is_set():
+        run_snapshot_job()
+        stop.wait(args.interval)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+import argparse
+import logging
+import multiprocessing
+import os
+import signal
+import threading
+import time
+from typing import Dict
+
+from prometheus_client import Counter, Histogram, start_http_server
+
+from . import crud
+from .database import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+# 同步进程数，多个进程通过 SKIP LOCKED 分摊同一个队列
+SYNC_WORKER_PROCESSES = int(os.getenv("SYNC_WORKER_PROCESSES", "1"))
+# 队列中没有到期条目时的轮询间隔（秒）
+SYNC_POLL_INTERVAL = float(os.getenv("SYNC_POLL_INTERVAL", "1"))
+# 数据库不可用时的最长等待（秒），从轮询间隔开始逐次翻倍
+SYNC_ERROR_BACKOFF_MAX = float(os.getenv("SYNC_ERROR_BACKOFF_MAX", "60"))
+# 同步指标的暴露端口，0 表示不暴露；多进程时第 i 个进程使用 端口 + i
+SYNC_METRICS_PORT = int(os.getenv("SYNC_METRICS_PORT", "0"))
+
+SYNC_ITEMS = Counter(
+    "sync_queue_items_total",
+    "Sync queue items processed, by outcome",
+    ["outcome"]
+)
+
+SYNC_BATCH_LATENCY = Histogram(
+    "sync_queue_batch_duration_seconds",
+    "Time to claim, apply and commit one sync queue batch",
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+)
+
+class SyncWorker:
+    """
+    离线同步队列的后台处理进程
+
+    每轮调用 crud.process_sync_queue 认领并提交一批条目；认领满一批时立即处理下一批，
+    否则等待 poll_interval。整批失败（如数据库不可用）时按指数退避等待，条目留在队列中。
+    """
+
+    def __init__(
+        self,
+        session_factory=SessionLocal,
+        batch_size: int = crud.SYNC_BATCH_SIZE,
+        poll_interval: float = SYNC_POLL_INTERVAL,
+        error_backoff_max: float = SYNC_ERROR_BACKOFF_MAX
+    ):
+        self.session_factory = session_factory
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.error_backoff_max = error_backoff_max
+        self._stop = threading.Event()
+
+    def run_batch(self) -> Dict[str, int]:
+        start = time.perf_counter()
+        db = self.session_factory()
+        try:
+            results = crud.process_sync_queue(db, self.batch_size)
+        finally:
+            db.close()
+        if results["claimed"]:
+            SYNC_BATCH_LATENCY.observe(time.perf_counter() - start)
+            for outcome in ("synced", "retried", "failed"):
+                SYNC_ITEMS.labels(outcome).inc(results[outcome])
+        if results["failed"]:
+            logger.warning(f"{results['failed']} sync queue items failed permanently")
+        return results
+
+    def run(self):
+        """处理队列直到 stop() 被调用，当前批次提交后退出"""
+        logger.info(f"Sync worker started (pid {os.getpid()})")
+        delay = self.poll_interval
+        while not self._stop.is_set():
+            try:
+                claimed = self.run_batch()["claimed"]
+            except Exception as e:
+                logger.error(f"Sync queue batch failed, retrying in {delay:.1f}s: {e}")
+                self._stop.wait(delay)
+                delay = min(delay * 2, self.error_backoff_max)
+                continue
+            delay = self.poll_interval
+            if claimed < self.batch_size:
+                self._stop.wait(self.poll_interval)
+        logger.info("Sync worker stopped")
+
+    def stop(self):
+        self._stop.set()
+
+    def start(self):
+        """启动同步进程，收到 SIGTERM / SIGINT 后优雅退出"""
+        signal.signal(signal.SIGTERM, lambda signum, frame: self.stop())
+        signal.signal(signal.SIGINT, lambda signum, frame: self.stop())
+        self.run()
+
+def _serve_metrics(index: int = 0):
+    if SYNC_METRICS_PORT:
+        start_http_server(SYNC_METRICS_PORT + index)
+
+def _worker_process(index: int, batch_size: int):
+    logging.basicConfig(level=logging.INFO)
+    _serve_metrics(index)
+    SyncWorker(batch_size=batch_size).start()
+
+def run_processes(processes: int, batch_size: int):
+    """启动多个同步进程，转发停止信号，异常退出的进程自动重启"""
+    def spawn(index: int):
+        process = multiprocessing.Process(target=_worker_process, args=(index, batch_size), daemon=False)
+        process.index = index
+        process.start()
+        return process
+
+    children = [spawn(index) for index in range(processes)]
+    stopping = False
+
+    def forward(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for child in children:
+            if child.is_alive():
+                os.kill(child.pid, signal.SIGTERM)
+
+    signal.signal(signal.SIGTERM, forward)
+    signal.signal(signal.SIGINT, forward)
+
+    while children:
+        for child in list(children):
+            child.join(timeout=1.0 / len(children))
+            if child.is_alive():
+                continue
+            children.remove(child)
+            if not stopping:
+                logger.warning(f"Sync worker process {child.pid} exited with {child.exitcode}, restarting")
+                children.append(spawn(child.index))
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline sync queue worker")
+    parser.add_argument("--processes", type=int, default=SYNC_WORKER_PROCESSES)
+    parser.add_argument("--batch-size", type=int, default=crud.SYNC_BATCH_SIZE)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    if args.processes <= 1:
+        _serve_metrics()
+        SyncWorker(batch_size=args.batch_size).start()
+    else:
+        run_processes(args.processes, args.batch_size)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+from fastapi import Request, Response
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
+from typing import Iterable, Optional, Tuple
+import hashlib
+import logging
+import time
+from . import models
+from .cache import get_redis
+
+logger = logging.getLogger(__name__)
+
+# 资源版本号：写入提交后递增，读接口据此生成 ETag
+CATALOG = "catalog"
+VERSION_KEY_PREFIX = "version"
+# 版本键定期过期并以当前时间重新初始化，Redis 偶发写失败时旧 ETag 最多在此期间内有效
+VERSION_TTL_SECONDS = 3600
+
+_CHANGED_KEY = "changed_resources"
+
+def stock_resource(product_id: int) -> str:
+    return f"stock:{product_id}"
+
+def _key(resource: str) -> str:
+    return f"{VERSION_KEY_PREFIX}:{resource}"
+
+def bump_versions(resources: Iterable[str]):
+    """递增资源版本；不存在的键先以毫秒时间戳初始化，Redis 重启后版本号也不会回退"""
+    now_ms = int(time.time() * 1000)
+    pipe = get_redis().pipeline(transaction=False)
+    for resource in resources:
+        pipe.set(_key(resource), now_ms, nx=True, ex=VERSION_TTL_SECONDS)
+        pipe.incr(_key(resource))
+    pipe.execute()
+
+def get_version(resource: str) -> Optional[int]:
+    """读取资源当前版本，Redis 不可用时返回 None（不启用条件请求）"""
+    try:
+        redis_client = get_redis()
+        version = redis_client.get(_key(resource))
+        if version is None:
+            pipe = redis_client.pipeline(transaction=False)
+            pipe.set(_key(resource), int(time.time() * 1000), nx=True, ex=VERSION_TTL_SECONDS)
+            pipe.get(_key(resource))
+            version = pipe.execute()[1]
+        return int(version)
+    except Exception as e:
+        logger.warning(f"Failed to read version of {resource}: {e}")
+        return None
+
+def mark_changed(db: Session, *resources: str):
+    """登记本事务修改的资源，提交后统一递增版本"""
+    db.info.setdefault(_CHANGED_KEY, set()).update(resources)
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    """弱比较：忽略 W/ 前缀，支持逗号分隔的多个 ETag 与 *"""
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag == "*" or (tag[2:] if tag.startswith("W/") else tag) == etag:
+            return True
+    return False
+
+def check_not_modified(request: Request, resource: str) -> Tuple[Optional[str], Optional[Response]]:
+    """
+    条件 GET：根据资源版本与查询参数生成 ETag
+
+    If-None-Match 命中时返回 304 响应，调用方直接返回，不再查库和序列化；
+    否则返回 ETag 供调用方附加到完整响应上。须在查库之前调用，
+    这样读取期间发生的写入只会让 ETag 偏旧，下次轮询重新获取。
+    """
+    version = get_version(resource)
+    if version is None:
+        return None, None
+
+    etag = f'"{resource}-{version}'
+    if request.url.query:
+        etag += "-" + hashlib.md5(request.url.query.encode()).hexdigest()[:8]
+    etag += '"'
+
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and _etag_matches(if_none_match, etag):
+        return etag, Response(status_code=304, headers={"ETag": etag})
+    return etag, None
+
+@event.listens_for(models.Product, "after_insert")
+@event.listens_for(models.Product, "after_update")
+@event.listens_for(models.Product, "after_delete")
+def _on_product_changed(mapper, connection, target):
+    mark_changed(object_session(target), CATALOG)
+
+@event.listens_for(models.Stock, "after_insert")
+@event.listens_for(models.Stock, "after_update")
+@event.listens_for(models.Stock, "after_delete")
+@event.listens_for(models.StockLedgerEntry, "after_insert")
+def _on_stock_changed(mapper, connection, target):
+    mark_changed(object_session(target), stock_resource(target.product_id))
+
+@event.listens_for(Session, "after_commit")
+def _bump_after_commit(session):
+    # 保存点释放也会触发 after_commit，等外层事务提交后再递增
+    if session.in_nested_transaction():
+        return
+    resources = session.info.pop(_CHANGED_KEY, None)
+    if not resources:
+        return
+    try:
+        bump_versions(resources)
+    except Exception as e:
+        logger.warning(f"Failed to bump versions {sorted(resources)}: {e}")
+
+@event.listens_for(Session, "after_rollback")
+def _discard_after_rollback(session):
+    # 回滚保存点时保留登记：同一事务中其他已成功的修改仍会提交，
+    # 被回滚的修改只会让版本多递增一次
+    if session.in_nested_transaction():
+        return
+    session.info.pop(_CHANGED_KEY, None)
@@ -0,0 +1,95 @@
+"""stock ledger: unique stock rows and opening entries
+
+库存读取改为 快照 + 流水 之后，历史库存行必须先有期初流水，否则读到 0；
+库存行按 (product_id, warehouse_id) 唯一，ensure_stock_row 的 ON CONFLICT 依赖该约束。
+
+新建的表由 create_all 创建，本迁移只处理已有的表和数据，可在任意时期建的库上重复执行。
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-19 14:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0001'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+    tables = inspector.get_table_names()
+    if "stocks" not in tables:
+        # 空库，所有表由 create_all 按当前模型创建
+        return
+
+    constraints = {constraint["name"] for constraint in inspector.get_unique_constraints("stocks")}
+    if "uq_stock_product_warehouse" not in constraints:
+        # 重复的库存行合并到 id 最小的一行，数量相加，保质期取最早
+        op.execute("""
+            UPDATE stocks AS s
+            SET quantity = d.quantity, expiry_date = d.expiry_date
+            FROM (
+                SELECT min(id) AS keep_id, sum(coalesce(quantity, 0)) AS quantity, min(expiry_date) AS expiry_date
+                FROM stocks
+                WHERE product_id IS NOT NULL AND warehouse_id IS NOT NULL
+                GROUP BY product_id, warehouse_id
+                HAVING count(*) > 1
+            ) AS d
+            WHERE s.id = d.keep_id
+        """)
+        op.execute("""
+            DELETE FROM stocks AS s
+            USING stocks AS k
+            WHERE s.product_id = k.product_id
+              AND s.warehouse_id = k.warehouse_id
+              AND s.id > k.id
+        """)
+        op.create_unique_constraint("uq_stock_product_warehouse", "stocks", ["product_id", "warehouse_id"])
+
+    if "stock_ledger" not in tables:
+        op.create_table(
+            "stock_ledger",
+            sa.Column("id", sa.Integer(), primary_key=True),
+            sa.Column("product_id", sa.Integer(), sa.ForeignKey("products.id")),
+            sa.Column("warehouse_id", sa.Integer(), sa.ForeignKey("warehouses.id")),
+            sa.Column("quantity_change", sa.Integer()),
+            sa.Column("movement_type", sa.String(20)),
+            sa.Column("created_at", sa.DateTime()),
+        )
+        op.create_index("ix_stock_ledger_id", "stock_ledger", ["id"])
+        op.create_index("ix_stock_ledger_created_at", "stock_ledger", ["created_at"])
+        op.create_index("ix_stock_ledger_product_warehouse_id", "stock_ledger", ["product_id", "warehouse_id", "id"])
+
+    # 还没有期初流水也没有快照的库存行，库存行上的数量仍是切换前的真实数量（切换后的入库
+    # 只追加流水、不改库存行），补一条期初流水；已有快照的行由快照承载数量，不再补
+    no_snapshot = ""
+    if "stock_snapshots" in tables:
+        no_snapshot = """
+              AND NOT EXISTS (
+                  SELECT 1 FROM stock_snapshots AS ss
+                  WHERE ss.product_id = s.product_id AND ss.warehouse_id = s.warehouse_id
+              )"""
+    op.execute(f"""
+        INSERT INTO stock_ledger (product_id, warehouse_id, quantity_change, movement_type, created_at)
+        SELECT s.product_id, s.warehouse_id, s.quantity, 'opening', now() AT TIME ZONE 'utc'
+        FROM stocks AS s
+        WHERE s.quantity <> 0
+          AND NOT EXISTS (
+              SELECT 1 FROM stock_ledger AS l
+              WHERE l.product_id = s.product_id
+                AND l.warehouse_id = s.warehouse_id
+                AND l.movement_type = 'opening'
+          ){no_snapshot}
+        ORDER BY s.id
+    """)
+
+
+def downgrade():
+    # 期初流水是数据，不回滚
+    op.drop_constraint("uq_stock_product_warehouse", "stocks", type_="unique")
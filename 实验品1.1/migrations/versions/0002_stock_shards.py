@@ -0,0 +1,43 @@
+"""stock shards: products.stock_shards and sharded daily rollup rows
+
+分片库存给已有的商品表加了分片数列，日汇总表加了分片号并把它纳入唯一约束
+（record_daily_movement 的 ON CONFLICT 依赖该约束）。
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-19 15:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0002'
+down_revision = '0001'
+branch_labels = None
+depends_on = None
+
+
+def _columns(inspector, table):
+    return {column["name"] for column in inspector.get_columns(table)}
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+    tables = inspector.get_table_names()
+
+    if "products" in tables and "stock_shards" not in _columns(inspector, "products"):
+        op.add_column("products", sa.Column("stock_shards", sa.Integer(), server_default="0"))
+
+    if "daily_stock_movements" in tables and "shard" not in _columns(inspector, "daily_stock_movements"):
+        op.add_column("daily_stock_movements", sa.Column("shard", sa.Integer(), server_default="0"))
+        op.drop_constraint("uq_daily_stock_movement", "daily_stock_movements", type_="unique")
+        op.create_unique_constraint(
+            "uq_daily_stock_movement", "daily_stock_movements", ["day", "product_id", "warehouse_id", "shard"]
+        )
+
+
+def downgrade():
+    # 分片行先合并回每日一行才能恢复原约束，这里只删除商品表的列
+    op.drop_column("products", "stock_shards")
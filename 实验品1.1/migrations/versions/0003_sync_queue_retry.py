@@ -0,0 +1,51 @@
+"""sync queue: idempotency key, retry backoff and pending index
+
+同步进程认领待处理条目依赖这些列和部分索引（claim_sync_items）。
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-19 16:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0003'
+down_revision = '0002'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+    if "sync_queue" not in inspector.get_table_names():
+        return
+
+    columns = {column["name"] for column in inspector.get_columns("sync_queue")}
+    if "idempotency_key" not in columns:
+        op.add_column("sync_queue", sa.Column("idempotency_key", sa.String(100), nullable=True))
+        # 与 create_all 为 unique=True 生成的约束同名
+        op.create_unique_constraint("sync_queue_idempotency_key_key", "sync_queue", ["idempotency_key"])
+    if "next_attempt_at" not in columns:
+        op.add_column("sync_queue", sa.Column("next_attempt_at", sa.DateTime(), nullable=True))
+    if "last_error" not in columns:
+        op.add_column("sync_queue", sa.Column("last_error", sa.String(500), nullable=True))
+
+    # 旧代码入队时可能未写状态，按待处理对待
+    op.execute("UPDATE sync_queue SET status = 'pending' WHERE status IS NULL")
+
+    indexes = {index["name"] for index in inspector.get_indexes("sync_queue")}
+    if "ix_sync_queue_pending" not in indexes:
+        op.create_index(
+            "ix_sync_queue_pending", "sync_queue", ["next_attempt_at", "id"],
+            postgresql_where=sa.text("status = 'pending'")
+        )
+
+
+def downgrade():
+    op.drop_index("ix_sync_queue_pending", table_name="sync_queue")
+    op.drop_column("sync_queue", "last_error")
+    op.drop_column("sync_queue", "next_attempt_at")
+    op.drop_column("sync_queue", "idempotency_key")
@@ -0,0 +1,38 @@
+"""keyset pagination indexes on existing record tables
+
+游标分页按 (created_at, id) 排序，已有的流水、日志和备份表需要对应的复合索引。
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-19 17:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0004'
+down_revision = '0003'
+branch_labels = None
+depends_on = None
+
+INDEXES = {
+    "inbound_records": "ix_inbound_records_created_at_id",
+    "outbound_records": "ix_outbound_records_created_at_id",
+    "operation_logs": "ix_operation_logs_created_at_id",
+    "backup_records": "ix_backup_records_created_at_id",
+}
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+    tables = inspector.get_table_names()
+    for table, name in INDEXES.items():
+        if table in tables and name not in {index["name"] for index in inspector.get_indexes(table)}:
+            op.create_index(name, table, ["created_at", "id"])
+
+
+def downgrade():
+    for table, name in INDEXES.items():
+        op.drop_index(name, table_name=table)
@@ -0,0 +1,383 @@
+"""
+本地 AMQP 0-9-1 代理替身（仅用于测试与基准测试）
+
+用法：
+    python scripts/amqp_stub_broker.py --port 5673
+
+实现消息收发所需的最小子集：连接握手、通道、默认交换机路由、队列声明（含服务端命名队列）、
+发布确认、Basic.Qos/Consume/Get/Ack/Nack/Reject/Cancel。
+消息只保存在内存中，不支持交换机绑定、事务与持久化。
+发布确认在处理完一次读取的全部帧后以 multiple=True 批量返回，与 RabbitMQ 的行为类似。
+"""
+import argparse
+import asyncio
+import itertools
+import threading
+from collections import deque
+from typing import Dict, Optional
+
+from pika import frame, spec
+
+class _Queue:
+    def __init__(self, name: str, owner=None):
+        self.name = name
+        self.owner = owner  # 排他队列所属连接
+        self.messages = deque()
+        self.consumers = deque()
+
+class _Consumer:
+    def __init__(self, connection, channel, tag: str, queue: _Queue, no_ack: bool):
+        self.connection = connection
+        self.channel = channel
+        self.tag = tag
+        self.queue = queue
+        self.no_ack = no_ack
+
+class _Channel:
+    def __init__(self, number: int):
+        self.number = number
+        self.confirm = False
+        self.publish_seq = 0
+        self.confirmed_upto = 0
+        self.prefetch = 0
+        self.delivery_seq = 0
+        self.unacked = {}  # delivery_tag -> (queue, message)
+        self.pending_publish = None
+        self.pending_header = None
+        self.pending_body = []
+        self.pending_size = 0
+
+    def can_deliver(self) -> bool:
+        return not self.prefetch or len(self.unacked) < self.prefetch
+
+class StubBroker:
+    """在后台线程中运行的内存代理，start() 返回监听端口"""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, confirm_delay: float = 0.0):
+        self.host = host
+        self.port = port
+        # 每批发布确认延迟返回的秒数，用于模拟变慢的代理
+        self.confirm_delay = confirm_delay
+        self.queues: Dict[str, _Queue] = {}
+        self.published = 0
+        self.connections = set()
+        self._names = itertools.count(1)
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._server = None
+        self._thread = None
+
+    def start(self) -> int:
+        ready = threading.Event()
+        self._thread = threading.Thread(target=self._run, args=(ready,), daemon=True)
+        self._thread.start()
+        ready.wait()
+        return self.port
+
+    def _run(self, ready: threading.Event):
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        self._server = self._loop.run_until_complete(
+            asyncio.start_server(self._handle, self.host, self.port)
+        )
+        self.port = self._server.sockets[0].getsockname()[1]
+        ready.set()
+        self._loop.run_forever()
+
+    def stop(self):
+        if self._loop is None:
+            return
+
+        async def shutdown():
+            self._server.close()
+            for connection in list(self.connections):
+                connection.writer.close()
+
+        asyncio.run_coroutine_threadsafe(shutdown(), self._loop).result(5)
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(5)
+
+    def drop_connections(self):
+        """强制断开所有客户端连接，用于测试重连"""
+        def close_all():
+            for connection in list(self.connections):
+                connection.writer.transport.abort()
+        self._loop.call_soon_threadsafe(close_all)
+
+    def queue_size(self, name: str) -> int:
+        queue = self.queues.get(name)
+        return len(queue.messages) if queue else 0
+
+    def new_name(self, prefix: str) -> str:
+        return f"{prefix}{next(self._names)}"
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        connection = _Connection(self, writer)
+        self.connections.add(connection)
+        buffer = b""
+        try:
+            while True:
+                data = await reader.read(65536)
+                if not data:
+                    break
+                buffer += data
+                while buffer:
+                    consumed, received = frame.decode_frame(buffer)
+                    if not consumed:
+                        break
+                    buffer = buffer[consumed:]
+                    connection.on_frame(received)
+                await connection.flush_confirms()
+                if connection.closed:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            connection.release()
+            self.connections.discard(connection)
+            writer.close()
+
+    def route(self, routing_key: str, message) -> bool:
+        queue = self.queues.get(routing_key)
+        if queue is None:
+            return False
+        self.published += 1
+        queue.messages.append(message)
+        self.dispatch(queue)
+        return True
+
+    def dispatch(self, queue: _Queue):
+        """把队列中的消息轮流投递给有预取余量的消费者"""
+        idle = 0
+        while queue.messages and queue.consumers and idle < len(queue.consumers):
+            consumer = queue.consumers[0]
+            queue.consumers.rotate(-1)
+            if not consumer.channel.can_deliver():
+                idle += 1
+                continue
+            idle = 0
+            consumer.connection.deliver(consumer, queue.messages.popleft())
+
+class _Message:
+    __slots__ = ("routing_key", "properties", "body", "redelivered")
+
+    def __init__(self, routing_key: str, properties, body: bytes):
+        self.routing_key = routing_key
+        self.properties = properties
+        self.body = body
+        self.redelivered = False
+
+class _Connection:
+    def __init__(self, broker: StubBroker, writer: asyncio.StreamWriter):
+        self.broker = broker
+        self.writer = writer
+        self.channels: Dict[int, _Channel] = {}
+        self.consumers: Dict[str, _Consumer] = {}
+        self.closed = False
+        self._tags = itertools.count(1)
+
+    def send(self, channel: int, method):
+        self.writer.write(frame.Method(channel, method).marshal())
+
+    def on_frame(self, received):
+        if isinstance(received, frame.ProtocolHeader):
+            self.send(0, spec.Connection.Start(server_properties={
+                "product": "stub-broker",
+                "capabilities": {
+                    "publisher_confirms": True,
+                    "basic.nack": True,
+                    "consumer_cancel_notify": True,
+                },
+            }))
+        elif isinstance(received, frame.Method):
+            self.on_method(received.channel_number, received.method)
+        elif isinstance(received, frame.Header):
+            channel = self.channels[received.channel_number]
+            channel.pending_header = received
+            channel.pending_size = received.body_size
+            if received.body_size == 0:
+                self.complete_publish(channel)
+        elif isinstance(received, frame.Body):
+            channel = self.channels[received.channel_number]
+            channel.pending_body.append(received.fragment)
+            channel.pending_size -= len(received.fragment)
+            if channel.pending_size <= 0:
+                self.complete_publish(channel)
+
+    def on_method(self, number: int, method):
+        if isinstance(method, spec.Connection.StartOk):
+            self.send(0, spec.Connection.Tune(channel_max=2047, frame_max=131072, heartbeat=0))
+        elif isinstance(method, spec.Connection.Open):
+            self.send(0, spec.Connection.OpenOk())
+        elif isinstance(method, spec.Connection.Close):
+            self.send(0, spec.Connection.CloseOk())
+            self.closed = True
+        elif isinstance(method, spec.Channel.Open):
+            self.channels[number] = _Channel(number)
+            self.send(number, spec.Channel.OpenOk())
+        elif isinstance(method, spec.Channel.Close):
+            self.close_channel(number)
+            self.send(number, spec.Channel.CloseOk())
+        elif isinstance(method, spec.Confirm.Select):
+            self.channels[number].confirm = True
+            if not method.nowait:
+                self.send(number, spec.Confirm.SelectOk())
+        elif isinstance(method, spec.Queue.Declare):
+            name = method.queue or self.broker.new_name("amq.gen-")
+            queue = self.broker.queues.get(name)
+            if queue is None:
+                queue = self.broker.queues[name] = _Queue(name, self if method.exclusive else None)
+            if not method.nowait:
+                self.send(number, spec.Queue.DeclareOk(name, len(queue.messages), len(queue.consumers)))
+        elif isinstance(method, spec.Basic.Qos):
+            self.channels[number].prefetch = method.prefetch_count
+            self.send(number, spec.Basic.QosOk())
+        elif isinstance(method, spec.Basic.Consume):
+            tag = method.consumer_tag or f"ctag-{next(self._tags)}"
+            queue = self.broker.queues[method.queue]
+            consumer = _Consumer(self, self.channels[number], tag, queue, method.no_ack)
+            self.consumers[tag] = consumer
+            queue.consumers.append(consumer)
+            if not method.nowait:
+                self.send(number, spec.Basic.ConsumeOk(tag))
+            self.broker.dispatch(queue)
+        elif isinstance(method, spec.Basic.Cancel):
+            consumer = self.consumers.pop(method.consumer_tag, None)
+            if consumer is not None:
+                consumer.queue.consumers.remove(consumer)
+            if not method.nowait:
+                self.send(number, spec.Basic.CancelOk(method.consumer_tag))
+        elif isinstance(method, spec.Basic.Get):
+            self.basic_get(number, method)
+        elif isinstance(method, spec.Basic.Publish):
+            self.channels[number].pending_publish = method
+        elif isinstance(method, spec.Basic.Ack):
+            self.settle(number, method.delivery_tag, method.multiple, requeue=None)
+        elif isinstance(method, spec.Basic.Nack):
+            self.settle(number, method.delivery_tag, method.multiple, requeue=method.requeue)
+        elif isinstance(method, spec.Basic.Reject):
+            self.settle(number, method.delivery_tag, False, requeue=method.requeue)
+
+    def complete_publish(self, channel: _Channel):
+        method = channel.pending_publish
+        message = _Message(method.routing_key, channel.pending_header.properties, b"".join(channel.pending_body))
+        channel.pending_publish = channel.pending_header = None
+        channel.pending_body = []
+        if channel.confirm:
+            channel.publish_seq += 1
+        self.broker.route(method.routing_key, message)
+
+    async def flush_confirms(self):
+        """每轮读取结束后对所有确认模式通道批量确认"""
+        pending = [
+            channel for channel in self.channels.values()
+            if channel.confirm and channel.publish_seq > channel.confirmed_upto
+        ]
+        if not pending:
+            await self.writer.drain()
+            return
+        if self.broker.confirm_delay:
+            await self.writer.drain()
+            await asyncio.sleep(self.broker.confirm_delay)
+        for channel in pending:
+            self.send(channel.number, spec.Basic.Ack(delivery_tag=channel.publish_seq, multiple=True))
+            channel.confirmed_upto = channel.publish_seq
+        await self.writer.drain()
+
+    def deliver(self, consumer: _Consumer, message: _Message):
+        channel = consumer.channel
+        channel.delivery_seq += 1
+        tag = channel.delivery_seq
+        if not consumer.no_ack:
+            channel.unacked[tag] = (consumer.queue, message)
+        self.send(channel.number, spec.Basic.Deliver(
+            consumer_tag=consumer.tag,
+            delivery_tag=tag,
+            redelivered=message.redelivered,
+            exchange="",
+            routing_key=message.routing_key
+        ))
+        self.write_content(channel.number, message)
+
+    def basic_get(self, number: int, method):
+        queue = self.broker.queues.get(method.queue)
+        if queue is None or not queue.messages:
+            self.send(number, spec.Basic.GetEmpty())
+            return
+        channel = self.channels[number]
+        message = queue.messages.popleft()
+        channel.delivery_seq += 1
+        if not method.no_ack:
+            channel.unacked[channel.delivery_seq] = (queue, message)
+        self.send(number, spec.Basic.GetOk(
+            delivery_tag=channel.delivery_seq,
+            redelivered=message.redelivered,
+            exchange="",
+            routing_key=message.routing_key,
+            message_count=len(queue.messages)
+        ))
+        self.write_content(number, message)
+
+    def write_content(self, number: int, message: _Message):
+        self.writer.write(frame.Header(number, len(message.body), message.properties).marshal())
+        for start in range(0, len(message.body), 131064):
+            self.writer.write(frame.Body(number, message.body[start:start + 131064]).marshal())
+
+    def settle(self, number: int, delivery_tag: int, multiple: bool, requeue: Optional[bool]):
+        channel = self.channels[number]
+        if multiple:
+            tags = [tag for tag in channel.unacked if tag <= delivery_tag or delivery_tag == 0]
+        else:
+            tags = [delivery_tag]
+        queues = set()
+        for tag in tags:
+            entry = channel.unacked.pop(tag, None)
+            if entry is None:
+                continue
+            queue, message = entry
+            if requeue:
+                message.redelivered = True
+                queue.messages.appendleft(message)
+            queues.add(queue)
+        # 释放预取余量后继续投递
+        for queue in queues or {consumer.queue for consumer in self.consumers.values()}:
+            self.broker.dispatch(queue)
+
+    def close_channel(self, number: int):
+        channel = self.channels.pop(number, None)
+        if channel is None:
+            return
+        for tag, consumer in list(self.consumers.items()):
+            if consumer.channel is channel:
+                consumer.queue.consumers.remove(consumer)
+                del self.consumers[tag]
+        # 未确认的消息重新入队
+        for queue, message in reversed(list(channel.unacked.values())):
+            message.redelivered = True
+            queue.messages.appendleft(message)
+        for queue, _ in channel.unacked.values():
+            self.broker.dispatch(queue)
+        channel.unacked.clear()
+
+    def release(self):
+        for number in list(self.channels):
+            self.close_channel(number)
+        for name, queue in list(self.broker.queues.items()):
+            if queue.owner is self:
+                del self.broker.queues[name]
+
+def main():
+    parser = argparse.ArgumentParser(description="In-memory AMQP 0-9-1 stand-in broker")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5673)
+    args = parser.parse_args()
+
+    broker = StubBroker(args.host, args.port)
+    broker.start()
+    print(f"stub broker listening on {args.host}:{broker.port}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        broker.stop()
+
+if __name__ == "__main__":
+    main()
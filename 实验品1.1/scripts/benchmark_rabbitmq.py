@@ -0,0 +1,74 @@
+"""
+RabbitMQ 发布吞吐基准测试：每条消息新建连接（原 async_task）与共享发布者对比
+
+用法：
+    PYTHONPATH=. python scripts/benchmark_rabbitmq.py --messages 20000 --threads 8
+
+默认在进程内启动 AMQP 代理替身（scripts/amqp_stub_broker.py），只衡量客户端开销；
+指定 --host/--port 可改为连接真实的 RabbitMQ。
+原方案每条消息建立 TCP 连接、打开通道并声明三个队列，只发送 --legacy-messages 条。
+"""
+import argparse
+import threading
+import time
+
+from app.queue.rabbitmq import RabbitMQ, RabbitMQPublisher
+from amqp_stub_broker import StubBroker
+
+QUEUE = "audit_logs"
+
+def legacy(host: str, port: int, messages: int) -> float:
+    start = time.perf_counter()
+    for i in range(messages):
+        RabbitMQ(host, port).publish(QUEUE, {"seq": i})
+    return time.perf_counter() - start
+
+def pooled(host: str, port: int, messages: int, threads: int, channels: int) -> float:
+    publisher = RabbitMQPublisher(host, port, channel_pool_size=channels)
+    publisher.publish(QUEUE, {"seq": -1})
+    publisher.flush(10)
+
+    def worker(count: int):
+        for i in range(count):
+            publisher.publish(QUEUE, {"seq": i})
+
+    workers = [threading.Thread(target=worker, args=(messages // threads,)) for _ in range(threads)]
+    start = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    confirmed = publisher.flush(60)
+    elapsed = time.perf_counter() - start
+    publisher.close()
+    if not confirmed:
+        raise RuntimeError(f"{publisher.pending} messages left unconfirmed")
+    return elapsed
+
+def main():
+    parser = argparse.ArgumentParser(description="RabbitMQ publish throughput benchmark")
+    parser.add_argument("--host", default=None)
+    parser.add_argument("--port", type=int, default=5672)
+    parser.add_argument("--messages", type=int, default=20000)
+    parser.add_argument("--legacy-messages", type=int, default=200)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--channels", type=int, default=4)
+    args = parser.parse_args()
+
+    broker = None
+    host, port = args.host, args.port
+    if host is None:
+        broker = StubBroker()
+        host, port = "127.0.0.1", broker.start()
+
+    elapsed = legacy(host, port, args.legacy_messages)
+    print(f"{'per-message connection':>24}: {args.legacy_messages / elapsed:9.0f} msg/s")
+    messages = args.messages // args.threads * args.threads
+    elapsed = pooled(host, port, messages, args.threads, args.channels)
+    print(f"{'shared publisher':>24}: {messages / elapsed:9.0f} msg/s (confirmed)")
+
+    if broker is not None:
+        broker.stop()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""
+限流器单请求开销基准测试：旧实现（GET + INCR/EXPIRE 流水线、逐请求重建时间戳列表）与令牌桶脚本对比
+
+用法：
+    PYTHONPATH=. python scripts/benchmark_rate_limit.py --redis-url redis://localhost:6379/1 --requests 20000 --clients 100
+
+--clients 控制参与测试的客户端IP数量；热点场景（少量IP高频请求）可体现本地预准入的效果。
+"""
+import argparse
+import random
+import time
+from collections import defaultdict
+
+import redis
+
+from app.rate_limit import RateLimiter
+
+def legacy_redis_limiter(client, limit: int):
+    """旧实现：先 GET 判断，再用流水线 INCR/EXPIRE，两次往返且非原子"""
+    def allow(ip: str) -> bool:
+        key = f"bench_legacy:{ip}"
+        if int(client.get(key) or 0) >= limit:
+            return False
+        pipe = client.pipeline()
+        pipe.incr(key)
+        pipe.expire(key, 60)
+        pipe.execute()
+        return True
+    return allow
+
+def legacy_memory_limiter(limit: int):
+    """旧实现：每次请求重建该IP一分钟内的时间戳列表"""
+    request_counts = defaultdict(list)
+
+    def allow(ip: str) -> bool:
+        current_time = time.time()
+        request_counts[ip] = [t for t in request_counts[ip] if current_time - t < 60]
+        request_counts[ip].append(current_time)
+        return len(request_counts[ip]) <= limit
+    return allow
+
+def run(name: str, allow, ips: list, requests: int):
+    allowed = 0
+    start = time.perf_counter()
+    for _ in range(requests):
+        result = allow(random.choice(ips))
+        if result is True or (isinstance(result, tuple) and result[0]):
+            allowed += 1
+    elapsed = time.perf_counter() - start
+    print(
+        f"{name:>24}: {elapsed / requests * 1e6:8.1f} us/request  "
+        f"{requests / elapsed:9.0f} req/s  allowed={allowed}"
+    )
+
+def main():
+    parser = argparse.ArgumentParser(description="Rate limiter overhead benchmark")
+    parser.add_argument("--redis-url", default="redis://localhost:6379/1")
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--clients", type=int, default=100)
+    parser.add_argument("--per-minute", type=int, default=6000)
+    parser.add_argument("--burst", type=int, default=100)
+    args = parser.parse_args()
+
+    ips = [f"10.0.{i // 256}.{i % 256}" for i in range(args.clients)]
+    client = redis.from_url(args.redis_url)
+    client.flushdb()
+
+    run("legacy memory", legacy_memory_limiter(args.per_minute), ips, args.requests)
+    run("token bucket (local)", RateLimiter(args.per_minute, args.burst).allow, ips, args.requests)
+    run("legacy redis", legacy_redis_limiter(client, args.per_minute), ips, args.requests)
+    run(
+        "token bucket (redis)",
+        RateLimiter(args.per_minute, args.burst, redis_client=client, prefix="bench_bucket", max_lease=1).allow,
+        ips, args.requests
+    )
+    run(
+        "token bucket (leased)",
+        RateLimiter(args.per_minute, args.burst, redis_client=client, prefix="bench_leased").allow,
+        ips, args.requests
+    )
+
+if __name__ == "__main__":
+    main()
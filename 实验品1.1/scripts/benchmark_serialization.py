@@ -0,0 +1,85 @@
+"""
+大列表响应序列化基准测试：response_model 校验 + jsonable_encoder 与 orjson 快速路径对比
+
+用法：
+    PYTHONPATH=. python scripts/benchmark_serialization.py --rows 1000 --rounds 20
+
+经 TestClient 请求 --rows 条商品，分别测量：
+- 原路径：同样的查询参数请求一个按旧写法实现的端点，返回 ORM 对象，由 FastAPI
+  按 response_model 逐条校验后经 jsonable_encoder 与 json 编码；
+- 快速路径：请求生产中的 GET /products/（只查询 schema 需要的列，orjson 一次编码）。
+商品不足时自动补充测试数据。
+"""
+import argparse
+import statistics
+import time
+from datetime import datetime
+from typing import List
+
+from fastapi import Depends
+from fastapi.testclient import TestClient
+from sqlalchemy.orm import Session
+
+from app import models, schemas
+from app.database import SessionLocal
+from app.main import app, get_db
+
+LEGACY_PATH = "/benchmark/legacy-products/"
+
+@app.get(LEGACY_PATH, response_model=List[schemas.Product], include_in_schema=False)
+def legacy_products(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
+    return db.query(models.Product).order_by(models.Product.id).offset(skip).limit(limit).all()
+
+def ensure_products(db, rows: int):
+    models.Base.metadata.create_all(bind=db.get_bind())
+    missing = rows - db.query(models.Product).count()
+    suffix = datetime.now().strftime('%Y%m%d%H%M%S')
+    db.add_all([
+        models.Product(
+            name=f"Benchmark product {i}",
+            barcode=f"SER{suffix}{i}",
+            category="benchmark",
+            unit="piece",
+            price=1.5,
+            min_stock=10
+        )
+        for i in range(max(missing, 0))
+    ])
+    db.commit()
+
+def fetch(client: TestClient, path: str, rows: int) -> bytes:
+    response = client.get(path, params={"limit": rows})
+    response.raise_for_status()
+    return response.content
+
+def measure(name: str, client: TestClient, path: str, rows: int, rounds: int):
+    timings = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        body = fetch(client, path, rows)
+        timings.append(time.perf_counter() - start)
+    print(
+        f"{name:>12}: median {statistics.median(timings) * 1000:7.2f}ms  "
+        f"min {min(timings) * 1000:7.2f}ms  body {len(body)} bytes"
+    )
+
+def main():
+    parser = argparse.ArgumentParser(description="List response serialization benchmark")
+    parser.add_argument("--rows", type=int, default=1000)
+    parser.add_argument("--rounds", type=int, default=20)
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    ensure_products(db, args.rows)
+    db.close()
+
+    client = TestClient(app)
+    legacy = fetch(client, LEGACY_PATH, args.rows)
+    fast = fetch(client, "/products/", args.rows)
+    print(f"identical output: {legacy == fast}")
+
+    measure("legacy", client, LEGACY_PATH, args.rows, args.rounds)
+    measure("fast path", client, "/products/", args.rows, args.rounds)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""
+服务进程吞吐基准测试：单进程与多 worker 对比
+
+用法：
+    RATE_LIMIT_ENABLED=false PYTHONPATH=. python scripts/benchmark_server.py --workers 1 4 --duration 10
+
+依次以不同 worker 数通过 `python -m app.server` 启动服务（与生产相同的入口和配置），
+用分布在 --clients 个进程中的保持连接客户端请求 --path，输出每秒请求数与延迟分位数。
+服务所需的数据库、Redis 与 JWT_SECRET_KEY 等环境变量须事先准备好；
+压测来自同一 IP，需关闭限流或调高限额，否则大部分请求会返回 429。
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import signal
+import statistics
+import subprocess
+import sys
+import time
+
+async def wait_ready(host: str, port: int, path: str, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            reader, writer = await asyncio.open_connection(host, port)
+            writer.write(f"GET {path} HTTP/1.1\r\nHost: {host}\r\nConnection: close\r\n\r\n".encode())
+            await writer.drain()
+            status_line = await reader.readline()
+            writer.close()
+            if b" 200 " in status_line:
+                return
+        except OSError:
+            pass
+        await asyncio.sleep(0.2)
+    raise RuntimeError(f"server on {host}:{port} did not become ready")
+
+async def client(host: str, port: int, path: str, deadline: float, latencies: list, errors: list):
+    """单个保持连接的客户端：发送请求、读完响应后立即发下一个，连接断开时重连"""
+    request = f"GET {path} HTTP/1.1\r\nHost: {host}\r\n\r\n".encode()
+    while time.monotonic() < deadline:
+        reader, writer = await asyncio.open_connection(host, port)
+        try:
+            while time.monotonic() < deadline:
+                start = time.perf_counter()
+                writer.write(request)
+                status_line = await reader.readline()
+                length = 0
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    if name.lower() == "content-length":
+                        length = int(value)
+                await reader.readexactly(length)
+                if b" 200 " in status_line:
+                    latencies.append(time.perf_counter() - start)
+                else:
+                    errors.append(status_line)
+        except (ConnectionError, asyncio.IncompleteReadError) as e:
+            errors.append(e)
+        finally:
+            writer.close()
+
+async def load(host: str, port: int, path: str, connections: int, duration: float):
+    latencies, errors = [], []
+    deadline = time.monotonic() + duration
+    await asyncio.gather(*[
+        client(host, port, path, deadline, latencies, errors)
+        for _ in range(connections)
+    ])
+    return latencies, len(errors)
+
+def load_process(task):
+    return asyncio.run(load(*task))
+
+def parallel_load(args, duration: float):
+    """客户端分布在多个进程中，避免压测端单核先成为瓶颈"""
+    connections = max(1, args.connections // args.clients)
+    task = (args.host, args.port, args.path, connections, duration)
+    with multiprocessing.Pool(args.clients) as pool:
+        results = pool.map(load_process, [task] * args.clients)
+    latencies = [latency for result, _ in results for latency in result]
+    return latencies, sum(errors for _, errors in results)
+
+def run_once(workers: int, args):
+    env = dict(
+        os.environ,
+        WORKERS=str(workers),
+        HOST=args.host,
+        PORT=str(args.port),
+        MAX_REQUESTS="0",  # 压测期间不重启 worker
+        LOG_LEVEL="warning"
+    )
+    server = subprocess.Popen([sys.executable, "-m", "app.server"], env=env)
+    try:
+        asyncio.run(wait_ready(args.host, args.port, args.path))
+        # 预热，让各 worker 完成首次请求的初始化
+        parallel_load(args, 1.0)
+        latencies, errors = parallel_load(args, args.duration)
+    finally:
+        server.send_signal(signal.SIGTERM)
+        server.wait(timeout=60)
+
+    latencies.sort()
+    p99 = latencies[int(len(latencies) * 0.99)] if latencies else 0.0
+    print(
+        f"workers={workers:>2}: {len(latencies) / args.duration:9.0f} req/s  "
+        f"p50 {statistics.median(latencies) * 1000 if latencies else 0.0:7.2f}ms  "
+        f"p99 {p99 * 1000:7.2f}ms  errors {errors}"
+    )
+
+def main():
+    parser = argparse.ArgumentParser(description="Single-process vs multi-worker throughput benchmark")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, os.cpu_count() or 1])
+    parser.add_argument("--connections", type=int, default=64)
+    parser.add_argument("--clients", type=int, default=2, help="number of load generator processes")
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--path", default="/health")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    args = parser.parse_args()
+
+    for workers in args.workers:
+        run_once(workers, args)
+
+if __name__ == "__main__":
+    main()
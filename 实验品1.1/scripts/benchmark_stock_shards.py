@@ -0,0 +1,189 @@
+"""
+热点商品库存写入基准测试：单行串行扣减 与 分片计数 的锁等待对比
+
+用法：
+    PYTHONPATH=. python scripts/benchmark_stock_shards.py --threads 32 --seconds 10 --shards 16
+
+锁等待时间通过定期采样 pg_stat_activity 中处于 Lock 等待的压测连接估算。
+"""
+import argparse
+import random
+import statistics
+import threading
+import time
+from datetime import datetime, timedelta
+
+from fastapi import HTTPException
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import OperationalError
+
+from app import crud, models, schemas
+from app.database import SessionLocal, SQLALCHEMY_DATABASE_URL
+
+APPLICATION_NAME = "stock-shard-benchmark"
+SAMPLE_INTERVAL = 0.005
+
+def setup_fixtures():
+    """创建基准测试用的商品、仓库、供应商和操作员"""
+    db = SessionLocal()
+    models.Base.metadata.create_all(bind=db.get_bind())
+    suffix = datetime.now().strftime('%Y%m%d%H%M%S%f')
+
+    warehouse = models.Warehouse(name=f"bench-{suffix}", location="benchmark")
+    supplier = models.Supplier(name=f"bench-{suffix}")
+    operator = models.User(
+        username=f"bench-{suffix}",
+        hashed_password="-",
+        email="bench@example.com",
+        role=models.UserRole.WAREHOUSE
+    )
+    product = models.Product(
+        name="Benchmark hot SKU",
+        barcode=f"BENCH{suffix}",
+        category="benchmark",
+        unit="piece",
+        price=1.0
+    )
+    db.add_all([warehouse, supplier, operator, product])
+    db.commit()
+
+    ids = {
+        "product_id": product.id,
+        "warehouse_id": warehouse.id,
+        "supplier_id": supplier.id,
+        "operator_id": operator.id
+    }
+    db.close()
+    return ids
+
+def run_operation(ids: dict):
+    """随机执行一次入库或出库，返回耗时（秒）和结果"""
+    db = SessionLocal()
+    quantity = random.randint(1, 5)
+    start = time.perf_counter()
+    try:
+        if random.random() < 0.5:
+            crud.create_inbound_record(db, schemas.InboundRecordCreate(
+                product_id=ids["product_id"],
+                warehouse_id=ids["warehouse_id"],
+                supplier_id=ids["supplier_id"],
+                quantity=quantity,
+                batch_number="BENCH",
+                production_date=datetime.now(),
+                expiry_date=datetime.now() + timedelta(days=365)
+            ), operator_id=ids["operator_id"])
+        else:
+            crud.create_outbound_record(db, schemas.OutboundRecordCreate(
+                product_id=ids["product_id"],
+                warehouse_id=ids["warehouse_id"],
+                quantity=quantity,
+                reason="benchmark"
+            ))
+        result = "ok"
+    except HTTPException:
+        db.rollback()
+        result = "insufficient"
+    except OperationalError:
+        db.rollback()
+        result = "error"
+    finally:
+        db.close()
+    return time.perf_counter() - start, result
+
+def sample_lock_waits(monitor_engine, stop: threading.Event) -> float:
+    """采样压测连接的锁等待，返回累计等待秒数"""
+    waiting_samples = 0
+    with monitor_engine.connect() as connection:
+        while not stop.is_set():
+            waiting_samples += connection.execute(text(
+                "SELECT count(*) FROM pg_stat_activity "
+                "WHERE application_name = :name AND wait_event_type = 'Lock'"
+            ), {"name": APPLICATION_NAME}).scalar()
+            time.sleep(SAMPLE_INTERVAL)
+    return waiting_samples * SAMPLE_INTERVAL
+
+def run_mode(ids: dict, shards: int, threads: int, seconds: float, monitor_engine) -> dict:
+    """在指定分片数下运行一轮压测"""
+    db = SessionLocal()
+    crud.configure_stock_sharding(db, ids["product_id"], shards)
+    db.close()
+
+    latencies = []
+    results = {"ok": 0, "insufficient": 0, "error": 0}
+    lock = threading.Lock()
+    deadline = time.perf_counter() + seconds
+
+    def worker():
+        while time.perf_counter() < deadline:
+            elapsed, result = run_operation(ids)
+            with lock:
+                latencies.append(elapsed)
+                results[result] += 1
+
+    stop = threading.Event()
+    lock_wait = []
+    sampler = threading.Thread(target=lambda: lock_wait.append(sample_lock_waits(monitor_engine, stop)))
+    sampler.start()
+
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+
+    stop.set()
+    sampler.join()
+
+    latencies.sort()
+    return {
+        "mode": f"sharded({shards})" if shards else "single-row",
+        "ops_per_second": len(latencies) / seconds,
+        "p50_ms": latencies[len(latencies) // 2] * 1000,
+        "p99_ms": latencies[int(len(latencies) * 0.99)] * 1000,
+        "mean_ms": statistics.mean(latencies) * 1000,
+        "lock_wait_ms": lock_wait[0] / len(latencies) * 1000,
+        **results
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Hot-SKU stock write benchmark")
+    parser.add_argument("--threads", type=int, default=32)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--shards", type=int, default=16)
+    parser.add_argument("--initial-stock", type=int, default=100000)
+    args = parser.parse_args()
+
+    # 每个线程一个连接，避免连接池排队干扰锁等待测量
+    SessionLocal.configure(bind=create_engine(
+        SQLALCHEMY_DATABASE_URL,
+        pool_size=args.threads,
+        max_overflow=5,
+        connect_args={"application_name": APPLICATION_NAME}
+    ))
+    # pg_stat_activity 在事务内是快照，监控连接使用自动提交
+    monitor_engine = create_engine(SQLALCHEMY_DATABASE_URL, isolation_level="AUTOCOMMIT")
+
+    ids = setup_fixtures()
+    db = SessionLocal()
+    crud.create_inbound_record(db, schemas.InboundRecordCreate(
+        product_id=ids["product_id"],
+        warehouse_id=ids["warehouse_id"],
+        supplier_id=ids["supplier_id"],
+        quantity=args.initial_stock,
+        batch_number="BENCH-INIT",
+        production_date=datetime.now(),
+        expiry_date=datetime.now() + timedelta(days=365)
+    ), operator_id=ids["operator_id"])
+    db.close()
+
+    for shards in (0, args.shards):
+        report = run_mode(ids, shards, args.threads, args.seconds, monitor_engine)
+        print(
+            f"{report['mode']:>14}: {report['ops_per_second']:8.1f} ops/s  "
+            f"mean {report['mean_ms']:7.2f}ms  p50 {report['p50_ms']:7.2f}ms  "
+            f"p99 {report['p99_ms']:7.2f}ms  lock wait {report['lock_wait_ms']:7.2f}ms/op  "
+            f"(ok={report['ok']} insufficient={report['insufficient']} errors={report['error']})"
+        )
+
+if __name__ == "__main__":
+    main()
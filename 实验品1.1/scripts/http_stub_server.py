@@ -0,0 +1,97 @@
+"""
+本地 HTTP 接收端替身（仅用于测试 Webhook 投递与日志批量发送）
+
+用法：
+    python scripts/http_stub_server.py --port 8099 --status 200 --delay 0.1
+
+支持 HTTP/1.1 保持连接，记录收到的请求和建立过的连接数，便于验证连接复用；
+每个请求的响应状态码、延迟、额外响应头与响应体由 respond(path, body) 决定，
+可在测试中替换；未给出响应体时返回 {"status": 状态码}。
+"""
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, List
+
+# respond(path, body) -> (状态码, 延迟秒数, 额外响应头[, JSON 响应体])
+Responder = Callable[[str, bytes], tuple]
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.connections += 1
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        with self.server.lock:
+            self.server.requests.append((self.path, body))
+        status, delay, headers, *content = self.server.respond(self.path, body)
+        if delay:
+            time.sleep(delay)
+        payload = json.dumps(content[0] if content else {"status": status}).encode()
+        try:
+            self.send_response(status)
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+        except OSError:
+            # 客户端已超时断开
+            pass
+
+    do_PUT = do_POST
+
+    def log_message(self, format, *args):
+        pass
+
+class StubHTTPServer(ThreadingHTTPServer):
+    """在后台线程中运行，start() 返回监听端口"""
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, status: int = 200, delay: float = 0.0):
+        super().__init__((host, port), _Handler)
+        self.lock = threading.Lock()
+        self.connections = 0
+        self.requests: List[tuple] = []
+        self.respond: Responder = lambda path, body: (status, delay, None)
+
+    @property
+    def port(self) -> int:
+        return self.server_address[1]
+
+    def url(self, path: str = "/alerts") -> str:
+        return f"http://{self.server_address[0]}:{self.port}{path}"
+
+    def start(self) -> int:
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self.port
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+def main():
+    parser = argparse.ArgumentParser(description="In-memory webhook receiver stand-in")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8099)
+    parser.add_argument("--status", type=int, default=200)
+    parser.add_argument("--delay", type=float, default=0.0)
+    args = parser.parse_args()
+
+    server = StubHTTPServer(args.host, args.port, args.status, args.delay)
+    print(f"stub webhook receiver listening on {server.url()}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+import asyncio
+import threading
+import time
+import pytest
+from app.alerts.consumer import AlertConsumer
+from app.alerts.webhooks import WEBHOOK_DEAD_LETTER_QUEUE, WebhookDelivery, WebhookDeliveryError
+from app.queue.async_rabbitmq import AsyncRabbitMQ
+from scripts.amqp_stub_broker import StubBroker
+
+@pytest.fixture
+def broker():
+    broker = StubBroker()
+    broker.start()
+    yield broker
+    broker.stop()
+
+def publish(port: int, messages):
+    async def main():
+        client = AsyncRabbitMQ("127.0.0.1", port)
+        await client.start()
+        await client.wait_ready(5)
+        for queue, message in messages:
+            assert await client.publish(queue, message)
+        await client.close()
+    asyncio.run(main())
+
+def run_consumer(consumer: AlertConsumer, until, timeout: float = 5.0):
+    thread = threading.Thread(target=lambda: asyncio.run(consumer.run()))
+    thread.start()
+    deadline = time.monotonic() + timeout
+    while not until() and time.monotonic() < deadline:
+        time.sleep(0.02)
+    consumer.stop()
+    thread.join(timeout)
+
+def test_consumes_all_queues_concurrently(broker, monkeypatch):
+    consumer = AlertConsumer(AsyncRabbitMQ("127.0.0.1", broker.port), prefetch=4, workers=8)
+    stock, system, active, peak = [], [], [], []
+
+    def slow_stock_alert(alert_data):
+        active.append(1)
+        peak.append(len(active))
+        time.sleep(0.05)
+        stock.append(alert_data)
+        active.pop()
+
+    monkeypatch.setitem(consumer.routes, "stock_alerts", slow_stock_alert)
+    monkeypatch.setitem(consumer.routes, "system_events", system.append)
+
+    publish(broker.port, [
+        ("stock_alerts", {"type": "low_stock", "product_id": i, "quantity": 1}) for i in range(8)
+    ] + [
+        ("system_events", {"type": "slow_response", "value": 2.0}) for _ in range(3)
+    ])
+    run_consumer(consumer, lambda: len(stock) == 8 and len(system) == 3)
+
+    assert len(stock) == 8 and len(system) == 3
+    # 处理函数在线程池中并发执行，并受预取数限制
+    assert 1 < max(peak) <= 4
+    assert broker.queue_size("stock_alerts") == broker.queue_size("system_events") == 0
+
+def test_failed_delivery_is_retried_not_lost(broker, monkeypatch):
+    consumer = AlertConsumer(AsyncRabbitMQ("127.0.0.1", broker.port))
+    attempts = []
+
+    async def flaky_deliver(payload):
+        attempts.append(payload)
+        if len(attempts) == 1:
+            raise WebhookDeliveryError("dead letter store unavailable")
+        return True
+
+    monkeypatch.setattr(consumer.webhooks, "deliver", flaky_deliver)
+    publish(broker.port, [("system_events", {"type": "high_error_rate", "value": 0.2})])
+    run_consumer(consumer, lambda: len(attempts) == 2)
+
+    assert len(attempts) == 2
+    assert broker.queue_size("system_events") == 0
+
+def test_undeliverable_webhook_goes_to_dead_letter_queue(broker):
+    # 没有接收端：重试耗尽后写入死信队列，原消息确认
+    webhooks = WebhookDelivery("http://127.0.0.1:1/alerts", max_attempts=2, backoff_base=0.01)
+    consumer = AlertConsumer(AsyncRabbitMQ("127.0.0.1", broker.port), webhooks=webhooks)
+    webhooks.dead_letter = consumer.store_dead_letter
+
+    publish(broker.port, [("system_events", {"type": "slow_response", "value": 3.0})])
+    run_consumer(consumer, lambda: broker.queue_size(WEBHOOK_DEAD_LETTER_QUEUE) == 1)
+
+    assert broker.queue_size(WEBHOOK_DEAD_LETTER_QUEUE) == 1
+    assert broker.queue_size("system_events") == 0
@@ -0,0 +1,61 @@
+import pytest
+from app.alerts.digest import AlertDigest, SMTPPool
+from scripts.smtp_stub_server import StubSMTPServer
+
+@pytest.fixture
+def smtp():
+    server = StubSMTPServer()
+    server.start()
+    yield server
+    server.stop()
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+def test_sweep_is_coalesced_into_one_digest(smtp):
+    digest = AlertDigest(SMTPPool("127.0.0.1", smtp.port), window=60)
+    for product_id in range(1000):
+        digest.add(["ops@example.com"], "low_stock", f"Product {product_id} is running low", product_id, 1)
+    # 同一 (类型, 商品, 仓库) 的重复告警只计数
+    digest.add(["ops@example.com"], "low_stock", "Product 7 is running low", 7, 1)
+    digest.add(["ops@example.com", "buyer@example.com"], "expiry_warning", "Product 3 will expire", 3)
+
+    assert digest.flush() == 2
+    digest.close()
+
+    by_recipient = {recipients[0]: message for _, recipients, message in smtp.messages}
+    ops = by_recipient["ops@example.com"]
+    assert ops["Subject"] == "Warehouse alerts: 1001 low_stock, 1 expiry_warning"
+    body = ops.get_payload()
+    assert body.count("[low_stock]") == 1000
+    assert "Product 7 is running low (warehouse 1) x2" in body
+    assert by_recipient["buyer@example.com"].get_payload().strip() == "- [expiry_warning] Product 3 will expire"
+    # 两封邮件复用同一条 SMTP 连接
+    assert smtp.connections == 1
+
+def test_recipient_rate_limit_defers_to_next_window(smtp):
+    clock = FakeClock()
+    digest = AlertDigest(SMTPPool("127.0.0.1", smtp.port), emails_per_hour=60, burst=1, clock=clock)
+
+    digest.add(["ops@example.com"], "low_stock", "Product 1 is running low", 1)
+    assert digest.flush() == 1
+    digest.add(["ops@example.com"], "low_stock", "Product 2 is running low", 2)
+    assert digest.flush() == 0
+    assert digest.pending == 1
+
+    clock.now += 60
+    digest.add(["ops@example.com"], "low_stock", "Product 2 is running low", 2)
+    assert digest.flush() == 1
+    assert "x2" in smtp.messages[-1][2].get_payload()
+    digest.close()
+
+def test_failed_send_is_kept_for_retry():
+    # 没有 SMTP 服务：发送失败的告警保留到下一个窗口
+    digest = AlertDigest(SMTPPool("127.0.0.1", 1, timeout=0.5))
+    digest.add(["ops@example.com"], "low_stock", "Product 1 is running low", 1)
+    assert digest.flush() == 0
+    assert digest.pending == 1
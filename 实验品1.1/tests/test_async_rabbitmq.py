@@ -0,0 +1,84 @@
+import asyncio
+import pytest
+from app.queue.async_rabbitmq import AsyncRabbitMQ
+from scripts.amqp_stub_broker import StubBroker
+
+@pytest.fixture
+def broker():
+    broker = StubBroker()
+    broker.start()
+    yield broker
+    broker.stop()
+
+def run(client: AsyncRabbitMQ, scenario):
+    async def main():
+        await client.start()
+        assert await client.wait_ready(5)
+        try:
+            return await scenario(client)
+        finally:
+            await client.close()
+    return asyncio.run(main())
+
+def test_publish_consume_and_request_reply(broker):
+    received = []
+
+    async def scenario(client: AsyncRabbitMQ):
+        async def on_alert(message, properties):
+            received.append(message["seq"])
+
+        async def double(message):
+            return {"value": message["value"] * 2}
+
+        await client.consume("stock_alerts", on_alert, prefetch=5)
+        await client.serve("pricing", double)
+        results = await asyncio.gather(*[client.publish("stock_alerts", {"seq": i}) for i in range(100)])
+        replies = await asyncio.gather(*[client.request("pricing", {"value": i}, timeout=2) for i in range(3)])
+        for _ in range(50):
+            if len(received) == 100:
+                break
+            await asyncio.sleep(0.02)
+        return results, replies
+
+    results, replies = run(AsyncRabbitMQ("127.0.0.1", broker.port), scenario)
+    assert all(results)
+    assert sorted(received) == list(range(100))
+    assert replies == [{"value": 0}, {"value": 2}, {"value": 4}]
+
+def test_failed_handler_requeues_once(broker):
+    attempts = []
+
+    async def scenario(client: AsyncRabbitMQ):
+        async def failing(message, properties):
+            attempts.append(properties)
+            raise RuntimeError("smtp down")
+
+        await client.consume("system_events", failing)
+        await client.publish("system_events", {"type": "slow_response"})
+        await asyncio.sleep(0.2)
+
+    run(AsyncRabbitMQ("127.0.0.1", broker.port), scenario)
+    # 首次失败重新入队，重复投递再次失败后丢弃
+    assert len(attempts) == 2
+    assert broker.queue_size("system_events") == 0
+
+def test_unconfirmed_limit_applies_backpressure():
+    broker = StubBroker(confirm_delay=0.05)
+    broker.start()
+    peak = []
+
+    async def scenario(client: AsyncRabbitMQ):
+        async def publish(seq: int):
+            result = await client.publish("audit_logs", {"seq": seq})
+            peak.append(client.unconfirmed)
+            return result
+
+        return await asyncio.gather(*[publish(i) for i in range(40)])
+
+    try:
+        results = run(AsyncRabbitMQ("127.0.0.1", broker.port, max_unconfirmed=4), scenario)
+    finally:
+        broker.stop()
+    assert all(results)
+    assert max(peak) <= 4
+    assert broker.queue_size("audit_logs") == 40
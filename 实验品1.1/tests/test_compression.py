@@ -0,0 +1,64 @@
+import asyncio
+import gzip
+import json
+from starlette.responses import JSONResponse, StreamingResponse
+from app.middleware.compression import CompressionMiddleware, ENCODERS, negotiate_encoding
+
+ROWS = [{"id": i, "name": f"product {i}", "category": "test"} for i in range(500)]
+
+def call(app, accept_encoding: str):
+    """直接以 ASGI 调用，返回 (状态码, 头部字典, 响应体分块)"""
+    scope = {
+        "type": "http",
+        "method": "GET",
+        "path": "/",
+        "headers": [(b"accept-encoding", accept_encoding.encode())]
+    }
+    messages = []
+    requests = [{"type": "http.request", "body": b""}]
+
+    async def receive():
+        # 请求体读完后与真实连接一样挂起，直到响应结束
+        if requests:
+            return requests.pop()
+        await asyncio.Event().wait()
+
+    async def send(message):
+        messages.append(message)
+
+    asyncio.run(app(scope, receive, send))
+    headers = {key.decode(): value.decode() for key, value in messages[0]["headers"]}
+    return messages[0]["status"], headers, [message.get("body", b"") for message in messages[1:]]
+
+def test_negotiation_respects_q_values():
+    assert negotiate_encoding("gzip;q=0.5, identity") == "gzip"
+    assert negotiate_encoding("gzip;q=0, identity") is None
+    assert negotiate_encoding("*") == ENCODERS[0][0]
+    assert negotiate_encoding("") is None
+
+def test_compresses_large_json_only():
+    app = CompressionMiddleware(JSONResponse(ROWS), minimum_size=1024)
+    status, headers, chunks = call(app, "gzip")
+    assert headers["content-encoding"] == "gzip"
+    assert int(headers["content-length"]) == len(chunks[0])
+    assert json.loads(gzip.decompress(chunks[0])) == ROWS
+
+    small = CompressionMiddleware(JSONResponse({"ok": True}), minimum_size=1024)
+    status, headers, chunks = call(small, "gzip")
+    assert "content-encoding" not in headers
+    assert json.loads(chunks[0]) == {"ok": True}
+
+def test_streaming_is_compressed_chunk_by_chunk():
+    lines = [f"{i},product {i},test\n".encode() for i in range(2000)]
+    app = CompressionMiddleware(StreamingResponse(iter(lines), media_type="text/csv"))
+    status, headers, chunks = call(app, "gzip")
+    assert headers["content-encoding"] == "gzip"
+    assert "content-length" not in headers
+    assert len(chunks) > 1
+    assert gzip.decompress(b"".join(chunks)) == b"".join(lines)
+
+def test_skips_compression_when_cpu_budget_exhausted():
+    app = CompressionMiddleware(JSONResponse(ROWS), cpu_budget=1.0)
+    app.budget.charge(5.0)
+    status, headers, chunks = call(app, "gzip")
+    assert "content-encoding" not in headers
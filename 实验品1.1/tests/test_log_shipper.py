@@ -0,0 +1,159 @@
+import json
+import logging
+import os
+import subprocess
+import sys
+import time
+import pytest
+from app.logging import collector as log_collector
+from app.logging.collector import ElasticsearchHandler, LogCollector, LogShipper
+from scripts.http_stub_server import StubHTTPServer
+
+ES_HEADERS = {"X-Elastic-Product": "Elasticsearch"}
+
+def bulk_documents(body: bytes):
+    lines = [json.loads(line) for line in body.splitlines() if line.strip()]
+    return lines[1::2]
+
+def bulk_response(body: bytes, status=lambda document: 201):
+    items = [{"index": {"status": status(document)}} for document in bulk_documents(body)]
+    return {"took": 1, "errors": any(item["index"]["status"] >= 300 for item in items), "items": items}
+
+@pytest.fixture
+def elasticsearch(monkeypatch):
+    server = StubHTTPServer()
+    server.respond = lambda path, body: (200, 0, ES_HEADERS, bulk_response(body))
+    server.start()
+    monkeypatch.setenv("ELASTICSEARCH_URL", f"http://127.0.0.1:{server.port}")
+    yield server
+    server.stop()
+
+def shipped(server):
+    return [document for _, body in server.requests for document in bulk_documents(body)]
+
+def make_logger(handler):
+    logger = logging.getLogger(f"test_log_shipper.{id(handler)}")
+    logger.propagate = False
+    logger.setLevel(logging.INFO)
+    logger.addHandler(handler)
+    return logger
+
+def test_logging_does_not_wait_for_elasticsearch(elasticsearch):
+    # 每个 bulk 请求耗时 0.2s，记录日志本身不受影响
+    elasticsearch.respond = lambda path, body: (200, 0.2, ES_HEADERS, bulk_response(body))
+    handler = ElasticsearchHandler(LogShipper(LogCollector(), batch_size=100, flush_interval=0.05))
+    logger = make_logger(handler)
+
+    start = time.perf_counter()
+    for i in range(1000):
+        logger.info("stock updated %d", i)
+    elapsed = time.perf_counter() - start
+    handler.close()
+
+    assert elapsed < 0.2
+    assert sorted(int(d["message"].split()[-1]) for d in shipped(elasticsearch)) == list(range(1000))
+    assert len(elasticsearch.requests) <= 11
+    assert all(path.endswith("/_bulk") for path, _ in elasticsearch.requests)
+
+def test_partial_batch_is_sent_after_flush_interval(elasticsearch):
+    shipper = LogShipper(LogCollector(), batch_size=100, flush_interval=0.1)
+    shipper.start()
+    shipper.submit({"message": "only one"})
+    time.sleep(0.5)
+    assert [d["message"] for d in shipped(elasticsearch)] == ["only one"]
+    shipper.close()
+
+def test_failed_and_throttled_records_are_retried(elasticsearch):
+    calls = []
+
+    def respond(path, body):
+        calls.append(body)
+        if len(calls) == 1:
+            return 503, 0, ES_HEADERS
+        if len(calls) == 2:
+            # 单条 429 重试，400（映射错误）直接丢弃
+            status = lambda document: {"throttled": 429, "bad": 400}.get(document["message"], 201)
+            return 200, 0, ES_HEADERS, bulk_response(body, status)
+        return 200, 0, ES_HEADERS, bulk_response(body)
+
+    elasticsearch.respond = respond
+    shipper = LogShipper(LogCollector(), flush_interval=0.05, retry_backoff=0.01)
+    shipper.start()
+    for message in ("ok", "throttled", "bad"):
+        shipper.submit({"message": message})
+    assert shipper.flush(5)
+    shipper.close()
+
+    assert [bulk_documents(body) for body in calls][2] == [{"message": "throttled"}]
+    assert len(calls) == 3
+
+def test_full_buffer_drops_without_blocking(elasticsearch):
+    elasticsearch.respond = lambda path, body: (200, 0.5, ES_HEADERS, bulk_response(body))
+    shipper = LogShipper(LogCollector(), batch_size=5, buffer_size=10, flush_interval=0.01)
+    shipper.start()
+    dropped = log_collector.LOG_RECORDS_DROPPED.labels("buffer_full")._value.get()
+
+    start = time.perf_counter()
+    accepted = sum(shipper.submit({"message": str(i)}) for i in range(100))
+    assert time.perf_counter() - start < 0.1
+    assert accepted < 100
+    assert log_collector.LOG_RECORDS_DROPPED.labels("buffer_full")._value.get() - dropped == 100 - accepted
+    shipper.close()
+
+def test_spilled_records_are_replayed_when_elasticsearch_recovers(elasticsearch, tmp_path):
+    elasticsearch.respond = lambda path, body: (503, 0, ES_HEADERS)
+    shipper = LogShipper(
+        LogCollector(), batch_size=10, flush_interval=0.05, overflow="spill",
+        spill_dir=str(tmp_path), max_retries=0
+    )
+    shipper.start()
+    for i in range(25):
+        shipper.submit({"message": str(i)})
+    assert shipper.flush(5)
+    assert sum(len(open(path).readlines()) for path in tmp_path.iterdir()) == 25
+
+    indexed = []
+
+    def recovered(path, body):
+        indexed.extend(bulk_documents(body))
+        return 200, 0, ES_HEADERS, bulk_response(body)
+
+    elasticsearch.respond = recovered
+    deadline = time.monotonic() + 5
+    while os.listdir(tmp_path) and time.monotonic() < deadline:
+        time.sleep(0.05)
+    shipper.close()
+
+    assert os.listdir(tmp_path) == []
+    assert sorted(int(d["message"]) for d in indexed) == list(range(25))
+
+def test_replay_skips_files_other_processes_are_writing(elasticsearch, tmp_path):
+    indexed = []
+
+    def recorded(path, body):
+        indexed.extend(bulk_documents(body))
+        return 200, 0, ES_HEADERS, bulk_response(body)
+
+    elasticsearch.respond = recorded
+    exited = subprocess.Popen([sys.executable, "-c", "pass"])
+    exited.wait()
+    # 存活进程正在写入的文件、已退出进程遗留的文件
+    active = tmp_path / f"{time.time_ns()}-{os.getppid()}-1.ndjson"
+    active.write_text(json.dumps({"message": "active"}) + "\n")
+    orphaned = tmp_path / f"{time.time_ns()}-{exited.pid}-1.ndjson"
+    orphaned.write_text(json.dumps({"message": "orphaned"}) + "\n")
+
+    shipper = LogShipper(
+        LogCollector(), batch_size=10, flush_interval=0.05, overflow="spill",
+        spill_dir=str(tmp_path), max_retries=0
+    )
+    assert shipper._spill_bytes == active.stat().st_size + os.path.getsize(f"{orphaned}.ready")
+    shipper.start()
+    deadline = time.monotonic() + 5
+    while not indexed and time.monotonic() < deadline:
+        time.sleep(0.05)
+    time.sleep(0.2)
+    shipper.close()
+
+    assert [d["message"] for d in indexed] == ["orphaned"]
+    assert os.listdir(tmp_path) == [active.name]
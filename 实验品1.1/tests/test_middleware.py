@@ -0,0 +1,65 @@
+from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
+from fastapi.testclient import TestClient
+from prometheus_client import REGISTRY
+from prometheus_client.openmetrics.exposition import generate_latest
+from app.middleware import RequestPipelineMiddleware
+from app.monitoring.metrics import REQUEST_COUNT, UNMATCHED_ROUTE
+from app.rate_limit import RateLimiter
+
+def make_client(**options):
+    app = FastAPI()
+
+    @app.get("/ping")
+    def ping():
+        return {"ok": True}
+
+    @app.get("/items/{item_id}")
+    def item(item_id: int):
+        return {"id": item_id}
+
+    @app.get("/stream")
+    def stream():
+        return StreamingResponse(iter([b"a", b"b", b"c"]), media_type="text/plain")
+
+    app.add_middleware(RequestPipelineMiddleware, **options)
+    return TestClient(app)
+
+def test_security_headers_and_streaming():
+    client = make_client(security_headers={"X-Frame-Options": "DENY"})
+    before = REQUEST_COUNT.labels(method="GET", endpoint="/stream", status=200)._value.get()
+
+    response = client.get("/stream")
+    assert response.status_code == 200
+    assert response.text == "abc"
+    assert response.headers["x-frame-options"] == "DENY"
+    assert REQUEST_COUNT.labels(method="GET", endpoint="/stream", status=200)._value.get() == before + 1
+
+def test_rate_limit_and_blacklist():
+    client = make_client(rate_limiter=RateLimiter(rate_per_minute=60, burst=2))
+    assert [client.get("/ping").status_code for _ in range(3)] == [200, 200, 429]
+    response = client.get("/ping")
+    assert response.json() == {"detail": "Too many requests"}
+    assert response.headers["retry-after"] == "1"
+
+    client = make_client(ip_blacklist=["testclient"])
+    assert client.get("/ping").status_code == 403
+
+def test_metrics_use_route_template():
+    client = make_client()
+    for item_id in (1, 2, 3):
+        client.get(f"/items/{item_id}", headers={"traceparent": f"00-{item_id:032x}-{1:016x}-01"})
+    client.get("/no/such/path")
+
+    assert REGISTRY.get_sample_value(
+        "http_requests_total", {"method": "GET", "endpoint": "/items/{item_id}", "status": "200"}
+    ) >= 3
+    assert REGISTRY.get_sample_value(
+        "http_requests_total", {"method": "GET", "endpoint": "/items/1", "status": "200"}
+    ) is None
+    assert REGISTRY.get_sample_value(
+        "http_requests_total", {"method": "GET", "endpoint": UNMATCHED_ROUTE, "status": "404"}
+    ) >= 1
+
+    exposition = generate_latest(REGISTRY).decode()
+    assert f'# {{trace_id="{3:032x}"}}' in exposition
@@ -0,0 +1,52 @@
+import time
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import OperationalError
+from app.monitoring.sql import (
+    explain_command,
+    instrument_engine,
+    start_statement_tracking,
+    normalize_statement,
+    fingerprint_statement,
+    redact_parameters,
+)
+
+def test_normalize_statement():
+    statement = "SELECT * FROM products WHERE id IN (%(id_1)s, %(id_2)s) AND name = 'abc' LIMIT 10"
+    assert normalize_statement(statement) == "select * from products where id in (?+) and name = ? limit ?"
+
+def test_fingerprint_ignores_parameters():
+    assert fingerprint_statement(
+        "SELECT * FROM stocks WHERE product_id = %(product_id_1)s"
+    ) == fingerprint_statement(
+        "select *  from stocks where product_id = 42"
+    )
+
+def test_redact_parameters():
+    redacted = redact_parameters({"username": "admin", "limit": 10, "deleted_at": None})
+    assert redacted == {"username": "<str>", "limit": "<int>", "deleted_at": None}
+
+def test_locking_statements_are_not_explain_analyzed():
+    assert explain_command("SELECT * FROM products WHERE id = 1").startswith("EXPLAIN (ANALYZE, BUFFERS) ")
+    for statement in (
+        "SELECT pg_advisory_xact_lock(%(key)s)",
+        "SELECT * FROM outbox_events WHERE sent_at IS NULL LIMIT 10 FOR UPDATE SKIP LOCKED",
+        "SELECT quantity FROM stock_shards WHERE product_id = 1 FOR NO KEY UPDATE",
+        "SELECT stock_shards FROM products WHERE id = 1 FOR SHARE",
+    ):
+        assert explain_command(statement) == f"EXPLAIN {statement}"
+
+def test_failed_statement_does_not_skew_later_timings():
+    engine = create_engine("sqlite://")
+    instrument_engine(engine)
+    with engine.connect() as conn:
+        with pytest.raises(OperationalError):
+            conn.execute(text("SELECT * FROM missing_table"))
+        assert conn.info["query_start_time"] == []
+
+        time.sleep(0.1)
+        stats = start_statement_tracking()
+        conn.execute(text("SELECT 1"))
+        assert stats.count == 1
+        assert stats.duration < 0.1
+        assert conn.info["query_start_time"] == []
@@ -0,0 +1,51 @@
+import threading
+import pytest
+from app.queue.rabbitmq import RabbitMQPublisher
+from scripts.amqp_stub_broker import StubBroker
+
+@pytest.fixture
+def broker():
+    broker = StubBroker()
+    broker.start()
+    yield broker
+    broker.stop()
+
+def test_concurrent_publish_is_confirmed(broker):
+    publisher = RabbitMQPublisher("127.0.0.1", broker.port, channel_pool_size=2, batch_size=50)
+
+    def worker(thread_id: int):
+        for i in range(500):
+            assert publisher.publish("audit_logs", {"thread": thread_id, "seq": i})
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert publisher.flush(10)
+    assert publisher.confirmed == 2000
+    assert broker.queue_size("audit_logs") == 2000
+    assert len(broker.connections) == 1
+    publisher.close()
+
+def test_republishes_after_connection_loss(broker):
+    publisher = RabbitMQPublisher("127.0.0.1", broker.port, reconnect_delay=0.05)
+    for i in range(200):
+        publisher.publish("stock_alerts", {"seq": i})
+    broker.drop_connections()
+    for i in range(200, 400):
+        publisher.publish("stock_alerts", {"seq": i})
+
+    assert publisher.flush(10)
+    # 至少一次：断开前已投递但未确认的消息可能重复
+    assert broker.queue_size("stock_alerts") >= 400
+    publisher.close()
+
+def test_publish_times_out_when_backlog_is_full():
+    # 没有可连接的代理：消息只能积压在本地
+    publisher = RabbitMQPublisher("127.0.0.1", 1, max_pending=2, publish_timeout=0.05)
+    assert publisher.publish("audit_logs", {"seq": 1})
+    assert publisher.publish("audit_logs", {"seq": 2})
+    assert not publisher.publish("audit_logs", {"seq": 3})
+    publisher.close(timeout=0.1)
@@ -0,0 +1,75 @@
+import asyncio
+import threading
+import redis
+from app.rate_limit import RateLimiter
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+class BrokenRedis:
+    """注册脚本成功但每次调用都连接失败的客户端"""
+    def register_script(self, script):
+        def call(keys, args):
+            raise redis.ConnectionError("connection refused")
+        return call
+
+class SlowRedis:
+    """每次调用都阻塞一段时间的客户端，记录脚本在哪个线程执行"""
+    def __init__(self):
+        self.threads = []
+
+    def register_script(self, script):
+        def call(keys, args):
+            self.threads.append(threading.current_thread())
+            threading.Event().wait(0.2)
+            return [args[2], 0]
+        return call
+
+def test_burst_then_refill():
+    clock = FakeClock()
+    limiter = RateLimiter(rate_per_minute=60, burst=3, clock=clock)
+    assert [limiter.allow("ip")[0] for _ in range(4)] == [True, True, True, False]
+
+    allowed, retry_after = limiter.allow("ip")
+    assert not allowed
+    assert 0 < retry_after <= 1
+
+    clock.now += 1
+    assert limiter.allow("ip")[0]
+    assert not limiter.allow("ip")[0]
+
+def test_local_state_is_bounded():
+    limiter = RateLimiter(rate_per_minute=60, burst=1, max_local_keys=2)
+    for key in ("a", "b", "c"):
+        limiter.allow(key)
+    assert list(limiter._states) == ["b", "c"]
+
+def test_falls_back_to_local_bucket_when_redis_fails():
+    clock = FakeClock()
+    limiter = RateLimiter(rate_per_minute=60, burst=2, redis_client=BrokenRedis(), clock=clock)
+    assert [limiter.allow("ip")[0] for _ in range(3)] == [True, True, False]
+
+def test_redis_round_trip_does_not_block_the_event_loop():
+    slow_redis = SlowRedis()
+    limiter = RateLimiter(rate_per_minute=60, burst=2, redis_client=slow_redis)
+    ticks = []
+
+    async def ticker():
+        for _ in range(5):
+            ticks.append(1)
+            await asyncio.sleep(0.01)
+
+    async def main():
+        tick_task = asyncio.create_task(ticker())
+        result = await limiter.allow_async("ip")
+        # Redis 往返期间事件循环照常调度其他协程
+        assert len(ticks) == 5
+        await tick_task
+        return result
+
+    assert asyncio.run(main()) == (True, 0.0)
+    assert slow_redis.threads and threading.main_thread() not in slow_redis.threads
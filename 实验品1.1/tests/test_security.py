@@ -0,0 +1,90 @@
+import asyncio
+import time
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+from app import models, security
+
+def test_ttl_cache_evicts_least_recently_used():
+    cache = security.TTLCache(maxsize=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+    assert cache.get("a") == 1
+    assert cache.get("b") is None
+    assert cache.get("c") == 3
+
+def test_ttl_cache_expires_entries():
+    cache = security.TTLCache(maxsize=10, ttl=0)
+    cache.set("a", 1)
+    assert cache.get("a") is None
+
+def test_role_claims_authorize_without_database(monkeypatch):
+    monkeypatch.setattr(security, "get_user_changed_at", lambda username: 0.0)
+    user = models.User(id=42, username="claims-user", role=models.UserRole.WAREHOUSE)
+    token = security.create_user_access_token(user)
+    security.principal_cache.clear()
+    
+    principal = asyncio.run(security.get_current_user(token))
+    assert principal.id == 42
+    assert principal.role == models.UserRole.WAREHOUSE
+    
+    checker = security.check_permissions("warehouse")
+    assert asyncio.run(checker(principal)) is principal
+
+def test_change_recorded_elsewhere_overrides_claims_and_cache(monkeypatch):
+    changed_at = {"claims-user": 0.0}
+    monkeypatch.setattr(security, "get_user_changed_at", lambda username: changed_at[username])
+    demoted = security.Principal(42, "claims-user", models.UserRole.FINANCE)
+    monkeypatch.setattr(security, "_load_principal", lambda username: demoted)
+    user = models.User(id=42, username="claims-user", role=models.UserRole.WAREHOUSE)
+    token = security.create_user_access_token(user)
+    security.principal_cache.clear()
+    assert asyncio.run(security.get_current_user(token)).role == models.UserRole.WAREHOUSE
+    
+    # 其他进程修改了用户：本进程的缓存和令牌中的角色声明都不再使用
+    changed_at["claims-user"] = time.time() + 1
+    assert asyncio.run(security.get_current_user(token)) is demoted
+
+def test_principals_invalidated_after_outer_commit(monkeypatch):
+    invalidated = []
+    monkeypatch.setattr(security, "invalidate_principals", lambda usernames: invalidated.append(set(usernames)))
+    engine = create_engine("sqlite://")
+    models.User.__table__.create(bind=engine)
+    db = Session(bind=engine)
+    
+    db.begin_nested()
+    db.add(models.User(username="nested-user", email="n@example.com", hashed_password="x", role=models.UserRole.ADMIN))
+    db.commit()
+    assert invalidated == []
+    
+    db.commit()
+    assert invalidated == [{"nested-user"}]
+    db.close()
+
+def test_rehash_on_login_when_cost_changes():
+    old_context = security.CryptContext(schemes=["bcrypt"], bcrypt__rounds=4)
+    hashed = old_context.hash("password123")
+    
+    new_context = security.CryptContext(
+        schemes=["bcrypt"],
+        bcrypt__default_rounds=5,
+        bcrypt__min_rounds=5,
+        bcrypt__max_rounds=5
+    )
+    hasher = security.PasswordHasher(new_context, workers=1, max_pending=4)
+    
+    valid, new_hash = asyncio.run(hasher.verify_and_update("password123", hashed))
+    assert valid
+    assert new_hash.startswith("$2b$05$")
+    
+    valid, new_hash = asyncio.run(hasher.verify_and_update("wrong", hashed))
+    assert not valid
+
+def test_password_hasher_rejects_when_saturated():
+    hasher = security.PasswordHasher(security.pwd_context, workers=1, max_pending=0)
+    with pytest.raises(HTTPException) as exc_info:
+        asyncio.run(hasher.hash("password123"))
+    assert exc_info.value.status_code == 503
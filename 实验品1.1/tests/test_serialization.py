@@ -0,0 +1,43 @@
+import json
+from datetime import datetime
+from decimal import Decimal
+from typing import List
+from fastapi.encoders import jsonable_encoder
+from pydantic import parse_obj_as
+from app import models, schemas
+from app.serialization import dump, list_response
+
+def make_product(product_id: int) -> models.Product:
+    return models.Product(
+        id=product_id,
+        name=f"Product {product_id}",
+        barcode=f"BC{product_id}",
+        category="test",
+        unit="piece",
+        price=9.5,
+        min_stock=3,
+        created_at=datetime(2024, 1, 2, 3, 4, 5, 678900)
+    )
+
+def test_fast_path_matches_response_model():
+    warnings = [
+        {"product": make_product(i), "current_quantity": i, "min_stock": 3, "warehouse": "W1"}
+        for i in range(1, 4)
+    ]
+    expected = jsonable_encoder(parse_obj_as(List[schemas.StockWarning], warnings))
+
+    response = list_response(warnings, schemas.StockWarning, next_cursor="abc")
+    assert json.loads(response.body) == expected
+    assert response.headers["x-next-cursor"] == "abc"
+
+def test_dump_coerces_like_pydantic():
+    row = {
+        "product_id": 1,
+        "product_name": "p",
+        "current_stock": Decimal("12"),
+        "avg_monthly_consumption": 2,
+        "turnover_rate": Decimal("0.5"),
+        "suggested_reorder_point": 4,
+        "suggested_order_quantity": 8
+    }
+    assert dump(row, schemas.InventoryAnalysis) == schemas.InventoryAnalysis(**row).dict()
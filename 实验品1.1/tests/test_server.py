@@ -0,0 +1,48 @@
+import os
+import subprocess
+import sys
+from prometheus_client import REGISTRY
+from app.monitoring.metrics import metrics_registry
+from app.server import ServerSettings, prepare_metrics_dir
+
+def test_worker_count_from_cpus():
+    settings = ServerSettings(WORKERS=0, WORKERS_PER_CORE=2, MAX_WORKERS=8)
+    assert settings.worker_count(cpu_count=1) == 2
+    assert settings.worker_count(cpu_count=16) == 8
+    assert ServerSettings(WORKERS=3).worker_count(cpu_count=16) == 3
+    assert ServerSettings(WORKERS=0, WORKERS_PER_CORE=0.5).worker_count(cpu_count=1) == 1
+
+def test_gunicorn_options_follow_settings():
+    options = ServerSettings(
+        PORT=9000, WORKERS=2, KEEPALIVE_TIMEOUT=75, BACKLOG=512, GRACEFUL_TIMEOUT=20, PRELOAD=False
+    ).gunicorn_options()
+    assert options["bind"] == "0.0.0.0:9000"
+    assert options["workers"] == 2
+    assert options["worker_class"] == "app.server.TunedUvicornWorker"
+    assert options["keepalive"] == 75
+    assert options["backlog"] == 512
+    assert options["graceful_timeout"] == 20
+    assert options["preload_app"] is False
+
+def test_metrics_are_aggregated_across_workers(tmp_path, monkeypatch):
+    stale = tmp_path / "counter_1.db"
+    stale.write_bytes(b"stale")
+    # 先 setenv 让 monkeypatch 记录原值，测试结束后恢复
+    monkeypatch.setenv("PROMETHEUS_MULTIPROC_DIR", "")
+    monkeypatch.delenv("PROMETHEUS_MULTIPROC_DIR")
+    assert prepare_metrics_dir(ServerSettings(METRICS_DIR=str(tmp_path))) == str(tmp_path)
+    assert not stale.exists()
+    assert ServerSettings().gunicorn_options()["child_exit"] is not None
+
+    # 两个 worker 进程各记录一次请求
+    for _ in range(2):
+        subprocess.run([
+            sys.executable, "-c",
+            "from app.monitoring.metrics import REQUEST_COUNT; REQUEST_COUNT.labels('GET', '/products/', '200').inc()"
+        ], check=True, env=dict(os.environ))
+
+    registry = metrics_registry()
+    assert registry is not REGISTRY
+    assert registry.get_sample_value(
+        "http_requests_total", {"method": "GET", "endpoint": "/products/", "status": "200"}
+    ) == 2
@@ -0,0 +1,36 @@
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+# 导入 app.main 的耗时上限（秒），worker 冷启动依赖于此
+IMPORT_TIME_BUDGET = float(os.getenv("IMPORT_TIME_BUDGET", "2.0"))
+
+# 导入期间禁止任何网络连接：建表与 Redis 连接须在 startup 钩子中完成
+IMPORT_SCRIPT = """
+import socket
+import time
+
+def no_network(*args, **kwargs):
+    raise AssertionError("network access while importing app.main")
+
+socket.socket.connect = no_network
+start = time.perf_counter()
+import app.main
+print(time.perf_counter() - start)
+"""
+
+def test_import_is_offline_and_within_budget():
+    env = dict(os.environ)
+    env.setdefault("JWT_SECRET_KEY", "test-secret")
+    result = subprocess.run(
+        [sys.executable, "-c", IMPORT_SCRIPT],
+        cwd=Path(__file__).resolve().parent.parent,
+        env=env,
+        capture_output=True,
+        text=True,
+        timeout=60
+    )
+    assert result.returncode == 0, result.stderr
+    elapsed = float(result.stdout.strip().splitlines()[-1])
+    assert elapsed < IMPORT_TIME_BUDGET, f"importing app.main took {elapsed:.2f}s"
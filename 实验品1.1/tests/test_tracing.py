@@ -0,0 +1,149 @@
+import asyncio
+import json
+import logging
+import time
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from prometheus_client import REGISTRY
+from prometheus_client.openmetrics.exposition import generate_latest
+from sqlalchemy import create_engine, text
+from app.logging.collector import LogCollector
+from app.middleware import RequestPipelineMiddleware
+from app.monitoring import tracing
+from app.monitoring.sql import instrument_engine
+from app.queue.async_rabbitmq import AsyncRabbitMQ
+from scripts.amqp_stub_broker import StubBroker
+from scripts.http_stub_server import StubHTTPServer
+
+class MemoryExporter:
+    def __init__(self):
+        self.traces = []
+
+    def export(self, trace):
+        self.traces.append(trace)
+
+@pytest.fixture
+def exported(monkeypatch):
+    exporter = MemoryExporter()
+    monkeypatch.setattr(tracing, "TRACE_SAMPLE_RATE", 0.0)
+    monkeypatch.setattr(tracing, "TRACE_SLOW_MS", 100.0)
+    monkeypatch.setattr(tracing, "_exporter", exporter)
+    return exporter.traces
+
+def make_client():
+    engine = create_engine("sqlite://")
+    instrument_engine(engine)
+    app = FastAPI()
+
+    @app.get("/orders/{order_id}")
+    def order(order_id: int, delay: float = 0.0):
+        with engine.connect() as connection:
+            connection.execute(text("select 1")).fetchall()
+        with tracing.span("redis GET", "redis"):
+            time.sleep(delay)
+        return {"trace_id": tracing.current_trace_id()}
+
+    @app.get("/boom")
+    def boom():
+        raise RuntimeError("boom")
+
+    app.add_middleware(RequestPipelineMiddleware)
+    return TestClient(app, raise_server_exceptions=False)
+
+def test_head_sampled_request_is_exported_with_spans(exported):
+    client = make_client()
+    trace_id, parent_id = "ab" * 16, "cd" * 8
+    response = client.get("/orders/7", headers={"traceparent": f"00-{trace_id}-{parent_id}-01"})
+
+    assert response.json() == {"trace_id": trace_id}
+    [trace] = exported
+    assert trace.trace_id == trace_id
+    assert trace.root.name == "GET /orders/{order_id}"
+    assert trace.root.parent_id == parent_id
+    assert [(span.kind, span.name) for span in trace.spans] == [("db", "select"), ("redis", "redis GET")]
+    assert all(span.parent_id == trace.root.span_id for span in trace.spans)
+
+    # 导出的追踪作为请求与分类型耗时直方图的样例
+    exposition = generate_latest(REGISTRY).decode()
+    assert f'http_request_span_seconds_bucket{{endpoint="/orders/{{order_id}}",kind="db",le=' in exposition
+    assert f'trace_id="{trace_id}"' in exposition
+
+def test_tail_sampling_keeps_only_slow_and_failed_requests(exported):
+    client = make_client()
+    client.get("/orders/1")
+    assert exported == []
+
+    client.get("/orders/2", params={"delay": 0.15})
+    assert client.get("/boom").status_code == 500
+    slow, failed = exported
+    assert slow.spans[-1].duration >= 0.15
+    assert failed.root.error == "RuntimeError"
+    # 请求之间不泄漏追踪上下文
+    assert tracing.current_trace_id() is None
+
+def test_span_limit_bounds_memory(exported, monkeypatch):
+    monkeypatch.setattr(tracing, "TRACE_MAX_SPANS", 3)
+    trace = tracing.start_trace("job")
+    for _ in range(5):
+        with tracing.span("redis GET", "redis"):
+            pass
+    tracing.finish_trace(trace, error="failed")
+    assert len(exported[0].spans) == 3 and exported[0].dropped_spans == 2
+
+def test_trace_continues_through_rabbitmq(exported):
+    broker = StubBroker()
+    broker.start()
+    seen = []
+
+    async def main():
+        client = AsyncRabbitMQ("127.0.0.1", broker.port)
+        await client.start()
+        await client.wait_ready(5)
+
+        async def handler(message, properties):
+            seen.append(tracing.current_trace_id())
+
+        await client.consume("audit_logs", handler)
+        trace = tracing.start_trace("POST /inbound")
+        await client.publish("audit_logs", {"id": 1})
+        tracing.finish_trace(trace, error="kept")
+        for _ in range(100):
+            if seen:
+                break
+            await asyncio.sleep(0.02)
+        await client.close()
+        return trace
+
+    trace = asyncio.run(main())
+    broker.stop()
+
+    assert seen == [trace.trace_id]
+    assert [span.kind for span in trace.spans] == ["amqp"]
+
+def test_zipkin_exporter_posts_spans():
+    receiver = StubHTTPServer()
+    receiver.start()
+    exporter = tracing.ZipkinExporter(receiver.url("/api/v2/spans"), interval=0.05)
+    trace = tracing.start_trace("GET /products/")
+    tracing.record_span("select", "db", 0.01, fingerprint="abc")
+    tracing.finish_trace(trace)
+    exporter.export(trace)
+
+    deadline = time.monotonic() + 5
+    while not receiver.requests and time.monotonic() < deadline:
+        time.sleep(0.02)
+    receiver.stop()
+
+    root, db = json.loads(receiver.requests[0][1])
+    assert root["traceId"] == db["traceId"] == trace.trace_id
+    assert db["parentId"] == root["id"]
+    assert db["tags"] == {"fingerprint": "abc", "kind": "db"}
+
+def test_log_records_carry_current_trace_id():
+    collector = LogCollector()
+    record = logging.LogRecord("app", logging.INFO, __file__, 1, "inside", None, None)
+    trace = tracing.start_trace("job")
+    assert collector.format_log(record)["trace_id"] == trace.trace_id
+    tracing.finish_trace(trace)
+    assert collector.format_log(record)["trace_id"] is None
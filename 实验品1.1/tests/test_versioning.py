@@ -0,0 +1,69 @@
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from starlette.requests import Request
+from app import models, versioning
+
+def make_request(query: str = "", if_none_match: str = None) -> Request:
+    headers = [(b"if-none-match", if_none_match.encode())] if if_none_match else []
+    return Request({
+        "type": "http",
+        "method": "GET",
+        "path": "/products/",
+        "query_string": query.encode(),
+        "headers": headers
+    })
+
+def test_conditional_get(monkeypatch):
+    monkeypatch.setattr(versioning, "get_version", lambda resource: 7)
+
+    etag, not_modified = versioning.check_not_modified(make_request("limit=10"), versioning.CATALOG)
+    assert not_modified is None
+    assert etag.startswith('"catalog-7-')
+
+    _, not_modified = versioning.check_not_modified(
+        make_request("limit=10", f'"other", W/{etag}'), versioning.CATALOG
+    )
+    assert not_modified.status_code == 304
+    assert not_modified.headers["etag"] == etag
+
+    # 查询参数不同，ETag 不同
+    other_etag, not_modified = versioning.check_not_modified(
+        make_request("limit=20", etag), versioning.CATALOG
+    )
+    assert not_modified is None
+    assert other_etag != etag
+
+def test_no_etag_without_version(monkeypatch):
+    monkeypatch.setattr(versioning, "get_version", lambda resource: None)
+    assert versioning.check_not_modified(make_request(if_none_match="*"), versioning.CATALOG) == (None, None)
+
+def test_savepoint_rollback_keeps_marks_of_the_outer_transaction(monkeypatch):
+    bumped = []
+    monkeypatch.setattr(versioning, "bump_versions", lambda resources: bumped.append(set(resources)))
+    engine = create_engine("sqlite://")
+    models.Product.__table__.create(bind=engine)
+    db = Session(bind=engine)
+    
+    db.begin_nested()
+    db.add(models.Product(name="Synced", barcode="SP001"))
+    db.commit()
+    
+    # 同批中失败的条目回滚自己的保存点
+    db.begin_nested()
+    db.add(models.Product(name="Failed", barcode="SP001"))
+    with pytest.raises(IntegrityError):
+        db.flush()
+    db.rollback()
+    assert bumped == []
+    
+    db.commit()
+    assert bumped == [{versioning.CATALOG}]
+    
+    db.add(models.Product(name="Discarded", barcode="SP002"))
+    db.flush()
+    db.rollback()
+    db.commit()
+    assert bumped == [{versioning.CATALOG}]
+    db.close()
@@ -0,0 +1,103 @@
+import asyncio
+import json
+import time
+import pytest
+from app.alerts.webhooks import CircuitBreaker, WebhookDelivery, WebhookDeliveryError
+from scripts.http_stub_server import StubHTTPServer
+
+@pytest.fixture
+def receiver():
+    server = StubHTTPServer()
+    server.start()
+    yield server
+    server.stop()
+
+def run(delivery: WebhookDelivery, *payloads):
+    async def main():
+        try:
+            return await asyncio.gather(*[delivery.deliver(payload) for payload in payloads])
+        finally:
+            await delivery.close()
+    return asyncio.run(main())
+
+def test_concurrent_deliveries_share_pooled_connections(receiver):
+    receiver.respond = lambda path, body: (200, 0.05, None)
+    delivery = WebhookDelivery(receiver.url(), concurrency=4)
+
+    started = time.monotonic()
+    results = run(delivery, *[{"seq": i} for i in range(40)])
+    elapsed = time.monotonic() - started
+
+    assert all(results)
+    assert sorted(json.loads(body)["seq"] for _, body in receiver.requests) == list(range(40))
+    # 4 个并发：40 个请求约 10 轮，且只建立 4 条连接
+    assert 0.45 < elapsed < 2.0
+    assert receiver.connections <= 4
+
+def test_transient_failures_are_retried_with_backoff(receiver):
+    statuses = iter([503, 429, 200])
+    receiver.respond = lambda path, body: (next(statuses), 0, None)
+    delivery = WebhookDelivery(receiver.url(), backoff_base=0.01, max_attempts=5)
+
+    assert run(delivery, {"title": "slow"}) == [True]
+    assert len(receiver.requests) == 3
+
+def test_slow_receiver_times_out_and_is_dead_lettered(receiver):
+    receiver.respond = lambda path, body: (200, 0.5, None)
+    dead_letters = []
+
+    async def store(record):
+        dead_letters.append(record)
+        return True
+
+    delivery = WebhookDelivery(receiver.url(), dead_letter=store, timeout=0.1, max_attempts=2, backoff_base=0.01)
+    assert run(delivery, {"title": "slow"}) == [False]
+    assert dead_letters[0]["payload"] == {"title": "slow"}
+    assert dead_letters[0]["attempts"] == 2
+    assert "timed out" in dead_letters[0]["error"]
+
+def test_client_errors_are_not_retried(receiver):
+    receiver.respond = lambda path, body: (400, 0, None)
+    delivery = WebhookDelivery(receiver.url(), backoff_base=0.01)
+
+    assert run(delivery, {"title": "bad"}) == [False]
+    assert len(receiver.requests) == 1
+    assert not delivery.breaker(f"http://127.0.0.1:{receiver.port}").is_open
+
+def test_open_circuit_fails_fast(receiver):
+    receiver.respond = lambda path, body: (500, 0, None)
+    delivery = WebhookDelivery(receiver.url(), max_attempts=3, backoff_base=0.01, breaker_threshold=3)
+
+    assert run(delivery, {"seq": 1}, {"seq": 2}, {"seq": 3}) == [False, False, False]
+    # 连续 3 次失败后熔断，剩余投递不再请求接收端
+    assert len(receiver.requests) == 3
+
+def test_unstored_dead_letter_raises(receiver):
+    receiver.respond = lambda path, body: (500, 0, None)
+
+    async def unavailable(record):
+        return False
+
+    delivery = WebhookDelivery(receiver.url(), dead_letter=unavailable, max_attempts=1)
+    with pytest.raises(WebhookDeliveryError):
+        run(delivery, {"title": "lost?"})
+
+def test_circuit_breaker_half_open_probe():
+    now = [0.0]
+    breaker = CircuitBreaker(threshold=2, cooldown=10, clock=lambda: now[0])
+    breaker.record_failure()
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.is_open and not breaker.allow()
+
+    now[0] = 10
+    assert breaker.allow()
+    # 探测请求进行中，其余请求仍被拒绝
+    assert not breaker.allow()
+    breaker.record_failure()
+    assert not breaker.allow()
+
+    now[0] = 20
+    assert breaker.allow()
+    breaker.record_success()
+    assert not breaker.is_open and breaker.allow()